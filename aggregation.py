@@ -0,0 +1,220 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Local
+from config import FILL_GAPS_MAX_BUCKETS
+from enums import Intervals
+from exceptions import PeriodTooLarge
+
+
+Series = List[Tuple[datetime, float]]
+
+
+def to_local(value: datetime, tz: Optional[str]) -> datetime:
+    """Converts a naive UTC datetime, as stored on orders, to naive local time in tz"""
+    if not tz or tz == 'UTC':
+        return value
+    return value.replace(tzinfo=dt_timezone.utc).astimezone(ZoneInfo(tz)).replace(tzinfo=None)
+
+
+def bucket_start(value: datetime, interval: Intervals) -> datetime:
+    """Returns the start of the interval value falls in, weeks start on Monday"""
+    interval = Intervals(interval)
+    if interval == Intervals.DAILY:
+        return datetime(value.year, value.month, value.day)
+    if interval == Intervals.WEEKLY:
+        day = value.date() - timedelta(days=value.weekday())
+        return datetime(day.year, day.month, day.day)
+    if interval == Intervals.MONTHLY:
+        return datetime(value.year, value.month, 1)
+    if interval == Intervals.QUARTERLY:
+        return datetime(value.year, (value.month - 1) // 3 * 3 + 1, 1)
+    return datetime(value.year, 1, 1)
+
+
+def next_bucket(start: datetime, interval: Intervals) -> datetime:
+    """Returns the start of the interval following the one starting at start"""
+    interval = Intervals(interval)
+    if interval == Intervals.DAILY:
+        return start + timedelta(days=1)
+    if interval == Intervals.WEEKLY:
+        return start + timedelta(weeks=1)
+    if interval in (Intervals.MONTHLY, Intervals.QUARTERLY):
+        month = start.month - 1 + (1 if interval == Intervals.MONTHLY else 3)
+        return datetime(start.year + month // 12, month % 12 + 1, 1)
+    return datetime(start.year + 1, 1, 1)
+
+
+def bucket_count(first: datetime, last: datetime, interval: Intervals) -> int:
+    """Returns the number of buckets from the one starting at first to the one starting at last"""
+    interval = Intervals(interval)
+    if interval == Intervals.DAILY:
+        return (last - first).days + 1
+    if interval == Intervals.WEEKLY:
+        return (last - first).days // 7 + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    if interval == Intervals.MONTHLY:
+        return months + 1
+    if interval == Intervals.QUARTERLY:
+        return months // 3 + 1
+    return last.year - first.year + 1
+
+
+def bucket_label(interval: Intervals, start: datetime) -> str:
+    """Returns the key a bucket is reported under"""
+    interval = Intervals(interval)
+    if interval in (Intervals.DAILY, Intervals.WEEKLY):
+        return str(start.date())
+    if interval == Intervals.MONTHLY:
+        return f"{start.year}-{start.month}"
+    if interval == Intervals.QUARTERLY:
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    return str(start.year)
+
+
+def aggregate(
+        pairs: Iterable[Tuple[datetime, float]],
+        interval: Intervals,
+        fill_gaps: bool = False,
+        start: datetime = None,
+        end: datetime = None,
+        tz: str = None,
+) -> Series:
+    """
+    Sums (datetime, value) pairs into interval buckets in a single pass.
+    Pairs can be individual trades or already bucketed rows, e.g. from
+    utils.get_bucketed_pnl, in any order.
+    - tz converts naive UTC datetimes before bucketing
+    - fill_gaps adds zero buckets for intervals without trades, from start
+      (or the first bucket) to end (or the last bucket), at most
+      FILL_GAPS_MAX_BUCKETS of them or PeriodTooLarge is raised
+    Returns (bucket start, total) pairs in chronological order
+    """
+    totals: Dict[datetime, float] = {}
+    for value_at, value in pairs:
+        if value_at is None:
+            continue
+        key = bucket_start(to_local(value_at, tz), interval)
+        totals[key] = totals.get(key, 0) + (value or 0)
+
+    if not fill_gaps:
+        return sorted(totals.items())
+
+    try:
+        first = bucket_start(to_local(start, tz), interval) if start else min(totals, default=None)
+        last = bucket_start(to_local(end, tz), interval) if end else max(totals, default=None)
+    except OverflowError:
+        # start or end at the edge of the datetime range
+        raise PeriodTooLarge(FILL_GAPS_MAX_BUCKETS)
+    if first is None or last is None:
+        return sorted(totals.items())
+    if bucket_count(first, last, interval) > FILL_GAPS_MAX_BUCKETS:
+        raise PeriodTooLarge(FILL_GAPS_MAX_BUCKETS)
+
+    series = []
+    current = first
+    while current <= last:
+        series.append((current, totals.get(current, 0)))
+        if current == last:
+            break
+        current = next_bucket(current, interval)
+    return series
+
+
+def to_dict(series: Series, interval: Intervals) -> Dict[str, float]:
+    """Returns the series keyed by bucket label, in order"""
+    return {bucket_label(interval, start): value for start, value in series}
+
+
+def allocation(values: Iterable[Tuple[str, str, float]], by_order_type: bool = False) -> Dict[str, object]:
+    """
+    Returns the percentage share of each ticker in (ticker, order_type, value) triples,
+    relative to the absolute total so negative values keep their sign.
+    by_order_type maps each ticker to the shares of its order types instead
+    """
+    totals: Dict[Tuple[str, ...], float] = {}
+    for ticker, order_type, value in values:
+        key = (ticker, order_type) if by_order_type else (ticker,)
+        totals[key] = totals.get(key, 0) + (value or 0)
+
+    total = sum(abs(value) for value in totals.values())
+    shares: Dict[str, object] = {}
+    for key, value in totals.items():
+        share = (value / total) * 100 if total else 0.0
+        if by_order_type:
+            shares.setdefault(key[0], {})[key[1]] = share
+        else:
+            shares[key[0]] = share
+    return shares
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Indices of the points kept when downsampling the (x, y) line to points
+    with Largest Triangle Three Buckets, which keeps its peaks and troughs.
+    The first and last points are always kept, x must be ascending
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # points - 2 buckets over the middle points, the last point is the final bucket
+    edges = np.append(np.linspace(1, n - 1, points - 1).astype(np.int64), n)
+
+    # Mean of every bucket, the next bucket's stands in for the point after a candidate
+    sizes = np.diff(edges)
+    average_x = (np.add.reduceat(x, edges[:-1]) / sizes).tolist()
+    average_y = (np.add.reduceat(y, edges[:-1]) / sizes).tolist()
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        px, py = float(x[previous]), float(y[previous])
+        ax, ay = average_x[bucket + 1], average_y[bucket + 1]
+        # Twice the area of the triangle each candidate makes with the kept point and the next bucket's mean
+        areas = np.abs((px - ax) * (y[start:end] - py) - (ay - py) * (px - x[start:end]))
+        previous = start + int(areas.argmax())
+        kept[bucket + 1] = previous
+    return kept
+
+
+def day_matrix(
+        values: Iterable[Tuple[date, str, float]],
+        fill_gaps: bool = False,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Aligns (day, column, value) triples, one per pair, into a day x column matrix
+    with 0 where a column has no value that day. Returns (days, columns, matrix),
+    days ascending and columns sorted. fill_gaps adds every day between start
+    (or the first day) and end (or the last) as a row, at most
+    FILL_GAPS_MAX_BUCKETS of them or PeriodTooLarge is raised
+    """
+    triples = list(values)
+    days = np.array([day for day, _, _ in triples], dtype='datetime64[D]')
+    labels = np.array([column for _, column, _ in triples], dtype=object)
+
+    if fill_gaps and (triples or (start is not None and end is not None)):
+        first = np.datetime64(start, 'D') if start is not None else days.min()
+        last = np.datetime64(end, 'D') if end is not None else days.max()
+        if int((last - first).astype(np.int64)) + 1 > FILL_GAPS_MAX_BUCKETS:
+            raise PeriodTooLarge(FILL_GAPS_MAX_BUCKETS)
+        index = np.arange(first, last + 1)
+        keep = (days >= first) & (days <= last)
+        rows = (days[keep] - first).astype(np.int64)
+    else:
+        index, rows = np.unique(days, return_inverse=True)
+        keep = slice(None)
+
+    columns, cols = np.unique(labels[keep], return_inverse=True)
+    matrix = np.zeros((index.size, columns.size), dtype=np.float64)
+    matrix[rows, cols] = np.fromiter((value or 0 for _, _, value in triples), dtype=np.float64, count=len(triples))[keep]
+    return index, columns.tolist(), matrix
@@ -0,0 +1,241 @@
+import heapq
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Local
+from aggregation import aggregate, allocation, lttb, to_dict, to_local
+from arithemtic import compute_metrics
+from enums import AllocationMode, AnalyticsOutput, Intervals, Metrics
+from models import AnalyticsRequestBody
+
+# SA
+from sqlalchemy import Row
+
+
+# Column of the totals each allocation mode is the share of
+ALLOCATION_VALUES = {
+    AllocationMode.COUNT: 'trade_count',
+    AllocationMode.EXPOSURE: 'volume',
+    AllocationMode.PNL: 'realised_pnl',
+}
+
+_PROFIT_INTERVALS = {
+    AnalyticsOutput.PROFITS_DAILY: Intervals.DAILY,
+    AnalyticsOutput.PROFITS_WEEKLY: Intervals.WEEKLY,
+    AnalyticsOutput.PROFITS_MONTHLY: Intervals.MONTHLY,
+    AnalyticsOutput.PROFITS_QUARTERLY: Intervals.QUARTERLY,
+    AnalyticsOutput.PROFITS_YEARLY: Intervals.YEARLY,
+}
+
+
+def compute_analytics(rows: Iterable[Row], body: AnalyticsRequestBody, balance: float) -> Dict[str, object]:
+    """
+    Computes every output in body.outputs from utils.get_daily_totals rows in one pass,
+    each answered with the content of the matching endpoint.
+    Raises ValueError when the benchmark doesn't have one return per metrics interval
+    """
+    outputs = [AnalyticsOutput(output) for output in dict.fromkeys(body.outputs)]
+    # Open trades count towards the totals without a period, as in utils.get_trade_totals
+    includes_open = body.close_start is None and body.close_end is None
+
+    realised_pnl = volume = 0.0
+    trade_count = win_count = 0
+    daily: Dict[datetime, float] = {}
+    # (ticker, order_type) -> allocation totals, volume is the open exposure
+    groups: Dict[tuple, Dict[str, float]] = {}
+    for row in rows:
+        group = groups.setdefault((row.ticker, row.order_type), {'trade_count': 0, 'realised_pnl': 0.0, 'volume': 0.0})
+        if row.day is None:
+            group['volume'] += row.volume
+            if not includes_open:
+                continue
+        else:
+            day = datetime.combine(row.day, time())
+            daily[day] = daily.get(day, 0) + row.realised_pnl
+        realised_pnl += row.realised_pnl
+        trade_count += row.trade_count
+        win_count += row.win_count
+        volume += row.volume
+        group['trade_count'] += row.trade_count
+        group['realised_pnl'] += row.realised_pnl
+
+    # Days are already in body.timezone, only the period bounds need converting
+    start = to_local(body.close_start, body.timezone) if body.close_start else None
+    end = to_local(body.close_end, body.timezone) if body.close_end else None
+
+    results = {}
+    for output in outputs:
+        if output == AnalyticsOutput.BALANCE:
+            results[output.value] = {'balance': balance}
+        elif output == AnalyticsOutput.PROFITS:
+            results[output.value] = {'realised_pnl': realised_pnl}
+        elif output in _PROFIT_INTERVALS:
+            interval = _PROFIT_INTERVALS[output]
+            series = aggregate(daily.items(), interval, fill_gaps=body.fill_gaps, start=start, end=end)
+            results[output.value] = to_dict(series, interval)
+        elif output == AnalyticsOutput.WINRATE:
+            results[output.value] = {'winrate': (win_count / trade_count) * 100 if trade_count else 0.0}
+        elif output == AnalyticsOutput.VOLUME:
+            results[output.value] = {'total_volume': volume}
+        elif output == AnalyticsOutput.ASSET_ALLOCATION:
+            column = ALLOCATION_VALUES[AllocationMode(body.allocation_mode)]
+            results[output.value] = allocation(
+                ((ticker, order_type, totals[column]) for (ticker, order_type), totals in groups.items()),
+                body.by_order_type,
+            )
+        elif output == AnalyticsOutput.METRICS:
+            returns = [pnl for _, pnl in aggregate(daily.items(), body.interval, fill_gaps=True, start=start, end=end)]
+            if body.benchmark is not None and len(body.benchmark) != len(returns):
+                raise ValueError(f'benchmark has {len(body.benchmark)} returns, the period has {len(returns)} intervals')
+            results[output.value] = compute_metrics(returns, body.metrics or list(Metrics), body.risk_free, body.benchmark)
+
+    return results
+
+
+def equity_curve(
+        times: np.ndarray,
+        pnl: np.ndarray,
+        end_balance: float,
+        points: int,
+        timezone: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Cumulative realised pnl and balance after each chronological (time, pnl)
+    point in one pass, downsampled to points with aggregation.lttb.
+    end_balance is the balance after the last point, earlier balances
+    take away the pnl realised since. timezone converts the kept times
+    """
+    cumulative = np.cumsum(pnl, dtype=np.float64)
+    balance = cumulative + (end_balance - (cumulative[-1] if cumulative.size else 0.0))
+    kept = lttb(times.astype('datetime64[us]').astype(np.int64), cumulative, points)
+    return {
+        'points': int(kept.size),
+        'total_points': int(times.size),
+        'time': [to_local(value, timezone).isoformat() for value in times[kept].astype('datetime64[us]').tolist()],
+        'cumulative_pnl': cumulative[kept].tolist(),
+        'balance': balance[kept].tolist(),
+    }
+
+
+class DrawdownEngine:
+    """
+    Drawdowns of the cumulative realised pnl, fed chronological (time, pnl)
+    points a batch at a time in one pass. Only the running peak, the open
+    drawdown and the top deepest episodes are held, never the points.
+    An episode runs from the peak to the first point back at or above it,
+    the cumulative pnl starts at 0 on the first point's time
+    """
+    def __init__(self, top: int = 5):
+        self.top = top
+        self.points = 0
+        self.equity = 0.0
+        self.peak = 0.0
+        self.peak_time: Optional[datetime] = None
+        self.last_time: Optional[datetime] = None
+        self.episodes = 0
+        self.max_drawdown = 0.0
+        self.max_duration = 0.0
+        self.max_time_to_recovery: Optional[float] = None
+        # (peak, trough, trough time) of the drawdown in progress
+        self._open: Optional[list] = None
+        # Min heap of (depth, episode number, episode) of the top deepest
+        self._deepest: List[Tuple[float, int, dict]] = []
+
+    def feed(self, points: Iterable[Tuple[datetime, float]]) -> None:
+        equity, peak, peak_time, current = self.equity, self.peak, self.peak_time, self._open
+        last_time = self.last_time
+        count = 0
+        for time_, pnl in points:
+            count += 1
+            if peak_time is None:
+                peak_time = time_
+            equity += pnl
+            if equity >= peak:
+                if current is not None:
+                    self._close(peak_time, current, time_)
+                    current = None
+                peak, peak_time = equity, time_
+            elif current is None:
+                current = [peak, equity, time_]
+            elif equity < current[1]:
+                current[1], current[2] = equity, time_
+            last_time = time_
+        self.equity, self.peak, self.peak_time, self._open = equity, peak, peak_time, current
+        self.last_time = last_time
+        self.points += count
+
+    def _close(self, peak_time: datetime, drawdown: list, recovery_time: Optional[datetime]) -> None:
+        peak, trough, trough_time = drawdown
+        depth = peak - trough
+        duration = ((recovery_time or self.last_time) - peak_time).total_seconds()
+        episode = {
+            'peak_time': peak_time,
+            'trough_time': trough_time,
+            'recovery_time': recovery_time,
+            'peak': peak,
+            'depth': depth,
+            'duration': duration,
+            'time_to_recovery': (recovery_time - trough_time).total_seconds() if recovery_time else None,
+        }
+        self.episodes += 1
+        self.max_drawdown = max(self.max_drawdown, depth)
+        self.max_duration = max(self.max_duration, duration)
+        if recovery_time is not None:
+            self.max_time_to_recovery = max(self.max_time_to_recovery or 0.0, episode['time_to_recovery'])
+
+        item = (depth, self.episodes, episode)
+        if len(self._deepest) < self.top:
+            heapq.heappush(self._deepest, item)
+        else:
+            heapq.heappushpop(self._deepest, item)
+
+    def result(self, end_balance: Optional[float] = None, timezone: Optional[str] = None) -> Dict[str, object]:
+        """
+        Summary and the top deepest episodes, deepest first. end_balance, the
+        balance after the last point, adds drawdowns as a % of the peak balance.
+        The drawdown in progress is counted as unrecovered, times are in timezone.
+        Called once, after the last batch
+        """
+        if self._open is not None:
+            current = self.peak - self._open[1]
+            self._close(self.peak_time, self._open, None)
+            self._open = None
+        else:
+            current = 0.0
+
+        start_balance = end_balance - self.equity if end_balance is not None else None
+
+        def pct(peak: float, depth: float) -> Optional[float]:
+            if start_balance is None or start_balance + peak <= 0:
+                return None
+            return depth / (start_balance + peak) * 100
+
+        def local(value: Optional[datetime]) -> Optional[str]:
+            return to_local(value, timezone).isoformat() if value is not None else None
+
+        drawdowns = []
+        for depth, _, episode in sorted(self._deepest, key=lambda item: (-item[0], item[1])):
+            drawdowns.append({
+                'peak_time': local(episode['peak_time']),
+                'trough_time': local(episode['trough_time']),
+                'recovery_time': local(episode['recovery_time']),
+                'depth': depth,
+                'depth_pct': pct(episode['peak'], depth),
+                'duration': episode['duration'],
+                'time_to_recovery': episode['time_to_recovery'],
+            })
+
+        deepest = max(self._deepest, key=lambda item: item[0], default=None)
+        return {
+            'trades': self.points,
+            'realised_pnl': self.equity,
+            'max_drawdown': self.max_drawdown,
+            'max_drawdown_pct': pct(deepest[2]['peak'], deepest[0]) if deepest else None,
+            'max_duration': self.max_duration,
+            'max_time_to_recovery': self.max_time_to_recovery,
+            'current_drawdown': current,
+            'episodes': self.episodes,
+            'drawdowns': drawdowns,
+        }
@@ -1,4 +1,7 @@
 # Local
+import hmac
+from contextlib import asynccontextmanager
+from typing import Optional
 from uuid import uuid4
 
 # SA
@@ -6,16 +9,19 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Local
-from config import ph
+from cache import ANALYTICS_CACHE
+from config import ph, HASHER, REDIS_CLIENT, DB_ENGINE, PRICE_FEED_SOCKET, STATS_TOKEN
 from dependencies import get_session
-from exceptions import DoesNotExist
+from exceptions import DoesNotExist, ServiceOverloaded, InvalidCursor, PeriodTooLarge
 from forms import LoginForm
-from middleware import AuthenticateHeaderMiddleware, RateLimitingMiddleware
+from middleware import AuthenticateHeaderMiddleware, DBSessionMiddleware, RateLimitingMiddleware
 from db_models import Users
+from pricing import PRICE_BOOK, start_fanout, start_feed
 from routers.portfolio import portfolio
+from routers.prices import prices
 
 # FastAPI
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.exceptions import RequestValidationError
@@ -27,8 +33,21 @@ origins = [
 # All authorised endpoints
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    fanout = start_fanout()
+    feed = await start_feed(PRICE_FEED_SOCKET) if PRICE_FEED_SOCKET else None
+    yield
+    if feed is not None:
+        feed.close()
+    fanout.cancel()
+    HASHER.shutdown()
+    await REDIS_CLIENT.aclose()
+    await DB_ENGINE.dispose()
+
+
 # Initialisation
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -38,9 +57,11 @@ app.add_middleware(
 )
 
 app.add_middleware(AuthenticateHeaderMiddleware)
+app.add_middleware(DBSessionMiddleware)
 app.add_middleware(RateLimitingMiddleware)
 
 app.include_router(portfolio)
+app.include_router(prices)
 
 app.mount('/static', StaticFiles(directory='static'), name='static')
 templates = Jinja2Templates(directory='templates')
@@ -56,6 +77,21 @@ async def exception_handler(r: Request, e: Exception):
 async def does_not_exist_handler(request: Request, e: DoesNotExist):
     return JSONResponse(status_code=404, content={"error": e.message})
 
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, e: InvalidCursor):
+    return JSONResponse(status_code=400, content={"error": e.message})
+
+
+@app.exception_handler(PeriodTooLarge)
+async def period_too_large_handler(request: Request, e: PeriodTooLarge):
+    return JSONResponse(status_code=400, content={"error": e.message})
+
+
+@app.exception_handler(ServiceOverloaded)
+async def service_overloaded_handler(request: Request, e: ServiceOverloaded):
+    return JSONResponse(status_code=503, content={"error": e.message}, headers={'Retry-After': '1'})
+
 # 422 Handler
 @app.exception_handler(RequestValidationError)
 async def does_not_exist_handler(request: Request, e: RequestValidationError):
@@ -69,6 +105,22 @@ async def read_root(request: Request):
     )
 
 
+@app.get('/internal/stats')
+async def get_stats(x_stats_token: Optional[str] = Header(None)):
+    """
+    Returns runtime metrics for the internal services, authenticated with the
+    X-Stats-Token header. Disabled while STATS_TOKEN is unset
+    """
+    if not STATS_TOKEN or x_stats_token is None or not hmac.compare_digest(x_stats_token, STATS_TOKEN):
+        return JSONResponse(status_code=401, content={'error': 'Invalid stats token'})
+    return JSONResponse(status_code=200, content={
+        'hasher': HASHER.stats(),
+        'analytics_cache': ANALYTICS_CACHE.stats(),
+        'prices': PRICE_BOOK.stats(),
+        'db_pool': DB_ENGINE.pool.stats() if hasattr(DB_ENGINE.pool, 'stats') else DB_ENGINE.pool.status(),
+    })
+
+
 @app.get('/login')
 async def get_login():
     web_app_login_url = "login"
@@ -1,50 +1,193 @@
 import math
-from typing import List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local
+from enums import Metrics
 
 
 RISK_FREE = 4.0
 
 
+def _ratio(numerator: float, denominator: float) -> float:
+    """Division where an empty or flat denominator gives 0.0"""
+    if not denominator or not np.isfinite(denominator):
+        return 0.0
+    return float(numerator / denominator)
+
+
+def compute_metrics(
+        returns: Sequence[float],
+        metrics: Iterable[Metrics] = tuple(Metrics),
+        risk_free: float = None,
+        benchmark: Sequence[float] = None,
+) -> Dict[str, Optional[float]]:
+    """
+    Computes the requested metrics over a series of period returns in one
+    vectorized pass, intermediates shared by several metrics are computed once.
+    - returns are the realised pnl per period
+    - risk_free is the per period risk free return, also the Sortino target
+    - benchmark is the benchmark return per period aligned with returns, required for Treynor
+    Sharpe, Sortino and Treynor divide the excess return summed over the periods.
+    Ratios with a zero denominator are 0.0, Treynor is None without a benchmark
+    """
+    risk_free = RISK_FREE if risk_free is None else risk_free
+    requested = list(dict.fromkeys(Metrics(m) for m in metrics))
+    metrics = set(requested)
+    r = np.asarray(returns, dtype=np.float64)
+    n = r.size
+    if n == 0:
+        return {m.value: (None if m == Metrics.TREYNOR else 0.0) for m in requested}
+
+    total = r.sum()
+    mean = total / n
+    excess = total - risk_free * n
+    results = {}
+
+    if metrics & {Metrics.STD, Metrics.SHARPE}:
+        std = round(float(np.sqrt(np.mean((r - mean) ** 2))), 3)
+        results[Metrics.STD] = std
+        results[Metrics.SHARPE] = _ratio(excess, std)
+
+    if metrics & {Metrics.DOWNSIDE_STD, Metrics.SORTINO}:
+        shortfall = np.minimum(r - risk_free, 0.0)
+        downside = round(float(np.sqrt(np.mean(shortfall ** 2))), 3)
+        results[Metrics.DOWNSIDE_STD] = downside
+        results[Metrics.SORTINO] = _ratio(excess, downside)
+
+    if metrics & {Metrics.MAX_DRAWDOWN, Metrics.CALMAR}:
+        equity = np.concatenate(([0.0], np.cumsum(r)))
+        max_drawdown = float(np.max(np.maximum.accumulate(equity) - equity))
+        results[Metrics.MAX_DRAWDOWN] = max_drawdown
+        results[Metrics.CALMAR] = _ratio(total, max_drawdown)
+
+    if Metrics.PROFIT_FACTOR in metrics:
+        results[Metrics.PROFIT_FACTOR] = _ratio(r[r > 0].sum(), -r[r < 0].sum())
+
+    if Metrics.EXPECTANCY in metrics:
+        results[Metrics.EXPECTANCY] = float(mean)
+
+    if Metrics.TREYNOR in metrics:
+        results[Metrics.TREYNOR] = None
+        if benchmark is not None:
+            b = np.asarray(benchmark, dtype=np.float64)
+            if b.size != n:
+                raise ValueError('benchmark must have one return per period')
+            variance = np.mean((b - b.mean()) ** 2)
+            beta = _ratio(np.mean((r - mean) * (b - b.mean())), variance)
+            results[Metrics.TREYNOR] = _ratio(excess, beta)
+
+    return {m.value: results[m] for m in requested}
+
+
+def covariance_correlation(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample covariance and Pearson correlation between the columns of a
+    period x series matrix, vectorized over every pair at once.
+    Correlations of a series without variance are nan, both are nan under two periods
+    """
+    n, k = matrix.shape
+    if n < 2:
+        return np.full((k, k), np.nan), np.full((k, k), np.nan)
+
+    centred = matrix - matrix.mean(axis=0)
+    covariance = centred.T @ centred / (n - 1)
+    std = np.sqrt(np.diag(covariance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(std, std)
+    correlation[(std == 0)[:, None] | (std == 0)[None, :]] = np.nan
+    np.fill_diagonal(correlation, np.where(std > 0, 1.0, np.nan))
+    return covariance, np.clip(correlation, -1.0, 1.0)
+
+
+# Metrics rolling_metrics keeps running sums for
+ROLLING_METRICS = (Metrics.STD, Metrics.SHARPE, Metrics.DOWNSIDE_STD, Metrics.SORTINO, Metrics.EXPECTANCY)
+
+
+def rolling_metrics(
+        returns: Sequence[float],
+        window: int,
+        metrics: Iterable[Metrics] = ROLLING_METRICS,
+        risk_free: float = None,
+        min_periods: int = None,
+) -> Dict[str, List[Optional[float]]]:
+    """
+    Each metric over the trailing window of returns at every period, as
+    compute_metrics would give for that window, in a single pass.
+    The mean and sum of squared deviations are updated as returns enter and
+    leave the window (Welford), the downside uses a running sum of squared
+    shortfalls. Periods with fewer than min_periods (default window) returns
+    in the window are None. Only ROLLING_METRICS are supported
+    """
+    risk_free = RISK_FREE if risk_free is None else risk_free
+    requested = list(dict.fromkeys(Metrics(m) for m in metrics))
+    unsupported = [m.value for m in requested if m not in ROLLING_METRICS]
+    if unsupported:
+        raise ValueError(f"{', '.join(unsupported)} can't be computed over a rolling window")
+    min_periods = window if min_periods is None else min_periods
+
+    names = [m.value for m in requested]
+    series = {name: [] for name in names}
+    values = [float(value) for value in returns]
+    n = 0
+    mean = squares = shortfall_squares = 0.0
+    for index, value in enumerate(values):
+        n += 1
+        delta = value - mean
+        mean += delta / n
+        squares += delta * (value - mean)
+        shortfall_squares += min(value - risk_free, 0.0) ** 2
+
+        if index >= window:
+            leaving = values[index - window]
+            n -= 1
+            delta = leaving - mean
+            mean -= delta / n
+            squares -= delta * (leaving - mean)
+            shortfall_squares -= min(leaving - risk_free, 0.0) ** 2
+
+        if n < min_periods:
+            for name in names:
+                series[name].append(None)
+            continue
+
+        # Removals can leave a tiny negative remainder
+        std = round(math.sqrt(max(squares, 0.0) / n), 3)
+        downside = round(math.sqrt(max(shortfall_squares, 0.0) / n), 3)
+        excess = (mean - risk_free) * n
+        # Keyed by value, enum hashing is slow in a per period loop
+        results = {
+            'std': std,
+            'sharpe': excess / std if std else 0.0,
+            'downside_std': downside,
+            'sortino': excess / downside if downside else 0.0,
+            'expectancy': mean,
+        }
+        for name in names:
+            series[name].append(results[name])
+
+    return series
+
+
 def std(returns: List[float]) -> float:
     """Standard Deviation Calculation"""
-    if not returns:
-        return 0.0
-    try:
-        length_of_returns = len(returns)
-        average_return = sum(returns) / length_of_returns
-        individual_deviations = [(r - average_return) ** 2 for r in returns]
-        return round(math.sqrt(sum(individual_deviations) / length_of_returns), 3)
-    except ZeroDivisionError:
-        return 0.0
+    return compute_metrics(returns, [Metrics.STD])[Metrics.STD.value]
 
 
 def sharpe(returns: List[float], risk_free: float = None) -> float:
     """Sharpe Ratio"""
-    risk_free = RISK_FREE if not risk_free else risk_free
-    try:
-        return (sum(returns) - (risk_free * len(returns))) / std(returns)
-    except ZeroDivisionError:
-        return 0.0
+    return compute_metrics(returns, [Metrics.SHARPE], risk_free)[Metrics.SHARPE.value]
 
 
-def downward_std(returns: List[float]) -> float:
-    """Returns downside deviation"""
-    try:
-        length_of_returns = len(returns)
-        average_return = sum(returns) / length_of_returns
-        individual_deviations = [(r - average_return) ** 2 for r in returns]
-        return round(math.sqrt(sum([d for d in individual_deviations if d < 0]) / length_of_returns), 3)
-    except ZeroDivisionError:
-        return 0.0
+def downward_std(returns: List[float], risk_free: float = None) -> float:
+    """Returns downside deviation below the risk free return"""
+    return compute_metrics(returns, [Metrics.DOWNSIDE_STD], risk_free)[Metrics.DOWNSIDE_STD.value]
 
 
 def sortino(returns: List[float], risk_free: float = None) -> float:
     """Returns the Sortino Ratio"""
-    risk_free = RISK_FREE if not risk_free else risk_free
-    try:
-        return (sum(returns) / (risk_free * len(returns))) / downward_std(returns)
-    except ZeroDivisionError:
-        return 0.0
+    return compute_metrics(returns, [Metrics.SORTINO], risk_free)[Metrics.SORTINO.value]
 
 
 if __name__ == "__main__":
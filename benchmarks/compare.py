@@ -0,0 +1,68 @@
+"""
+Compares two benchmarks.load results and flags regressions
+
+    python -m benchmarks.compare BASELINE.json CANDIDATE.json [--threshold 10]
+
+An endpoint regresses when its p95 latency grows, or its throughput drops,
+by more than --threshold percent, or it reports errors the baseline didn't.
+Exits with 1 when anything regressed
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+
+def _change(baseline: Optional[float], candidate: Optional[float]) -> Optional[float]:
+    """Percentage change from baseline to candidate"""
+    if not baseline or candidate is None:
+        return None
+    return (candidate - baseline) / baseline * 100
+
+
+def _format(change: Optional[float]) -> str:
+    return f"{change:+.1f}%" if change is not None else 'n/a'
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> List[str]:
+    """Prints the comparison table and returns the regressed endpoints"""
+    regressions = []
+    print(f"{'endpoint':<20}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>10}{'errors':>12}")
+
+    names = [name for name in candidate['endpoints'] if name in baseline['endpoints']]
+    for name in [*names, 'total']:
+        before = baseline['total'] if name == 'total' else baseline['endpoints'][name]
+        after = candidate['total'] if name == 'total' else candidate['endpoints'][name]
+        changes = {
+            metric: _change(before[metric], after[metric])
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+        }
+        regressed = (
+            (changes['p95_ms'] or 0) > threshold
+            or (changes['throughput_rps'] or 0) < -threshold
+            or (after['errors'] and not before['errors'])
+        )
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<20}{_format(changes['p50_ms']):>10}{_format(changes['p95_ms']):>10}"
+            f"{_format(changes['p99_ms']):>10}{_format(changes['throughput_rps']):>10}"
+            f"{before['errors']:>5} -> {after['errors']:<4}{'  REGRESSED' if regressed else ''}"
+        )
+
+    print(f"peak rss {baseline.get('peak_rss_mb')} MB -> {candidate.get('peak_rss_mb')} MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline', type=Path)
+    parser.add_argument('candidate', type=Path)
+    parser.add_argument('--threshold', type=float, default=10, help='Allowed change in percent')
+    args = parser.parse_args()
+
+    regressions = compare(json.loads(args.baseline.read_text()), json.loads(args.candidate.read_text()), args.threshold)
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
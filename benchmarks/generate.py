@@ -0,0 +1,188 @@
+"""
+Populates the database with synthetic users, orders and watchlists for benchmarks
+
+    python -m benchmarks.generate --users 1000 --orders 1000000 [--reset] [--fast-load]
+
+The target is config.DB_URI, set DATABASE_URL to point it elsewhere:
+- Postgres, run `alembic upgrade head` first so the rollup and triggers exist
+- SQLite stand-in, e.g. DATABASE_URL=sqlite+aiosqlite:///bench.db, pass
+  --create-tables. The analytics endpoints use Postgres functions, run the
+  API with ROLLUP_ENABLED=0 and expect those endpoints to report errors
+
+Users are bench{i}@example.com with api key bench-key-{i}, so benchmarks.load
+can authenticate as any of them. Orders are spread over users with a heavy
+tail, a few users own most of them. The same --seed gives the same data,
+apart from the random order ids
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+# Local
+from config import DB_ENGINE, HASHER
+from db_models import Base, DailyPnlRollup, Orders, Users, Watchlist
+from dependencies import get_session
+from enums import OrderType, Ticker
+from hashing import HashProfile, HashingService
+from rollup import backfill
+from security import api_key_digest
+
+# SA
+from sqlalchemy import delete, insert, text
+
+
+EMAIL_DOMAIN = '@example.com'
+# Cheapest argon2 parameters, only for when authentication cost isn't being measured
+_FAST_PROFILE = HashProfile(time_cost=1, memory_cost=8, parallelism=1)
+
+
+def email_for(index: int) -> str:
+    return f"bench{index}{EMAIL_DOMAIN}"
+
+
+def api_key_for(index: int) -> str:
+    return f"bench-key-{index}"
+
+
+async def _reset() -> None:
+    """Removes every benchmark user and their rows"""
+    async with get_session() as session:
+        await session.execute(delete(Watchlist).where(Watchlist.user_id.like(f"bench%{EMAIL_DOMAIN}")))
+        await session.execute(delete(Orders).where(Orders.user_id.like(f"bench%{EMAIL_DOMAIN}")))
+        await session.execute(delete(DailyPnlRollup).where(DailyPnlRollup.user_id.like(f"bench%{EMAIL_DOMAIN}")))
+        await session.execute(delete(Users).where(Users.email.like(f"bench%{EMAIL_DOMAIN}")))
+        await session.commit()
+
+
+async def _insert_users(count: int, hasher: HashingService, rnd: random.Random) -> None:
+    # Batches stay under the hasher's max_pending
+    hashes = []
+    for offset in range(0, count, hasher.max_pending):
+        batch = range(offset, min(offset + hasher.max_pending, count))
+        hashes += await asyncio.gather(*(hasher.hash(api_key_for(i)) for i in batch))
+    rows = [
+        {
+            'email': email_for(i),
+            # Unusable password, benchmark users only authenticate with their api key
+            'password': '!',
+            'balance': round(rnd.uniform(1_000, 100_000), 2),
+            'created_at': datetime(2024, 1, 1),
+            'is_active': True,
+            'api_key': hashes[i],
+            'api_key_digest': api_key_digest(api_key_for(i)),
+        }
+        for i in range(count)
+    ]
+    async with get_session() as session:
+        await session.execute(insert(Users), rows)
+        await session.execute(insert(Watchlist), [
+            {'user_id': email_for(i), 'ticker': ticker.value}
+            for i in range(count)
+            for ticker in rnd.sample(list(Ticker), rnd.randint(0, len(Ticker)))
+        ])
+        await session.commit()
+
+
+def _orders(owners: List[int], days: int, rnd: random.Random) -> List[dict]:
+    now = datetime.now().replace(microsecond=0)
+    rows = []
+    for owner in owners:
+        created_at = now - timedelta(minutes=rnd.randint(0, days * 24 * 60))
+        is_active = rnd.random() < 0.1
+        order_type = rnd.choice(list(OrderType)).value
+        open_price = rnd.uniform(1, 70_000)
+        dollar_amount = round(rnd.uniform(50, 5_000), 2)
+        close_price = None if is_active else open_price * rnd.gauss(1, 0.03)
+        closed_at = None if is_active else min(created_at + timedelta(minutes=rnd.randint(1, 14 * 24 * 60)), now)
+        change = (close_price if close_price is not None else open_price * rnd.gauss(1, 0.03)) / open_price - 1
+        pnl = dollar_amount * (change if order_type == OrderType.LONG.value else -change)
+        rows.append({
+            'order_id': uuid.uuid4(),
+            'user_id': email_for(owner),
+            'ticker': rnd.choice(list(Ticker)).value,
+            'dollar_amount': dollar_amount,
+            'realised_pnl': 0 if is_active else pnl,
+            'unrealised_pnl': pnl if is_active else 0,
+            'open_price': open_price,
+            'close_price': close_price,
+            'created_at': created_at,
+            'closed_at': closed_at,
+            'is_active': is_active,
+            'order_type': order_type,
+        })
+    return rows
+
+
+async def _insert_orders(users: int, orders: int, days: int, chunk: int, rnd: random.Random) -> None:
+    # Heavy tailed activity, the busiest users hold a large share of the orders
+    weights = [rnd.paretovariate(1.2) for _ in range(users)]
+    owners = rnd.choices(range(users), weights=weights, k=orders)
+
+    started = time.perf_counter()
+    for offset in range(0, orders, chunk):
+        async with get_session() as session:
+            await session.execute(insert(Orders), _orders(owners[offset:offset + chunk], days, rnd))
+            await session.commit()
+        done = min(offset + chunk, orders)
+        print(f"  {done}/{orders} orders, {done / (time.perf_counter() - started):.0f} rows/s", end='\r')
+    print()
+
+
+async def main(args: argparse.Namespace) -> None:
+    rnd = random.Random(args.seed)
+    postgres = DB_ENGINE.dialect.name == 'postgresql'
+
+    if args.create_tables:
+        async with DB_ENGINE.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    if args.reset:
+        await _reset()
+
+    hasher = HashingService(_FAST_PROFILE) if args.fast_hash else HASHER
+    print(f"Inserting {args.users} users")
+    await _insert_users(args.users, hasher, rnd)
+
+    fast_load = args.fast_load and postgres
+    if fast_load:
+        # Skips the per row rollup and version triggers, the rollup is rebuilt after
+        async with DB_ENGINE.begin() as connection:
+            await connection.execute(text('ALTER TABLE dashboard_orders DISABLE TRIGGER USER'))
+
+    print(f"Inserting {args.orders} orders")
+    try:
+        await _insert_orders(args.users, args.orders, args.days, args.chunk, rnd)
+    finally:
+        if fast_load:
+            async with DB_ENGINE.begin() as connection:
+                await connection.execute(text('ALTER TABLE dashboard_orders ENABLE TRIGGER USER'))
+
+    if fast_load:
+        async with get_session() as session:
+            print(f"Rebuilt {await backfill(session)} rollup rows")
+    if postgres:
+        async with DB_ENGINE.begin() as connection:
+            await connection.execute(text('ANALYZE'))
+
+    if hasher is not HASHER:
+        hasher.shutdown()
+    await DB_ENGINE.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=100_000, help='Total orders over every user')
+    parser.add_argument('--days', type=int, default=730, help='Orders are opened within this many days')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=5000, help='Orders inserted per transaction')
+    parser.add_argument('--reset', action='store_true', help='Delete existing benchmark users first')
+    parser.add_argument('--create-tables', action='store_true', help='Create missing tables, for SQLite')
+    parser.add_argument('--fast-hash', action='store_true',
+                        help='Hash api keys with the cheapest argon2 parameters instead of the app\'s')
+    parser.add_argument('--fast-load', action='store_true',
+                        help='Postgres only, load with triggers disabled and rebuild the rollup after')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,257 @@
+"""
+Drives the /portfolio endpoints with concurrent async clients and records
+p50/p95/p99 latency, throughput, status codes and peak RSS
+
+    python -m benchmarks.load --users 1000 --concurrency 32 --duration 30 [--endpoints trades,metrics]
+
+Users are the ones benchmarks.generate created. By default the app runs in
+this process through httpx's ASGI transport against config.DB_URI, so peak
+RSS is the app's, and rate limiting is off unless RATE_LIMIT_RULES is set.
+--base-url targets a running server instead, RSS is then the client's only.
+
+Results are written as JSON to --out (benchmarks/results/<time>.json by
+default), compare two runs with benchmarks.compare
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+import numpy as np
+
+# In process runs aren't rate limited unless RATE_LIMIT_RULES is set. It has
+# to be set before the local imports, config reads it when first imported
+os.environ.setdefault('RATE_LIMIT_RULES', '')
+
+# Local
+from benchmarks.generate import api_key_for
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+class Endpoint(NamedTuple):
+    method: str
+    path: str
+    # (rnd, order ids) -> request body
+    body: Callable[[random.Random, List[str]], Optional[dict]] = lambda rnd, order_ids: None
+
+
+def _period(rnd: random.Random) -> dict:
+    """A window of one of a few lengths ending within the last month"""
+    end = datetime.now() - timedelta(days=rnd.randint(0, 30))
+    return {
+        'close_start': (end - timedelta(days=rnd.choice([7, 30, 90, 365]))).isoformat(),
+        'close_end': end.isoformat(),
+    }
+
+
+ENDPOINTS: Dict[str, Endpoint] = {
+    'balance': Endpoint('GET', '/portfolio/balance'),
+    'trades': Endpoint('POST', '/portfolio/trades', lambda rnd, ids: {'limit': rnd.choice([50, 500])}),
+    'trades_stream': Endpoint('POST', '/portfolio/trades/stream', lambda rnd, ids: {}),
+    'trade': Endpoint('POST', '/portfolio/trade', lambda rnd, ids: {'order_id': rnd.choice(ids)} if ids else None),
+    'asset_allocation': Endpoint('POST', '/portfolio/asset-allocation',
+                                 lambda rnd, ids: {'mode': rnd.choice(['count', 'exposure', 'pnl'])}),
+    'profits': Endpoint('POST', '/portfolio/profits', lambda rnd, ids: _period(rnd)),
+    'profits_daily': Endpoint('POST', '/portfolio/profits/daily', lambda rnd, ids: _period(rnd)),
+    'profits_weekly': Endpoint('POST', '/portfolio/profits/weekly', lambda rnd, ids: _period(rnd)),
+    'profits_monthly': Endpoint('POST', '/portfolio/profits/monthly', lambda rnd, ids: {}),
+    'profits_quarterly': Endpoint('POST', '/portfolio/profits/quarterly', lambda rnd, ids: {}),
+    'profits_yearly': Endpoint('POST', '/portfolio/profits/yearly', lambda rnd, ids: {}),
+    'metrics': Endpoint('POST', '/portfolio/metrics', lambda rnd, ids: {
+        'interval': 'd', 'metrics': ['sharpe', 'sortino', 'max_drawdown'], **_period(rnd)
+    }),
+    'metrics_rolling': Endpoint('POST', '/portfolio/metrics/rolling', lambda rnd, ids: {
+        'interval': 'd', 'window': rnd.choice([7, 30, 90]), 'metrics': ['sharpe', 'std', 'sortino'],
+    }),
+    'analytics': Endpoint('POST', '/portfolio/analytics', lambda rnd, ids: {
+        'outputs': ['balance', 'profits', 'profits_daily', 'winrate', 'volume', 'asset_allocation', 'metrics'],
+        **_period(rnd),
+    }),
+    'equity_curve': Endpoint('POST', '/portfolio/equity-curve', lambda rnd, ids: {
+        'resolution': rnd.choice(['day', 'trade']), 'points': rnd.choice([200, 1000]),
+    }),
+    'drawdowns': Endpoint('POST', '/portfolio/drawdowns', lambda rnd, ids: {
+        'top': rnd.choice([5, 20]), **_period(rnd),
+    }),
+    'correlation': Endpoint('POST', '/portfolio/correlation', lambda rnd, ids: {
+        'fill_gaps': rnd.random() < 0.5, **_period(rnd),
+    }),
+    'winrate': Endpoint('POST', '/portfolio/winrate', lambda rnd, ids: _period(rnd)),
+    'volume': Endpoint('POST', '/portfolio/volume', lambda rnd, ids: _period(rnd)),
+    'summary': Endpoint('POST', '/portfolio/summary'),
+    'dashboard': Endpoint('POST', '/portfolio/dashboard'),
+    'watchlist': Endpoint('POST', '/portfolio/watchlist'),
+    'watchlist_add': Endpoint('POST', '/portfolio/watchlist/add',
+                              lambda rnd, ids: {'ticker': rnd.choice(['BTC-USDT', 'ETH-USDT', 'SOL-USDT'])}),
+}
+
+# Expected client errors, e.g. adding a ticker already in the watchlist
+_EXPECTED_STATUSES = {'watchlist_add': {409}}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(latencies: List[float], statuses: Counter, errors: int, duration: float) -> dict:
+    values = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throttled': statuses.get('429', 0),
+        'statuses': dict(statuses),
+        'throughput_rps': round(len(latencies) / duration, 2),
+        'mean_ms': round(float(values.mean()), 3) if values.size else None,
+        'p50_ms': round(float(np.percentile(values, 50)), 3) if values.size else None,
+        'p95_ms': round(float(np.percentile(values, 95)), 3) if values.size else None,
+        'p99_ms': round(float(np.percentile(values, 99)), 3) if values.size else None,
+        'max_ms': round(float(values.max()), 3) if values.size else None,
+    }
+
+
+async def _order_ids(client: httpx.AsyncClient, users: int, sample: int) -> Dict[int, List[str]]:
+    """A few order ids per sampled user, for /portfolio/trade"""
+    ids = {}
+    for user in range(min(users, sample)):
+        response = await client.post('/portfolio/trades', json={'limit': 20}, headers={'api-key': api_key_for(user)})
+        if response.status_code == 200:
+            ids[user] = [trade['order_id'] for trade in response.json()]
+    return ids
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.base_url:
+        transport, base_url = None, args.base_url
+    else:
+        from app import app
+        # Unhandled errors are recorded as 500s rather than stopping the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        base_url = 'http://benchmark'
+
+    names = args.endpoints.split(',') if args.endpoints else list(ENDPOINTS)
+    unknown = set(names) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints {', '.join(sorted(unknown))}, choose from {', '.join(ENDPOINTS)}")
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    errors: Counter = Counter()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        order_ids = await _order_ids(client, args.users, args.sample_users) if 'trade' in names else {}
+        sampled = sorted(order_ids)
+
+        async def worker(seed: int, deadline: float, record: bool) -> None:
+            rnd = random.Random(seed)
+            while time.perf_counter() < deadline:
+                name = rnd.choice(names)
+                endpoint = ENDPOINTS[name]
+                user = rnd.choice(sampled) if name == 'trade' and sampled else rnd.randrange(args.users)
+                body = endpoint.body(rnd, order_ids.get(user, []))
+
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        endpoint.method, endpoint.path, json=body, headers={'api-key': api_key_for(user)},
+                    )
+                    await response.aread()
+                    status = str(response.status_code)
+                    failed = response.status_code >= 400 and response.status_code != 429 \
+                        and response.status_code not in _EXPECTED_STATUSES.get(name, ())
+                except httpx.HTTPError as e:
+                    status, failed = type(e).__name__, True
+                elapsed = time.perf_counter() - started
+
+                if record:
+                    latencies[name].append(elapsed)
+                    statuses[name][status] += 1
+                    errors[name] += failed
+
+        if args.warmup:
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(worker(args.seed + i, deadline, False) for i in range(args.concurrency)))
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(args.seed + 1000 + i, deadline, True) for i in range(args.concurrency)))
+        duration = time.perf_counter() - started
+
+    all_latencies = [value for name in names for value in latencies[name]]
+    all_statuses = sum(statuses.values(), Counter())
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'target': args.base_url or 'in-process',
+            'python': platform.python_version(),
+            'args': vars(args),
+        },
+        'endpoints': {
+            name: _summary(latencies[name], statuses[name], errors[name], duration)
+            for name in names
+        },
+        'total': _summary(all_latencies, all_statuses, sum(errors.values()), duration),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def print_results(results: dict) -> None:
+    print(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in [*results['endpoints'].items(), ('total', results['total'])]:
+        print(f"{name:<20}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms'] or 0:>10.2f}{stats['p95_ms'] or 0:>10.2f}{stats['p99_ms'] or 0:>10.2f}")
+    print(f"peak rss {results['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='Number of users benchmarks.generate created')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before the run')
+    parser.add_argument('--endpoints', help=f"Comma separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument('--base-url', help='Benchmark a running server instead of the app in process')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--sample-users', type=int, default=50, help='Users whose order ids /trade requests use')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', type=Path, help='Results file, defaults to benchmarks/results/<time>.json')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    out = args.out or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2, default=str))
+    print(f"Results written to {out}")
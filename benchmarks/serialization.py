@@ -0,0 +1,110 @@
+"""
+Times rendering a /portfolio/trades response body from database rows
+
+    python -m benchmarks.serialization [--trades 10000] [--repeat 20]
+
+Compares the previous path, rows to dicts to Trade models to jsonable_encoder
+to json.dumps, with rows to TradeRecords to orjson. Rows are synthetic and
+hold what asyncpg returns, so no database is needed
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+# Local
+from enums import OrderType, Ticker
+from models import Trade
+from responses import ORJSONResponse
+from utils import TRADE_COLUMNS, trade_records
+
+# FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# SA
+from sqlalchemy import Row
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+
+try:
+    from asyncpg.pgproto.pgproto import UUID
+except ImportError:
+    UUID = uuid.UUID
+
+
+def _rows(count: int, seed: int) -> List[Row]:
+    rnd = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    rows = []
+    for _ in range(count):
+        is_active = rnd.random() < 0.1
+        created_at = now - timedelta(minutes=rnd.randint(0, 365 * 24 * 60))
+        open_price = rnd.uniform(1, 70_000)
+        rows.append((
+            UUID(bytes=rnd.randbytes(16)) if UUID is uuid.UUID else UUID(rnd.randbytes(16)),
+            rnd.choice(list(Ticker)).value,
+            round(rnd.uniform(50, 5_000), 2),
+            0.0 if is_active else rnd.gauss(0, 100),
+            rnd.gauss(0, 100) if is_active else 0.0,
+            open_price,
+            None if is_active else open_price * rnd.gauss(1, 0.03),
+            created_at,
+            None if is_active else created_at + timedelta(hours=rnd.randint(1, 300)),
+            is_active,
+            rnd.choice(list(OrderType)).value,
+        ))
+    # Real Rows, as a query over TRADE_COLUMNS returns them
+    return IteratorResult(SimpleResultMetaData(TRADE_COLUMNS), iter(rows)).all()
+
+
+def _serialise_trade(row: Row) -> dict:
+    """JSON ready dict of a trade row, NULL and 'null' values are left out, as the previous path built them"""
+    return {
+        key: (value if not isinstance(value, (datetime, uuid.UUID)) else str(value))
+        for key, value in row._mapping.items()
+        if value is not None and value != 'null'
+    }
+
+
+def models_path(rows: List[Row]) -> bytes:
+    return JSONResponse(content=jsonable_encoder([Trade(**_serialise_trade(row)) for row in rows])).body
+
+
+def records_path(rows: List[Row]) -> bytes:
+    return ORJSONResponse(content=trade_records(rows)).body
+
+
+def _time(render: Callable[[List[Row]], bytes], rows: List[Row], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(rows)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trades', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows = _rows(args.trades, args.seed)
+    if json.loads(models_path(rows)) != json.loads(records_path(rows)):
+        raise SystemExit('The two paths render different documents')
+
+    results = {name: _time(render, rows, args.repeat) for name, render in (
+        ('models', models_path), ('records', records_path),
+    )}
+    print(f"{args.trades} trades, {args.repeat} runs")
+    print(f"{'path':<10}{'median ms':>12}{'min ms':>10}{'bytes':>10}")
+    for name, timings in results.items():
+        size = len((models_path if name == 'models' else records_path)(rows))
+        print(f"{name:<10}{statistics.median(timings):>12.2f}{min(timings):>10.2f}{size:>10}")
+    speedup = statistics.median(results['models']) / statistics.median(results['records'])
+    print(f"records are {speedup:.1f}x faster")
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pydantic import BaseModel
+
+import redis.exceptions
+from redis.asyncio import Redis
+
+# Local
+from config import REDIS_CLIENT, SESSION_EXPIRY, SESSION_LOCAL_MAXSIZE, SESSION_LOCAL_TTL, \
+    ANALYTICS_CACHE_TTL, ANALYTICS_LOCAL_MAXSIZE
+from db_models import Users
+from dependencies import task_session
+from security import api_key_digest
+
+
+class LRUCache:
+    """
+    In-process least recently used cache with a per entry time to live.
+    Holds at most maxsize entries, the least recently used is evicted first
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SessionCache:
+    """
+    Two tier cache of authenticated api keys
+    - Local LRU tier, hot keys never leave the process
+    - Redis tier, shared across workers with a native TTL
+    Keys are stored under their digest so raw api keys never reach Redis
+    """
+    _PREFIX = 'session:'
+
+    def __init__(self, client: Redis, ttl: int = SESSION_EXPIRY,
+                 local_maxsize: int = SESSION_LOCAL_MAXSIZE, local_ttl: float = SESSION_LOCAL_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=local_maxsize, ttl=min(local_ttl, ttl))
+
+    def _key(self, api_key: str) -> str:
+        return self._PREFIX + api_key_digest(api_key)
+
+    async def get(self, api_key: str) -> Optional[dict]:
+        """Returns the cached session for the key, None if absent or Redis is unreachable"""
+        key = self._key(api_key)
+        session = self.local.get(key)
+        if session is not None:
+            return session
+
+        try:
+            cached = await self.client.get(key)
+        except redis.exceptions.RedisError:
+            return None
+        if cached is None:
+            return None
+
+        session = json.loads(cached)
+        self.local.set(key, session)
+        return session
+
+    async def set(self, api_key: str, session: dict, ttl: int = None) -> None:
+        """Caches the session for ttl seconds, the cache's TTL by default"""
+        key = self._key(api_key)
+        ttl = ttl or self.ttl
+        self.local.set(key, session, ttl=min(self.local.ttl, ttl))
+        try:
+            await self.client.set(key, json.dumps(session), ex=ttl)
+        except redis.exceptions.RedisError:
+            pass
+
+    async def delete(self, api_key: str) -> None:
+        key = self._key(api_key)
+        self.local.delete(key)
+        try:
+            await self.client.delete(key)
+        except redis.exceptions.RedisError:
+            pass
+
+
+class AnalyticsCache:
+    """
+    Caches analytics results per user, endpoint and normalised request body.
+    - Keys include the user's data_version, bumped by triggers whenever their
+      orders or balance change, so a stale result is never served. Updates of
+      only unrealised_pnl, the marks, don't bump it, no cached result reads them
+    - Local LRU tier in front of Redis, both with a TTL
+    - Concurrent identical requests in the process share one computation
+    """
+    _PREFIX = 'analytics:'
+
+    def __init__(self, client: Redis, ttl: int = ANALYTICS_CACHE_TTL, local_maxsize: int = ANALYTICS_LOCAL_MAXSIZE):
+        self.client = client
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=local_maxsize, ttl=ttl)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    def key(self, user: Users, endpoint: str, body: Any = None) -> str:
+        if isinstance(body, BaseModel):
+            body = body.model_dump(mode='json', exclude_none=True)
+        normalised = json.dumps(body or {}, sort_keys=True, default=str)
+        digest = hashlib.sha1(normalised.encode()).hexdigest()
+        return f"{self._PREFIX}{user.email}:{user.data_version}:{endpoint}:{digest}"
+
+    async def get_or_compute(self, user: Users, endpoint: str, body: Any, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached result for the request, otherwise awaits compute
+        and caches its JSON serialisable result
+        """
+        key = self.key(user, endpoint, body)
+
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._computed(key, done))
+        # A caller cancelled while waiting leaves the computation running for the others
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Loads or computes the value in its own task, on its own session since the
+        request that started it may end first
+        """
+        async with task_session():
+            value = await self._load(key)
+            if value is not None:
+                self.redis_hits += 1
+            else:
+                self.misses += 1
+                value = await compute()
+                await self._store(key, value)
+
+        self.local.set(key, value)
+        return value
+
+    def _computed(self, key: str, task: asyncio.Future) -> None:
+        del self._in_flight[key]
+        # Retrieved so a failure no caller awaited isn't reported by the loop
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, key: str) -> Optional[Any]:
+        try:
+            cached = await self.client.get(key)
+        except redis.exceptions.RedisError:
+            return None
+        return json.loads(cached) if cached is not None else None
+
+    async def _store(self, key: str, value: Any) -> None:
+        try:
+            await self.client.set(key, json.dumps(value), ex=self.ttl)
+        except redis.exceptions.RedisError:
+            pass
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.redis_hits + self.shared
+        return {
+            'local_hits': self.local_hits,
+            'redis_hits': self.redis_hits,
+            'shared': self.shared,
+            'misses': self.misses,
+            'hit_ratio': hits / (hits + self.misses) if hits + self.misses else 0.0,
+            'local_size': len(self.local),
+            'in_flight': len(self._in_flight),
+        }
+
+
+SESSION_CACHE = SessionCache(REDIS_CLIENT)
+ANALYTICS_CACHE = AnalyticsCache(REDIS_CLIENT)
@@ -3,11 +3,12 @@ from uuid import uuid4
 
 from dotenv import load_dotenv
 from urllib.parse import quote
-from argon2 import PasswordHasher
-import redis
+import redis.asyncio
 
 # Local
 from db_models import Users
+from hashing import HashingService, HashProfile
+from pooling import TimedQueuePool
 
 # SA
 from sqlalchemy.ext.asyncio import create_async_engine
@@ -16,14 +17,116 @@ from sqlalchemy.ext.asyncio import create_async_engine
 load_dotenv()
 
 API_KEY_ALIAS = 'api-key'
+# Secret used for the indexed digest of api keys, see security.api_key_digest
+API_KEY_DIGEST_SECRET = os.getenv('API_KEY_DIGEST_SECRET', '').encode()
+if not API_KEY_DIGEST_SECRET:
+    raise RuntimeError('API_KEY_DIGEST_SECRET must be set, api key digests are keyed with it')
+# Seconds a key that failed to authenticate is rejected without a lookup
+API_KEY_INVALID_TTL = int(os.getenv('API_KEY_INVALID_TTL', 60))
 
-ph = PasswordHasher(time_cost=2, memory_cost=102400, parallelism=8)
+# Argon2 hashing runs on a bounded pool, see hashing.HashingService
+HASH_PROFILE = HashProfile(
+    time_cost=int(os.getenv('ARGON2_TIME_COST', 2)),
+    memory_cost=int(os.getenv('ARGON2_MEMORY_COST', 102400)),
+    parallelism=int(os.getenv('ARGON2_PARALLELISM', 8)),
+)
+HASHER = HashingService(
+    HASH_PROFILE,
+    workers=int(os.getenv('HASHER_WORKERS', 4)),
+    max_pending=int(os.getenv('HASHER_MAX_PENDING', 64)),
+    executor=os.getenv('HASHER_EXECUTOR', 'thread'),
+)
+ph = HASHER.hasher
 
 # DB
 DB_URI = \
-    f"postgresql+asyncpg://{os.getenv("DB_USER")}:{quote(os.getenv('DB_PASSWORD'))}\
+    f"postgresql+asyncpg://{os.getenv("DB_USER")}:{quote(os.getenv('DB_PASSWORD', ''))}\
 @{os.getenv("DB_HOST")}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-DB_ENGINE = create_async_engine(DB_URI)
+# A full SQLAlchemy URL takes precedence, e.g. a benchmark database
+DB_URI = os.getenv('DATABASE_URL', DB_URI)
+# Pool sizing, checkout waits are reported on /internal/stats, see pooling.TimedQueuePool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds
+# Prepared statements cached per asyncpg connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 500))
 
-import json
-REDIS_CLIENT = redis.Redis(host="localhost", db=0)
+if DB_URI.startswith('postgresql'):
+    DB_ENGINE = create_async_engine(
+        DB_URI,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={'prepared_statement_cache_size': DB_STATEMENT_CACHE_SIZE},
+    )
+else:
+    DB_ENGINE = create_async_engine(DB_URI)
+
+# Analytics read closed trades from daily_pnl_rollup when the filters allow
+ROLLUP_ENABLED = os.getenv('ROLLUP_ENABLED', '1') == '1'
+
+# Trades pagination
+TRADES_PAGE_SIZE = int(os.getenv('TRADES_PAGE_SIZE', 500))
+TRADES_PAGE_MAX = int(os.getenv('TRADES_PAGE_MAX', 5000))
+
+# Equity curves are downsampled to at most this many points
+EQUITY_CURVE_POINTS = int(os.getenv('EQUITY_CURVE_POINTS', 1000))
+EQUITY_CURVE_MAX_POINTS = int(os.getenv('EQUITY_CURVE_MAX_POINTS', 10000))
+
+# Most buckets a gap filled series or /portfolio/correlation day matrix may span, about 55 years of days
+FILL_GAPS_MAX_BUCKETS = int(os.getenv('FILL_GAPS_MAX_BUCKETS', 20000))
+
+# Longest window of /portfolio/metrics/rolling, in intervals
+ROLLING_WINDOW_MAX = int(os.getenv('ROLLING_WINDOW_MAX', 3650))
+
+# Drawdown episodes returned by /portfolio/drawdowns, and closed trades read per batch
+DRAWDOWN_TOP = int(os.getenv('DRAWDOWN_TOP', 5))
+DRAWDOWN_TOP_MAX = int(os.getenv('DRAWDOWN_TOP_MAX', 100))
+DRAWDOWN_BATCH_SIZE = int(os.getenv('DRAWDOWN_BATCH_SIZE', 1000))
+
+# /portfolio/dashboard, seconds each section may take and recent trades returned
+DASHBOARD_TIMEOUT = float(os.getenv('DASHBOARD_TIMEOUT', 2))
+DASHBOARD_TRADES = int(os.getenv('DASHBOARD_TRADES', 10))
+
+# Bulk order imports, orders copied and committed per chunk, and the longest line read in bytes
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+IMPORT_MAX_LINE = int(os.getenv('IMPORT_MAX_LINE', 65536))
+
+# Redis, one asyncio connection pool shared by the middleware and routers
+REDIS_POOL = redis.asyncio.ConnectionPool(
+    host=os.getenv('REDIS_HOST', 'localhost'),
+    port=int(os.getenv('REDIS_PORT', 6379)),
+    db=int(os.getenv('REDIS_DB', 0)),
+    max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+)
+REDIS_CLIENT = redis.asyncio.Redis(connection_pool=REDIS_POOL)
+
+# Authenticated sessions
+SESSION_EXPIRY = int(os.getenv('SESSION_EXPIRY', 432000))  # 5 days in seconds
+SESSION_LOCAL_MAXSIZE = int(os.getenv('SESSION_LOCAL_MAXSIZE', 10000))
+SESSION_LOCAL_TTL = int(os.getenv('SESSION_LOCAL_TTL', 60))
+
+# Analytics response cache
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 300))
+ANALYTICS_LOCAL_MAXSIZE = int(os.getenv('ANALYTICS_LOCAL_MAXSIZE', 5000))
+
+# Rate limiting, 'prefix=limit/period' rules matched on the longest prefix
+RATE_LIMIT_RULES = os.getenv('RATE_LIMIT_RULES', '/portfolio=30/60')
+RATE_LIMIT_LOCAL_MAXSIZE = int(os.getenv('RATE_LIMIT_LOCAL_MAXSIZE', 10000))
+
+# Live prices, see pricing.PriceBook. Ticks are posted to /prices/ticks with
+# the feed token, or written as JSON lines to the unix socket when set.
+# Either way the receiving worker publishes them to the others
+PRICE_FEED_TOKEN = os.getenv('PRICE_FEED_TOKEN', '')
+PRICE_FEED_SOCKET = os.getenv('PRICE_FEED_SOCKET')
+PRICE_BOOK_MAXSIZE = int(os.getenv('PRICE_BOOK_MAXSIZE', 10000))
+# Ticks received by one worker are published here and applied by every worker
+PRICE_FEED_CHANNEL = os.getenv('PRICE_FEED_CHANNEL', 'prices:ticks')
+# Seconds after which a price is stale, unrealised pnl falls back to the stored value
+PRICE_MAX_AGE = float(os.getenv('PRICE_MAX_AGE', 300))
+
+# Token /internal/stats requires in the X-Stats-Token header, the endpoint is disabled while unset
+STATS_TOKEN = os.getenv('STATS_TOKEN', '')
@@ -1,10 +1,11 @@
 import json
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 from uuid import uuid4
 
 # SQLAlchemy
-from sqlalchemy import String, Float, Boolean, DateTime, ForeignKey, UUID, Integer, UniqueConstraint
+from sqlalchemy import String, Float, Boolean, BigInteger, Date, DateTime, ForeignKey, UUID, Integer, UniqueConstraint, \
+    Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -22,6 +23,9 @@ class Users(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     api_key: Mapped[str] = mapped_column(String)
+    api_key_digest: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, unique=True, index=True)
+    # Bumped by triggers whenever the user's orders (besides unrealised_pnl) or balance change, see cache.AnalyticsCache
+    data_version: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0', nullable=False)
 
     # Relationships
     orders = relationship('Orders', back_populates='user')
@@ -47,6 +51,14 @@ class Orders(Base):
     # Relationships
     user = relationship("Users", back_populates="orders")
 
+    # Indexes, see migrations/versions/0004_orders_indexes.py
+    __table_args__ = (
+        Index('ix_dashboard_orders_user_closed', 'user_id', 'closed_at', 'order_id'),
+        Index('ix_dashboard_orders_user_ticker_closed', 'user_id', 'ticker', 'closed_at'),
+        Index('ix_dashboard_orders_user_created', 'user_id', 'created_at'),
+        Index('ix_dashboard_orders_user_open', 'user_id', 'ticker', 'order_type', postgresql_where=text('is_active')),
+    )
+
 
 class Watchlist(Base):
     __tablename__ = 'dashboard_watchlist'
@@ -60,3 +72,20 @@ class Watchlist(Base):
 
     # Constraints
     unique_user_ticker = UniqueConstraint('ticker', 'user_id', name='unique_user_ticker')
+
+
+class DailyPnlRollup(Base):
+    """
+    Closed orders summed per user, UTC day of closed_at, ticker and order type.
+    Maintained by a trigger on dashboard_orders, see migrations/versions/0002_daily_pnl_rollup.py
+    """
+    __tablename__ = 'daily_pnl_rollup'
+
+    user_id: Mapped[str] = mapped_column(String, ForeignKey('accounts_customuser.email'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    ticker: Mapped[str] = mapped_column(String, primary_key=True)
+    order_type: Mapped[str] = mapped_column(String, primary_key=True)
+    realised_pnl: Mapped[float] = mapped_column(Float, default=0)
+    trade_count: Mapped[int] = mapped_column(Integer, default=0)
+    win_count: Mapped[int] = mapped_column(Integer, default=0)
+    volume: Mapped[float] = mapped_column(Float, default=0)
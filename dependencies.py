@@ -1,39 +1,70 @@
 from contextlib import asynccontextmanager
-import argon2
+from contextvars import ContextVar
+from typing import Optional
+
 from argon2 import PasswordHasher
 
 # Local
-from config import DB_ENGINE, API_KEY_ALIAS, ph
+from config import DB_ENGINE, API_KEY_ALIAS
 from db_models import Users
+from security import find_user_by_api_key
 
 # FA
 from fastapi import Request
 from fastapi.responses import JSONResponse
 
 # SQLAlchemy
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from exceptions import DoesNotExist
 
 
+# The session of the request being handled, see middleware.DBSessionMiddleware
+_REQUEST_SESSION: ContextVar[Optional[AsyncSession]] = ContextVar('request_session', default=None)
+
+
+@asynccontextmanager
+async def request_session():
+    """
+    Opens the session shared by everything handling one request, its connection
+    is only checked out on first use and returned when the request ends
+    """
+    async with AsyncSession(DB_ENGINE, expire_on_commit=False) as session:
+        token = _REQUEST_SESSION.set(session)
+        try:
+            yield session
+        finally:
+            _REQUEST_SESSION.reset(token)
+            await session.close()
+
+
+@asynccontextmanager
+async def task_session():
+    """
+    request_session for one task of a request, e.g. each query run concurrently
+    with asyncio.gather. A session runs one query at a time, so every task
+    gets its own pooled connection instead of sharing the request's
+    """
+    async with request_session() as session:
+        yield session
+
+
 @asynccontextmanager
 async def get_session():
     """
     Returns async SQLAlchemy session
-    :return:
+    - Inside a request, the request's session, left open for the rest of the request
+    - Otherwise a new session closed on exit
     """
-    async with AsyncSession(DB_ENGINE) as session:
+    session = _REQUEST_SESSION.get()
+    if session is not None:
         try:
             yield session
         except Exception:
             await session.rollback()
             raise
-        finally:
-            await session.close()
-
+        return
 
-async def get_session_2():
     async with AsyncSession(DB_ENGINE) as session:
         try:
             yield session
@@ -44,30 +75,26 @@ async def get_session_2():
             await session.close()
 
 
-def hash_api_key(request: Request) -> str:
-    """Returns str of argon2 hashed api key"""
-    return str(ph.hash(request.headers.get(API_KEY_ALIAS)))
+async def get_session_2():
+    """Dependency form of get_session"""
+    async with get_session() as session:
+        yield session
 
 
 async def get_user(request: Request) -> Users:
     """
     Uses the api key in header to indentify the user
     returns an object of type Users
+    - Behind AuthenticateHeaderMiddleware the key is already verified, the user is
+      fetched by the email it put in the request state
+    - Otherwise the key is looked up and verified here
     """
+    email = getattr(request.state, 'user_email', None)
     async with get_session() as session:
-        result = await session.execute(
-            select(Users)
-            .where(Users.api_key != None)
-        )
-        users = result.scalars().all()
-
-        try:
-            for user in users:
-                try:
-                    if ph.verify(user.api_key, request.headers.get(API_KEY_ALIAS)):
-                        return user
-                except argon2.exceptions.VerifyMismatchError:
-                    continue
+        if email is not None:
+            user = await session.get(Users, email)
+        else:
+            user = await find_user_by_api_key(session, request.headers.get(API_KEY_ALIAS))
+        if user is None:
             raise DoesNotExist('User')
-        except DoesNotExist:
-            raise
+        return user
@@ -10,15 +10,58 @@ class Intervals(str, Enum):
     MONTHLY = 'm'
     DAILY = 'd'
     YEARLY = 'y'
+    WEEKLY = 'w'
+    QUARTERLY = 'q'
 
 
 class Metrics(str, Enum):
     SHARPE = 'sharpe'
     SORTINO = 'sortino'
     STD = 'std'
+    DOWNSIDE_STD = 'downside_std'
+    MAX_DRAWDOWN = 'max_drawdown'
+    CALMAR = 'calmar'
+    PROFIT_FACTOR = 'profit_factor'
+    EXPECTANCY = 'expectancy'
+    TREYNOR = 'treynor'
 
 
 class Ticker(str, Enum):
     SOL = 'SOL-USDT'
     BTC = 'BTC-USDT'
     ETH = 'ETH-USDT'
+
+
+class AllocationMode(str, Enum):
+    COUNT = 'count'
+    EXPOSURE = 'exposure'
+    PNL = 'pnl'
+
+
+class AnalyticsOutput(str, Enum):
+    BALANCE = 'balance'
+    PROFITS = 'profits'
+    PROFITS_DAILY = 'profits_daily'
+    PROFITS_WEEKLY = 'profits_weekly'
+    PROFITS_MONTHLY = 'profits_monthly'
+    PROFITS_QUARTERLY = 'profits_quarterly'
+    PROFITS_YEARLY = 'profits_yearly'
+    WINRATE = 'winrate'
+    VOLUME = 'volume'
+    ASSET_ALLOCATION = 'asset_allocation'
+    METRICS = 'metrics'
+
+
+class SortOrder(str, Enum):
+    ASC = 'asc'
+    DESC = 'desc'
+
+
+class ImportFormat(str, Enum):
+    CSV = 'csv'
+    NDJSON = 'ndjson'
+
+
+class CurveResolution(str, Enum):
+    TRADE = 'trade'
+    DAY = 'day'
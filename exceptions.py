@@ -10,3 +10,43 @@ class DoesNotExist(Exception):
         self.resource = resource
         self.message = f"{resource} does not exist"
         super().__init__(self.message)
+
+
+class ServiceOverloaded(Exception):
+    """
+    A bounded internal service has no capacity left
+    e.g. Hashing
+    """
+    def __init__(self, service: str):
+        self.service = service
+        self.message = f"{service} service is overloaded, try again shortly"
+        super().__init__(self.message)
+
+
+class InvalidCursor(Exception):
+    """
+    Pagination cursor can't be decoded
+    """
+    def __init__(self):
+        self.message = "Invalid cursor"
+        super().__init__(self.message)
+
+
+class PeriodTooLarge(Exception):
+    """
+    Requested period spans more buckets than can be filled
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.message = f"Period spans more than {limit} intervals, narrow it or turn off fill_gaps"
+        super().__init__(self.message)
+
+
+class LineTooLong(Exception):
+    """
+    Line of a streamed body is longer than allowed
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.message = f"Line longer than {limit} bytes"
+        super().__init__(self.message)
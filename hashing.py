@@ -0,0 +1,131 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+
+import argon2.exceptions
+from argon2 import PasswordHasher
+
+# Local
+from exceptions import ServiceOverloaded
+
+
+@dataclass(frozen=True)
+class HashProfile:
+    """
+    Argon2 parameters the hashing service runs with.
+    memory_cost is in KiB, each call in flight holds that much memory
+    """
+    time_cost: int = 2
+    memory_cost: int = 102400
+    parallelism: int = 8
+
+
+@lru_cache(maxsize=None)
+def _hasher(profile: HashProfile) -> PasswordHasher:
+    """One PasswordHasher per profile per process, workers included"""
+    return PasswordHasher(**asdict(profile))
+
+
+def _hash(profile: HashProfile, secret: str) -> str:
+    return _hasher(profile).hash(secret)
+
+
+def _verify(profile: HashProfile, hashed: str, secret: str) -> bool:
+    try:
+        return _hasher(profile).verify(hashed, secret)
+    except (argon2.exceptions.VerifyMismatchError, argon2.exceptions.InvalidHashError):
+        return False
+
+
+class HashingService:
+    """
+    Runs argon2 hashing and verification on a bounded worker pool
+    so the event loop is never blocked for the cost of a hash.
+    - executor 'thread' suits argon2-cffi which releases the GIL,
+      'process' isolates the work entirely
+    - Once max_pending calls are queued or running new calls raise
+      ServiceOverloaded instead of queueing without bound
+    """
+    def __init__(self, profile: HashProfile, workers: int = 4, max_pending: int = 64, executor: str = 'thread'):
+        self.profile = profile
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_kind = executor
+        self._executor: Executor = None
+
+        # Metrics
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_wait = 0.0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    @property
+    def hasher(self) -> PasswordHasher:
+        """Synchronous hasher with the service's profile, for scripts and tests"""
+        return _hasher(self.profile)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hasher')
+        return self._executor
+
+    async def _submit(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ServiceOverloaded('Hashing')
+
+        self.pending += 1
+        submitted = time.perf_counter()
+        started = []
+
+        def timed():
+            started.append(time.perf_counter())
+            return func(self.profile, *args)
+
+        try:
+            if self.executor_kind == 'process':
+                # Closures can't be pickled, wait time is folded into latency
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, self.profile, *args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            latency = time.perf_counter() - submitted
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+            if started:
+                self._total_wait += started[0] - submitted
+
+    async def hash(self, secret: str) -> str:
+        """Returns the argon2 hash of the secret"""
+        return await self._submit(_hash, secret)
+
+    async def verify(self, hashed: str, secret: str) -> bool:
+        """Returns True if the secret matches the hash, mismatches return False"""
+        return await self._submit(_verify, hashed, secret)
+
+    def stats(self) -> dict:
+        return {
+            'executor': self.executor_kind,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'queue_depth': self.pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'avg_wait_ms': (self._total_wait / self.completed * 1000) if self.completed else 0.0,
+            'avg_latency_ms': (self._total_latency / self.completed * 1000) if self.completed else 0.0,
+            'max_latency_ms': self._max_latency * 1000,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,235 @@
+import csv
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, AsyncIterator, Callable, List, Optional, Set
+
+import pydantic
+from asyncpg import PostgresError
+
+# Local
+from config import IMPORT_CHUNK_SIZE, IMPORT_MAX_LINE
+from dependencies import get_session
+from enums import ImportFormat
+from exceptions import LineTooLong
+from models import OrderImport
+from rollup import backfill
+
+# SA
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+IMPORT_COLUMNS = tuple(OrderImport.model_fields)
+# Rejected rows reported back, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+_STAGING = '_orders_import'
+_COLUMN_LIST = ', '.join(IMPORT_COLUMNS)
+# Per connection, emptied by every commit
+_CREATE_STAGING = text(
+    f'CREATE TEMP TABLE IF NOT EXISTS {_STAGING} (LIKE dashboard_orders INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+)
+_UNKNOWN_USERS = text(f"""
+    SELECT count(*) FROM {_STAGING} s
+    WHERE NOT EXISTS (SELECT 1 FROM accounts_customuser u WHERE u.email = s.user_id)
+""")
+# Triggers on dashboard_orders keep daily_pnl_rollup and data_version up to date
+_MERGE = text(f"""
+    INSERT INTO dashboard_orders ({_COLUMN_LIST})
+    SELECT {_COLUMN_LIST} FROM {_STAGING} s
+    WHERE EXISTS (SELECT 1 FROM accounts_customuser u WHERE u.email = s.user_id)
+    ON CONFLICT (order_id) DO NOTHING
+""")
+
+
+@dataclass
+class ImportResult:
+    received: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    # Orders of chunks the database refused, none of a failed chunk is stored
+    failed: int = 0
+    errors: List[dict] = field(default_factory=list)
+    # Reading stopped at a line longer than the limit, the orders before it were imported
+    truncated: bool = False
+    seconds: float = 0.0
+    users: Set[str] = field(default_factory=set)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.received / self.seconds if self.seconds else 0.0
+
+    def reject(self, line: int, error: str) -> None:
+        self.rejected += 1
+        self.error(line, error)
+
+    def error(self, line: Optional[int], error: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': error})
+
+    def to_dict(self) -> dict:
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'errors': self.errors,
+            'truncated': self.truncated,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+async def split_lines(chunks: AsyncIterable[bytes], max_length: int = IMPORT_MAX_LINE) -> AsyncIterator[str]:
+    """
+    Lines of a byte stream, e.g. a request body, without holding more than one chunk
+    and one line. Raises LineTooLong at a line over max_length bytes
+    """
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            if len(line) > max_length:
+                raise LineTooLong(max_length)
+            yield line.decode()
+        if len(pending) > max_length:
+            raise LineTooLong(max_length)
+    if pending:
+        yield pending.decode()
+
+
+def _validate_error(e: pydantic.ValidationError) -> str:
+    return '; '.join(f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in e.errors())
+
+
+async def _copy_chunk(session: AsyncSession, records: List[tuple]) -> tuple:
+    """Copies the records into the staging table and merges them, returns (inserted, unknown users)"""
+    await session.execute(_CREATE_STAGING)
+    connection = await (await session.connection()).get_raw_connection()
+    await connection.driver_connection.copy_records_to_table(_STAGING, records=records, columns=IMPORT_COLUMNS)
+
+    unknown = (await session.execute(_UNKNOWN_USERS)).scalar_one()
+    inserted = (await session.execute(_MERGE)).rowcount
+    await session.commit()
+    return inserted, unknown
+
+
+async def import_orders(
+        lines: AsyncIterable[str],
+        import_format: ImportFormat,
+        owner: Optional[str] = None,
+        default_user: Optional[str] = None,
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+        progress: Callable[[ImportResult], None] = None,
+) -> ImportResult:
+    """
+    Validates orders from CSV (with a header line) or NDJSON lines against
+    OrderImport and copies them into dashboard_orders chunk_size at a time,
+    through a staging table with asyncpg's COPY. Orders whose order_id
+    exists are skipped as duplicates.
+    - owner, every order belongs to this user, rows naming another are rejected
+    - default_user, owner of rows without a user_id
+    Rows of unknown users are rejected. A chunk the database refuses is rolled
+    back and counted as failed, the other chunks are still imported. Reading
+    stops at a line longer than the limit of split_lines, see ImportResult.truncated.
+    PostgreSQL only
+    """
+    result = ImportResult()
+    records: List[tuple] = []
+    # Line number of the first record in the chunk
+    first_line = None
+    header = None
+    started = time.perf_counter()
+
+    async def flush() -> None:
+        try:
+            async with get_session() as session:
+                inserted, unknown = await _copy_chunk(session, records)
+        except (DBAPIError, PostgresError) as e:
+            result.failed += len(records)
+            error = e.orig if isinstance(e, DBAPIError) else e
+            result.error(first_line, f'{len(records)} orders from this line not imported: {error}')
+        else:
+            result.inserted += inserted
+            result.rejected += unknown
+            result.duplicates += len(records) - inserted - unknown
+            if unknown:
+                result.error(None, f'{unknown} orders of unknown users')
+        records.clear()
+        result.seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(result)
+
+    number = 0
+    try:
+        async for line in lines:
+            number += 1
+            line = line.rstrip('\r')
+            if not line.strip():
+                continue
+            if import_format == ImportFormat.CSV and header is None:
+                header = next(csv.reader([line]))
+                continue
+
+            result.received += 1
+            try:
+                if import_format == ImportFormat.CSV:
+                    values = next(csv.reader([line]))
+                    if len(values) != len(header):
+                        raise ValueError(f'expected {len(header)} fields, got {len(values)}')
+                    order = OrderImport.model_validate({
+                        key: value for key, value in zip(header, values) if value != ''
+                    })
+                else:
+                    order = OrderImport.model_validate_json(line)
+            except pydantic.ValidationError as e:
+                result.reject(number, _validate_error(e))
+                continue
+            except (ValueError, csv.Error) as e:
+                result.reject(number, str(e))
+                continue
+
+            if owner is not None:
+                if order.user_id not in (None, owner):
+                    result.reject(number, 'user_id: orders can only be imported into the importing account')
+                    continue
+                order.user_id = owner
+            elif order.user_id is None:
+                if default_user is None:
+                    result.reject(number, 'user_id: required')
+                    continue
+                order.user_id = default_user
+
+            result.users.add(order.user_id)
+            if not records:
+                first_line = number
+            records.append(tuple(getattr(order, column) for column in IMPORT_COLUMNS))
+            if len(records) >= chunk_size:
+                await flush()
+    except LineTooLong as e:
+        result.truncated = True
+        result.error(number + 1, e.message)
+
+    if records:
+        await flush()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+async def rebuild_derived(users: Set[str]) -> None:
+    """
+    Rebuilds the rollup and bumps data_version of the users, for imports
+    run with the dashboard_orders triggers disabled
+    """
+    for user_id in users:
+        async with get_session() as session:
+            await session.execute(
+                text('UPDATE accounts_customuser SET data_version = data_version + 1 WHERE email = :email'),
+                {'email': user_id},
+            )
+            # Commits the bump with the rebuilt rows
+            await backfill(session, user_id)
@@ -1,119 +1,136 @@
-import json
-from contextlib import asynccontextmanager
-from datetime import timedelta, datetime
-
-import argon2.exceptions
-from argon2 import PasswordHasher
+from typing import Optional
 
 # Local
-from db_models import Users
-from dependencies import get_session
-from config import API_KEY_ALIAS, ph, REDIS_CLIENT
-from exceptions import DoesNotExist
+from cache import SESSION_CACHE
+from config import API_KEY_ALIAS, API_KEY_INVALID_TTL
+from dependencies import get_session, request_session
+from exceptions import ServiceOverloaded
+from ratelimit import RATE_LIMITER
+from security import find_user_by_api_key
 
 # Starlette
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.requests import Request
-from starlette.responses import Response
-
-# SQLAlchemy
-from sqlalchemy import select
-
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-_EXCLUDED_PATHS = [
-    '/portfolio'
-]
 
-class AuthenticateHeaderMiddleware(BaseHTTPMiddleware):
-    """
-    Checks that the api key is present in header and that it matches
-    with an existing key stored
-    """
-    _SESSION_EXPIRY = 432000 # 5 days in seconds
+_EXCLUDED_PATHS = (
+    '/portfolio',
+)
 
-    def __init__(self, app):
-        super().__init__(app)
+_API_KEY_HEADER = API_KEY_ALIAS.lower().encode('latin-1')
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        """
-        - Passes through EXCLUDED_PATHS
-        - Checks with DB if the key's hash is present
-        """
-        # TODO: Store the api key in session to reduce load
-        if not any(request.url.path.startswith(path) for path in _EXCLUDED_PATHS):
-            response = await call_next(request)
-            return response
-
-        api_key = request.headers.get(API_KEY_ALIAS, None)
-
-        # Checking for key in cache
-        try:
-            cache = json.loads(REDIS_CLIENT.get(api_key).decode())
-            if (cache['created_at'] - datetime.now().timestamp()) >= self._SESSION_EXPIRY:
-                REDIS_CLIENT.delete(api_key)
-            else:
-                return await call_next(request)
-        except AttributeError:
-            pass
-
-        if not api_key:
-            return JSONResponse(status_code=401, content={'error': 'API Key not provided'})
 
-        async with get_session() as session:
-            result = await session.execute(
-                select(Users)
-                .where(Users.api_key != None)
-            )
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    """Returns the first value of the header, names in the scope are lowercase"""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
 
-            users = result.scalars().all()
-            if not users:
-                return JSONResponse(status_code=401, content={'error': 'Something went wrong'})
-            for user in users:
-                try:
-                    if ph.verify(user.api_key, api_key):
-                        # Mimicking session storing
-                        REDIS_CLIENT.set(api_key, json.dumps({'authenticated': True, 'created_at': datetime.now().timestamp()}))
-                        return await call_next(request)
-                except argon2.exceptions.VerifyMismatchError:
-                    continue
-            return JSONResponse(status_code=401, content={'Invalid key'})
 
+class DBSessionMiddleware:
+    """
+    Opens one database session per request, shared by the authentication
+    middleware, the dependencies and utils through dependencies.get_session,
+    so a request checks out at most one connection
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
 
+        async with request_session():
+            await self.app(scope, receive, send)
 
 
-class RateLimitingMiddleware(BaseHTTPMiddleware):
+class AuthenticateHeaderMiddleware:
     """
-    Keeps track of the user's request
-    stores the request count and request date in a list
-    [count, date]
+    Checks that the api key is present in header and that it matches
+    with an existing key stored. The authenticated user's email is put in
+    scope['state'] as user_email, read by dependencies.get_user
     """
-    _TIME_LIMIT = timedelta(minutes=1)
-    _REQUEST_LIMIT = 30
+    def __init__(self, app: ASGIApp, paths: tuple = _EXCLUDED_PATHS):
+        self.app = app
+        self.paths = tuple(paths)
 
-    def __init__(self, app):
-        super().__init__(app)
-        self.request_counter = {}
-
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
-        if not any(request.url.path.startswith(path) for path in _EXCLUDED_PATHS):
-            response = await call_next(request)
-            return response
-
-        api_key = request.headers.get(API_KEY_ALIAS)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        - Passes through everything outside EXCLUDED_PATHS
+        - Checks the session cache for the key
+        - Otherwise checks with DB if the key's hash is present and caches the session
+        """
+        if scope['type'] != 'http' or not scope['path'].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
 
-        self.request_counter.setdefault(api_key, [0, datetime.now()])
-        api_key_usage = self.request_counter.get(api_key)
+        api_key = _header(scope, _API_KEY_HEADER)
+        if not api_key:
+            await JSONResponse(status_code=401, content={'error': 'API Key not provided'})(scope, receive, send)
+            return
+
+        # Checking for key in cache, keys that failed recently are cached without an email
+        session = await SESSION_CACHE.get(api_key)
+        if session is None:
+            # Raised outside the app, where its exception handlers don't run
+            try:
+                async with get_session() as db_session:
+                    user = await find_user_by_api_key(db_session, api_key)
+            except ServiceOverloaded as e:
+                response = JSONResponse(status_code=503, content={'error': e.message}, headers={'Retry-After': '1'})
+                await response(scope, receive, send)
+                return
+
+            if user is None:
+                await SESSION_CACHE.set(api_key, {'email': None}, ttl=API_KEY_INVALID_TTL)
+            else:
+                session = {'email': user.email}
+                await SESSION_CACHE.set(api_key, session)
 
-        if (datetime.now() - api_key_usage[1]) < self._TIME_LIMIT and api_key_usage[0] >= self._REQUEST_LIMIT:
-            return JSONResponse(status_code=401, content={'Error': 'Rate Limit reached'})
+        if session is None or session['email'] is None:
+            await JSONResponse(status_code=401, content={'error': 'Invalid key'})(scope, receive, send)
+            return
 
-        if (datetime.now() - api_key_usage[1]) >= self._TIME_LIMIT and api_key_usage[0] >= self._REQUEST_LIMIT:
-            self.request_counter[api_key] = [0, datetime.now()]
+        scope.setdefault('state', {})['user_email'] = session['email']
+        await self.app(scope, receive, send)
 
-        if (datetime.now() - api_key_usage[1]) < self._TIME_LIMIT and api_key_usage[0] != 5:
-            self.request_counter[api_key][0] += 1
 
-        response = await call_next(request)
-        return response
+class RateLimitingMiddleware:
+    """
+    Limits each user to the quota of the rule matching the path, see ratelimit.RateLimiter.
+    The user is known when the api key has a cached session. Requests without a key,
+    with a key that failed or isn't cached yet are limited by client address, so
+    sending a new key per request doesn't get a new bucket
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        rule = RATE_LIMITER.match(scope['path']) if scope['type'] == 'http' else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = _header(scope, _API_KEY_HEADER)
+        session = await SESSION_CACHE.get(api_key) if api_key else None
+        if session is not None and session['email'] is not None:
+            identity = f"user:{session['email']}"
+        else:
+            client = scope.get('client')
+            identity = f"ip:{client[0] if client else ''}"
+
+        result = await RATE_LIMITER.hit(rule, identity)
+        if not result.allowed:
+            response = JSONResponse(status_code=429, content={'error': 'Rate Limit reached'}, headers=result.headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).update(result.headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
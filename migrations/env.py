@@ -0,0 +1,42 @@
+import asyncio
+
+from alembic import context
+from sqlalchemy.engine import Connection
+
+# Local
+from config import DB_ENGINE, DB_URI
+from db_models import Base
+
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """Emits the migration SQL without a database connection"""
+    context.configure(
+        url=DB_URI,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    """Runs the migrations over the application's async engine"""
+    async with DB_ENGINE.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await DB_ENGINE.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,36 @@
+"""Indexed api key digest on accounts_customuser
+
+Adds the api_key_digest column used to resolve an api key to its user with a
+single indexed fetch. Existing keys only have their argon2 hash stored so the
+digest can't be backfilled here, those keys stop authenticating until they
+are reissued with scripts.reissue_api_keys.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('accounts_customuser', sa.Column('api_key_digest', sa.String(64), nullable=True))
+    op.create_index(
+        'ix_accounts_customuser_api_key_digest',
+        'accounts_customuser',
+        ['api_key_digest'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_accounts_customuser_api_key_digest', table_name='accounts_customuser')
+    op.drop_column('accounts_customuser', 'api_key_digest')
@@ -0,0 +1,120 @@
+"""daily_pnl_rollup maintained by a trigger on dashboard_orders
+
+Closed orders are summed per user, UTC day of closed_at, ticker and order
+type. The trigger removes an order's old contribution and adds its new one
+on every insert, delete and relevant update, so writes made outside this API
+keep the rollup exact too. The table is backfilled from the existing orders;
+scripts/backfill_rollup.py rebuilds it on demand.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_pnl_rollup',
+        sa.Column('user_id', sa.String, sa.ForeignKey('accounts_customuser.email'), nullable=False),
+        sa.Column('day', sa.Date, nullable=False),
+        sa.Column('ticker', sa.String, nullable=False),
+        sa.Column('order_type', sa.String, nullable=False),
+        sa.Column('realised_pnl', sa.Float, nullable=False, server_default='0'),
+        sa.Column('trade_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('win_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('volume', sa.Float, nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('user_id', 'day', 'ticker', 'order_type'),
+    )
+
+    op.execute("""
+        CREATE FUNCTION daily_pnl_rollup_apply(
+            p_user_id text, p_closed_at timestamp, p_ticker text, p_order_type text,
+            p_realised_pnl double precision, p_dollar_amount double precision, p_sign integer
+        ) RETURNS void AS $$
+        BEGIN
+            INSERT INTO daily_pnl_rollup AS r
+                (user_id, day, ticker, order_type, realised_pnl, trade_count, win_count, volume)
+            VALUES (
+                p_user_id,
+                p_closed_at::date,
+                coalesce(p_ticker, ''),
+                coalesce(p_order_type, ''),
+                p_sign * coalesce(p_realised_pnl, 0),
+                p_sign,
+                CASE WHEN p_realised_pnl > 0 THEN p_sign ELSE 0 END,
+                p_sign * coalesce(p_dollar_amount, 0)
+            )
+            ON CONFLICT (user_id, day, ticker, order_type) DO UPDATE SET
+                realised_pnl = r.realised_pnl + EXCLUDED.realised_pnl,
+                trade_count = r.trade_count + EXCLUDED.trade_count,
+                win_count = r.win_count + EXCLUDED.win_count,
+                volume = r.volume + EXCLUDED.volume;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE FUNCTION dashboard_orders_rollup() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.closed_at IS NOT NULL THEN
+                PERFORM daily_pnl_rollup_apply(
+                    OLD.user_id, OLD.closed_at, OLD.ticker, OLD.order_type,
+                    OLD.realised_pnl, OLD.dollar_amount, -1
+                );
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.closed_at IS NOT NULL THEN
+                PERFORM daily_pnl_rollup_apply(
+                    NEW.user_id, NEW.closed_at, NEW.ticker, NEW.order_type,
+                    NEW.realised_pnl, NEW.dollar_amount, 1
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    op.execute("""
+        CREATE TRIGGER dashboard_orders_rollup_insert_delete
+        AFTER INSERT OR DELETE ON dashboard_orders
+        FOR EACH ROW EXECUTE FUNCTION dashboard_orders_rollup()
+    """)
+    op.execute("""
+        CREATE TRIGGER dashboard_orders_rollup_update
+        AFTER UPDATE OF user_id, closed_at, ticker, order_type, realised_pnl, dollar_amount ON dashboard_orders
+        FOR EACH ROW EXECUTE FUNCTION dashboard_orders_rollup()
+    """)
+
+    op.execute("""
+        INSERT INTO daily_pnl_rollup
+            (user_id, day, ticker, order_type, realised_pnl, trade_count, win_count, volume)
+        SELECT
+            user_id,
+            closed_at::date,
+            coalesce(ticker, ''),
+            coalesce(order_type, ''),
+            coalesce(sum(realised_pnl), 0),
+            count(*),
+            count(*) FILTER (WHERE realised_pnl > 0),
+            coalesce(sum(dollar_amount), 0)
+        FROM dashboard_orders
+        WHERE closed_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER dashboard_orders_rollup_update ON dashboard_orders')
+    op.execute('DROP TRIGGER dashboard_orders_rollup_insert_delete ON dashboard_orders')
+    op.execute('DROP FUNCTION dashboard_orders_rollup()')
+    op.execute('DROP FUNCTION daily_pnl_rollup_apply(text, timestamp, text, text, double precision, double precision, integer)')
+    op.drop_table('daily_pnl_rollup')
@@ -0,0 +1,87 @@
+"""Per user data version bumped on order and balance changes
+
+accounts_customuser.data_version versions the inputs of a user's analytics.
+Statement level triggers on dashboard_orders bump it once per statement for
+every user whose orders were inserted, updated or deleted, and a row trigger
+bumps it when the balance changes. cache.AnalyticsCache keys results on it so
+a stale result is never served, whichever service wrote the change.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'accounts_customuser',
+        sa.Column('data_version', sa.BigInteger, nullable=False, server_default='0'),
+    )
+
+    op.execute("""
+        CREATE FUNCTION dashboard_orders_bump_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM new_rows);
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM old_rows);
+            ELSE
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER dashboard_orders_version_insert
+        AFTER INSERT ON dashboard_orders REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION dashboard_orders_bump_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER dashboard_orders_version_update
+        AFTER UPDATE ON dashboard_orders REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION dashboard_orders_bump_version()
+    """)
+    op.execute("""
+        CREATE TRIGGER dashboard_orders_version_delete
+        AFTER DELETE ON dashboard_orders REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION dashboard_orders_bump_version()
+    """)
+
+    op.execute("""
+        CREATE FUNCTION accounts_customuser_bump_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.data_version := OLD.data_version + 1;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER accounts_customuser_version_balance
+        BEFORE UPDATE OF balance ON accounts_customuser
+        FOR EACH ROW WHEN (OLD.balance IS DISTINCT FROM NEW.balance)
+        EXECUTE FUNCTION accounts_customuser_bump_version()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER accounts_customuser_version_balance ON accounts_customuser')
+    op.execute('DROP FUNCTION accounts_customuser_bump_version()')
+    op.execute('DROP TRIGGER dashboard_orders_version_delete ON dashboard_orders')
+    op.execute('DROP TRIGGER dashboard_orders_version_update ON dashboard_orders')
+    op.execute('DROP TRIGGER dashboard_orders_version_insert ON dashboard_orders')
+    op.execute('DROP FUNCTION dashboard_orders_bump_version()')
+    op.drop_column('accounts_customuser', 'data_version')
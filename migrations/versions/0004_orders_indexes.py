@@ -0,0 +1,57 @@
+"""Composite and partial indexes on dashboard_orders
+
+Every query on dashboard_orders filters on user_id first, these indexes lead
+with it and follow the columns the endpoints filter and sort on:
+- (user_id, closed_at, order_id), period filters, the keyset ordering of
+  /portfolio/trades and the partial day edges read beside the rollup
+- (user_id, ticker, closed_at), ticker filters with or without a period
+- (user_id, created_at), open_start / open_end filters
+- (user_id, ticker, order_type) WHERE is_active, open positions, e.g. the
+  exposure allocation, without touching closed trades
+
+Indexes are built CONCURRENTLY so writes aren't blocked on a live table.
+Check they're used with python -m scripts.explain_indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ('ix_dashboard_orders_user_closed', ['user_id', 'closed_at', 'order_id'], None),
+    ('ix_dashboard_orders_user_ticker_closed', ['user_id', 'ticker', 'closed_at'], None),
+    ('ix_dashboard_orders_user_created', ['user_id', 'created_at'], None),
+    ('ix_dashboard_orders_user_open', ['user_id', 'ticker', 'order_type'], sa.text('is_active')),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(
+                name,
+                'dashboard_orders',
+                columns,
+                postgresql_where=where,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        op.execute('ANALYZE dashboard_orders')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='dashboard_orders', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,63 @@
+"""Don't bump data_version for unrealised_pnl mark updates
+
+The statement level update trigger of 0003 bumped data_version for every
+update on dashboard_orders, including the mark updates that only rewrite
+unrealised_pnl. Those are frequent, and every one locked the user's row and
+invalidated their cached analytics although no analytics read the column.
+The update branch now bumps only the users with a row that changed in another
+column. Transition tables rule out an UPDATE OF column list, so old and new
+rows are compared as jsonb without unrealised_pnl.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _bump_version(update: str) -> str:
+    return f"""
+        CREATE OR REPLACE FUNCTION dashboard_orders_bump_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM new_rows);
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM old_rows);
+            ELSE
+                {update}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+
+def upgrade() -> None:
+    op.execute(_bump_version("""
+                WITH changed AS (
+                    (SELECT to_jsonb(n) - 'unrealised_pnl' AS row FROM new_rows n
+                     EXCEPT ALL
+                     SELECT to_jsonb(o) - 'unrealised_pnl' FROM old_rows o)
+                    UNION ALL
+                    (SELECT to_jsonb(o) - 'unrealised_pnl' FROM old_rows o
+                     EXCEPT ALL
+                     SELECT to_jsonb(n) - 'unrealised_pnl' FROM new_rows n)
+                )
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT row ->> 'user_id' FROM changed);"""))
+
+
+def downgrade() -> None:
+    op.execute(_bump_version("""
+                UPDATE accounts_customuser SET data_version = data_version + 1
+                WHERE email IN (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows);"""))
@@ -1,11 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional, List
 from uuid import UUID
+from zoneinfo import ZoneInfo
 
 # Local
-from enums import OrderType, Metrics, Ticker, Intervals
+from arithemtic import ROLLING_METRICS
+from config import TRADES_PAGE_SIZE, TRADES_PAGE_MAX, EQUITY_CURVE_POINTS, EQUITY_CURVE_MAX_POINTS, \
+    ROLLING_WINDOW_MAX, DRAWDOWN_TOP, DRAWDOWN_TOP_MAX
+from enums import OrderType, Metrics, Ticker, Intervals, SortOrder, AllocationMode, AnalyticsOutput, CurveResolution
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 class Base(BaseModel):
     """
@@ -98,6 +102,23 @@ class TradeRequestBody(Base):
                                             description="Returns either LONG or SHORT orders.")
 
 
+class TradePageRequestBody(TradeRequestBody):
+    """
+    Trade filters plus keyset pagination over (closed_at, order_id).
+    Open trades, without closed_at, sort after closed ones.
+
+    Attributes:
+        limit (int): Maximum number of trades in the page.
+
+        cursor (Optional[str]): The X-Next-Cursor header of the previous page.
+
+        sort (SortOrder): asc for oldest closed first, desc for open and most recently closed first.
+    """
+    limit: int = Field(TRADES_PAGE_SIZE, ge=1, le=TRADES_PAGE_MAX, description="Maximum number of trades returned.")
+    cursor: Optional[str] = Field(None, description="X-Next-Cursor header of the previous page.")
+    sort: SortOrder = Field(SortOrder.ASC, description="Sort direction over (closed_at, order_id).")
+
+
 class Trade(Base):
     """
     Model representing a trade record.
@@ -143,17 +164,122 @@ class Trade(Base):
     order_type: Optional[OrderType] = Field(None, description="Indicates the order type: LONG or SHORT.")
 
 
+def known_timezone(value: str) -> str:
+    """Validates an IANA timezone name"""
+    try:
+        ZoneInfo(value)
+    except (ValueError, KeyError):
+        raise ValueError(f'Unknown timezone {value}')
+    return value
+
+
 class PeriodRequestBody(Base):
     close_start: Optional[datetime] = None
     close_end: Optional[datetime] = None
 
 
-class MetricRequestBody(PeriodRequestBody):
-    metric: Metrics
+class ProfitsRequestBody(PeriodRequestBody):
+    timezone: str = Field('UTC', description="IANA timezone the buckets are cut in, e.g. Europe/London")
+    fill_gaps: bool = Field(False, description="Includes intervals without closed trades as 0.")
+
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, value: str) -> str:
+        return known_timezone(value)
+
+
+class MetricRequestBody(ProfitsRequestBody):
+    metric: Optional[Metrics] = Field(None, description="A single metric, answered as {metric, value}.")
+    metrics: Optional[List[Metrics]] = Field(None, description="Several metrics, answered as {metrics: {name: value}}.")
     interval: Intervals
+    fill_gaps: bool = Field(True, description="Counts intervals without closed trades as a 0 return.")
+    risk_free: Optional[float] = Field(None, description="Risk free return per interval, defaults to arithemtic.RISK_FREE.")
+    benchmark: Optional[List[float]] = Field(None, description="Benchmark return per interval, required for the Treynor ratio.")
+
+    @model_validator(mode='after')
+    def validate_metrics(self):
+        if not self.metric and not self.metrics:
+            raise ValueError('metric or metrics is required')
+        return self
+
+class RollingMetricsRequestBody(ProfitsRequestBody):
+    metrics: List[Metrics] = Field(..., min_length=1, description=(
+        "Metrics to compute, std, sharpe, downside_std, sortino or expectancy."
+    ))
+    interval: Intervals = Field(Intervals.DAILY, description="Interval the returns are bucketed in.")
+    window: int = Field(..., ge=2, le=ROLLING_WINDOW_MAX, description="Number of intervals in each window, e.g. 30 days.")
+    min_periods: Optional[int] = Field(None, ge=1, description="Intervals needed for a value, defaults to window.")
+    fill_gaps: bool = Field(True, description="Counts intervals without closed trades as a 0 return.")
+    risk_free: Optional[float] = Field(None, description="Risk free return per interval, defaults to arithemtic.RISK_FREE.")
+
+    @field_validator('metrics')
+    @classmethod
+    def validate_metrics(cls, value: List[Metrics]) -> List[Metrics]:
+        unsupported = [m for m in value if Metrics(m) not in ROLLING_METRICS]
+        if unsupported:
+            raise ValueError(f"{', '.join(unsupported)} can't be computed over a rolling window")
+        return value
+
+
+class EquityCurveRequestBody(ProfitsRequestBody):
+    points: int = Field(EQUITY_CURVE_POINTS, ge=3, le=EQUITY_CURVE_MAX_POINTS,
+                        description="Longer curves are downsampled to this many points.")
+    resolution: CurveResolution = Field(CurveResolution.DAY, description=(
+        "day, one point per day from the daily rollup. trade, one point per closed trade."
+    ))
+    fill_gaps: bool = Field(False, description="Includes days without closed trades, day resolution only.")
+
+
+class DrawdownRequestBody(ProfitsRequestBody):
+    timezone: str = Field('UTC', description="IANA timezone the episode times are returned in, e.g. Europe/London")
+    top: int = Field(DRAWDOWN_TOP, ge=1, le=DRAWDOWN_TOP_MAX, description="Number of deepest drawdowns returned.")
+
+
+class CorrelationRequestBody(ProfitsRequestBody):
+    timezone: str = Field('UTC', description="IANA timezone the days are cut in, e.g. Europe/London")
+    fill_gaps: bool = Field(False, description=(
+        "Counts every day of the period as a row, by default only days with a closed trade are."
+    ))
+
+
+class DashboardRequestBody(Base):
+    timezone: str = Field('UTC', description="IANA timezone whose midnight starts today's pnl, e.g. Europe/London")
+
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, value: str) -> str:
+        return known_timezone(value)
+
 
 class IsActiveRequestBody(PeriodRequestBody):
-    is_active: bool = False
+    is_active: Optional[bool] = Field(None, description="Only open (true) or closed (false) trades, every trade by default.")
+
+
+class AllocationRequestBody(IsActiveRequestBody):
+    mode: AllocationMode = Field(AllocationMode.COUNT, description=(
+        "count: share of the number of trades, "
+        "exposure: share of dollar_amount in open positions, the period and is_active are ignored, "
+        "pnl: signed share of the absolute realised pnl"
+    ))
+    by_order_type: bool = Field(False, description="Splits each ticker's share by order type.")
+
+
+class AnalyticsRequestBody(ProfitsRequestBody):
+    """
+    Several analytics over one shared filter, answered from a single fetch.
+    Results cover the closed trades in the period, and the open trades too when
+    there is no period, as their own endpoints do. The exposure allocation
+    covers open positions
+    """
+    outputs: List[AnalyticsOutput] = Field(..., min_length=1, description="Results to compute.")
+    ticker: Optional[str] = Field(None, description="Only trades on this symbol (e.g., BTC-USDT).")
+    order_type: Optional[OrderType] = Field(None, description="Only trades of this order type.")
+    interval: Intervals = Field(Intervals.DAILY, description="Interval the metrics are computed over.")
+    metrics: Optional[List[Metrics]] = Field(None, description="Metrics to compute, defaults to all.")
+    risk_free: Optional[float] = Field(None, description="Risk free return per interval, defaults to arithemtic.RISK_FREE.")
+    benchmark: Optional[List[float]] = Field(None, description="Benchmark return per interval, required for the Treynor ratio.")
+    allocation_mode: AllocationMode = Field(AllocationMode.COUNT, description="See AllocationRequestBody.mode.")
+    by_order_type: bool = Field(False, description="Splits each ticker's allocation by order type.")
 
 
 class Balance(Base):
@@ -167,6 +293,60 @@ class AccountSummary(Balance, Pnl):
     pass
 
 
+class PriceTick(Base):
+    """A price for a ticker from the price feed, see pricing.PriceBook"""
+    ticker: Ticker
+    price: float = Field(..., gt=0, description="Latest traded price.")
+    ts: Optional[datetime] = Field(None, description="Time of the price, ticks older than the stored one are dropped.")
+
+    @field_validator('ts')
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Naive times are taken as UTC, so every tick's ts can be compared"""
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class OrderImport(Base):
+    """
+    An order row of a bulk import, see ingest.import_orders.
+    is_active defaults to whether closed_at is missing, timezone aware
+    datetimes are stored as naive UTC like the rest of dashboard_orders
+    """
+    order_id: UUID
+    user_id: Optional[str] = Field(None, description="Owner, the importing account when left out.")
+    ticker: str = Field(..., min_length=1)
+    dollar_amount: float = Field(..., gt=0)
+    realised_pnl: float = 0
+    unrealised_pnl: float = 0
+    open_price: float = Field(..., gt=0)
+    close_price: Optional[float] = Field(None, gt=0)
+    created_at: datetime
+    closed_at: Optional[datetime] = None
+    is_active: Optional[bool] = None
+    order_type: OrderType
+
+    @field_validator('created_at', 'closed_at')
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode='after')
+    def validate_status(self):
+        if self.is_active is None:
+            self.is_active = self.closed_at is None
+        if self.is_active and self.closed_at is not None:
+            raise ValueError('an active order can\'t have closed_at')
+        if not self.is_active and self.closed_at is None:
+            raise ValueError('a closed order needs closed_at')
+        if self.closed_at is not None and self.closed_at < self.created_at:
+            raise ValueError('closed_at is before created_at')
+        return self
+
+
 class OrderID(Base):
     order_id: Optional[str] = None
 
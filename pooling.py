@@ -0,0 +1,41 @@
+import time
+
+# SA
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool recording how long each checkout waits for a connection,
+    including opening one when the pool has room to grow, to size the pool
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - started
+            self.checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+    def recreate(self) -> 'TimedQueuePool':
+        pool = super().recreate()
+        pool.checkouts, pool._total_wait, pool._max_wait = self.checkouts, self._total_wait, self._max_wait
+        return pool
+
+    def stats(self) -> dict:
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'overflow': self.overflow(),
+            'checkouts': self.checkouts,
+            'avg_wait_ms': self._total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            'max_wait_ms': self._max_wait * 1000,
+        }
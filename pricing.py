@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import stat
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Set
+from uuid import uuid4
+
+import pydantic
+
+import redis.exceptions
+from redis.asyncio import Redis
+
+# Local
+from config import PRICE_BOOK_MAXSIZE, PRICE_FEED_CHANNEL, PRICE_MAX_AGE, REDIS_CLIENT
+from db_models import Orders, Users
+from dependencies import get_session
+from enums import OrderType
+from models import PriceTick
+
+# SA
+from sqlalchemy import Select, case, func, select
+
+
+@dataclass(slots=True)
+class Quote:
+    price: float
+    # Time of the price as sent by the feed, None when it sent none
+    ts: Optional[datetime]
+    received_at: float
+
+
+class PriceStore:
+    """
+    Latest price per ticker. A tick older than the stored one is dropped,
+    ticks without a time always replace the price. A price not updated
+    for max_age seconds is stale, 0 never makes one stale
+    """
+    def __init__(self, max_age: float = PRICE_MAX_AGE):
+        self.max_age = max_age
+        self._quotes: Dict[str, Quote] = {}
+
+        # Metrics
+        self.ticks = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def price(self, ticker: str) -> Optional[float]:
+        quote = self._quotes.get(ticker)
+        return quote.price if quote is not None else None
+
+    def update(self, ticker: str, price: float, ts: Optional[datetime] = None) -> bool:
+        """Stores the price, returns False when the tick was dropped as out of order"""
+        quote = self._quotes.get(ticker)
+        if quote is not None and ts is not None and quote.ts is not None and ts < quote.ts:
+            self.dropped += 1
+            return False
+
+        self._quotes[ticker] = Quote(price, ts, time.time())
+        self.ticks += 1
+        return True
+
+    def is_stale(self, quote: Quote) -> bool:
+        return bool(self.max_age) and time.time() - quote.received_at > self.max_age
+
+    def any_stale(self, tickers: Iterable[str]) -> bool:
+        """True when one of the tickers' prices is stale, tickers without one are ignored"""
+        for ticker in tickers:
+            quote = self._quotes.get(ticker)
+            if quote is not None and self.is_stale(quote):
+                return True
+        return False
+
+    def quotes(self) -> Dict[str, Quote]:
+        return dict(self._quotes)
+
+
+@dataclass(slots=True)
+class Position:
+    """
+    Net open exposure of a user in a ticker, long minus short.
+    Unrealised pnl at a price is price * units - cost, as each order's is
+    dollar_amount * (price / open_price - 1), negated for shorts
+    """
+    units: float
+    cost: float
+
+    def value(self, price: float) -> float:
+        return price * self.units - self.cost
+
+
+@dataclass(slots=True)
+class UserBook:
+    data_version: int
+    positions: Dict[str, Position]
+    unrealised: float = 0.0
+    # Held tickers without a price yet
+    unpriced: Set[str] = field(default_factory=set)
+
+
+def positions_query(email: str) -> Select:
+    """Net units and cost per ticker of the user's open orders"""
+    sign = case((Orders.order_type == OrderType.SHORT.value, -1.0), else_=1.0)
+    return (
+        select(
+            Orders.ticker,
+            func.sum(sign * Orders.dollar_amount / Orders.open_price).label('units'),
+            func.sum(sign * Orders.dollar_amount).label('cost'),
+        )
+        .where(Orders.user_id == email, Orders.is_active == True, Orders.open_price > 0)
+        .group_by(Orders.ticker)
+    )
+
+
+class PriceBook:
+    """
+    Open exposure per user and ticker, marked to market with the PriceStore's prices.
+    - A user's book is loaded from their open orders on first use and reloaded
+      when their data_version changes, so order writes are picked up
+    - A tick moves the unrealised pnl of each user holding the ticker by
+      (new price - old price) * units, orders aren't read again
+    - At most maxsize books are kept, the least recently read is evicted first
+    Prices and books are per process, ticks reach every worker through
+    publish_ticks and start_fanout
+    """
+    def __init__(self, prices: PriceStore, maxsize: int = PRICE_BOOK_MAXSIZE):
+        self.prices = prices
+        self.maxsize = maxsize
+        self._books: OrderedDict[str, UserBook] = OrderedDict()
+        # ticker -> emails of the books holding it
+        self._holders: Dict[str, Set[str]] = defaultdict(set)
+
+        # Metrics
+        self.loads = 0
+        self.reads = 0
+
+    def apply(self, ticker: str, price: float, ts: Optional[datetime] = None) -> bool:
+        """Stores the tick and revalues the books holding the ticker, False when it was dropped"""
+        previous = self.prices.price(ticker)
+        if not self.prices.update(ticker, price, ts):
+            return False
+
+        for email in self._holders.get(ticker, ()):
+            book = self._books[email]
+            position = book.positions[ticker]
+            if previous is None:
+                book.unpriced.discard(ticker)
+                book.unrealised += position.value(price)
+            else:
+                book.unrealised += (price - previous) * position.units
+        return True
+
+    def apply_tick(self, tick: PriceTick) -> bool:
+        return self.apply(tick.ticker, tick.price, tick.ts)
+
+    async def unrealised_pnl(self, user: Users) -> Optional[float]:
+        """
+        The user's unrealised pnl at the latest prices,
+        None while a ticker they hold has no price or a stale one
+        """
+        self.reads += 1
+        book = self._books.get(user.email)
+        if book is None or book.data_version != user.data_version:
+            book = await self._load(user)
+        else:
+            self._books.move_to_end(user.email)
+        return None if book.unpriced or self.prices.any_stale(book.positions) else book.unrealised
+
+    async def _load(self, user: Users) -> UserBook:
+        async with get_session() as session:
+            rows = (await session.execute(positions_query(user.email))).all()
+        self.loads += 1
+
+        # Valued once the rows are in, so ticks during the query aren't missed
+        book = UserBook(user.data_version, {row.ticker: Position(row.units, row.cost) for row in rows})
+        for ticker, position in book.positions.items():
+            price = self.prices.price(ticker)
+            if price is None:
+                book.unpriced.add(ticker)
+            else:
+                book.unrealised += position.value(price)
+
+        self._discard(user.email)
+        self._books[user.email] = book
+        for ticker in book.positions:
+            self._holders[ticker].add(user.email)
+        while len(self._books) > self.maxsize:
+            self._discard(next(iter(self._books)))
+        return book
+
+    def _discard(self, email: str) -> None:
+        book = self._books.pop(email, None)
+        if book is None:
+            return
+        for ticker in book.positions:
+            self._holders[ticker].discard(email)
+
+    def stats(self) -> dict:
+        return {
+            'ticks': self.prices.ticks,
+            'dropped': self.prices.dropped,
+            'rejected': self.prices.rejected,
+            'books': len(self._books),
+            'loads': self.loads,
+            'reads': self.reads,
+        }
+
+
+# Marks this process' messages on PRICE_FEED_CHANNEL, it applied those ticks before publishing
+_ORIGIN = uuid4().hex
+# Seconds before subscribing again after losing Redis
+_RESUBSCRIBE_DELAY = 1.0
+
+
+async def publish_ticks(ticks: Sequence[PriceTick], client: Redis = REDIS_CLIENT) -> None:
+    """
+    Publishes ticks this worker applied so every other worker applies them too.
+    Lost while Redis is unreachable, the other workers' prices then go stale
+    """
+    payload = json.dumps({'origin': _ORIGIN, 'ticks': [tick.model_dump(mode='json') for tick in ticks]})
+    try:
+        await client.publish(PRICE_FEED_CHANNEL, payload)
+    except redis.exceptions.RedisError:
+        pass
+
+
+async def _subscribe(client: Redis, channel: str) -> None:
+    """Applies the ticks other workers publish, subscribing again after Redis errors"""
+    while True:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            async for message in pubsub.listen():
+                try:
+                    payload = json.loads(message['data'])
+                    if payload['origin'] == _ORIGIN:
+                        continue
+                    for tick in payload['ticks']:
+                        PRICE_BOOK.apply_tick(PriceTick.model_validate(tick))
+                # Includes pydantic.ValidationError
+                except (ValueError, KeyError, TypeError):
+                    PRICE_STORE.rejected += 1
+        except redis.exceptions.RedisError:
+            await asyncio.sleep(_RESUBSCRIBE_DELAY)
+        finally:
+            await pubsub.aclose()
+
+
+def start_fanout(client: Redis = REDIS_CLIENT) -> asyncio.Task:
+    """Subscribes this worker to the ticks received by the others, cancel the task to stop"""
+    return asyncio.ensure_future(_subscribe(client, PRICE_FEED_CHANNEL))
+
+
+async def _read_feed(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Applies each JSON line from a feed connection as a PriceTick and publishes it
+    to the other workers, malformed lines are skipped
+    """
+    try:
+        while line := await reader.readline():
+            try:
+                tick = PriceTick.model_validate_json(line)
+            except pydantic.ValidationError:
+                PRICE_STORE.rejected += 1
+                continue
+            PRICE_BOOK.apply_tick(tick)
+            await publish_ticks([tick])
+    finally:
+        writer.close()
+
+
+async def start_feed(path: str) -> asyncio.AbstractServer:
+    """
+    Listens for JSON line ticks on a unix socket, access is left to the socket's permissions.
+    With several workers the last to start holds the socket and publishes its ticks to the rest
+    """
+    # A socket left by a previous run, or bound by another worker
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+    return await asyncio.start_unix_server(_read_feed, path=path)
+
+
+PRICE_STORE = PriceStore()
+PRICE_BOOK = PriceBook(PRICE_STORE)
@@ -0,0 +1,142 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import redis.exceptions
+from redis.asyncio import Redis
+
+# Local
+from cache import LRUCache
+from config import REDIS_CLIENT, RATE_LIMIT_RULES, RATE_LIMIT_LOCAL_MAXSIZE
+
+
+# Token bucket refilled continuously, the bucket is a hash of tokens and
+# last refill time in ms. Redis' clock is used so every worker and node agrees
+_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, tostring(tokens)}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """limit requests per period seconds for paths starting with prefix"""
+    prefix: str
+    limit: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens refilled per millisecond"""
+        return self.limit / (self.period * 1000)
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: float
+    rate: float
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds until a token is available"""
+        return 0 if self.allowed else math.ceil((1 - self.remaining) / self.rate / 1000)
+
+    @property
+    def reset(self) -> int:
+        """Seconds until the bucket is full again"""
+        return math.ceil((self.limit - self.remaining) / self.rate / 1000)
+
+    @property
+    def headers(self) -> dict:
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(max(int(self.remaining), 0)),
+            'X-RateLimit-Reset': str(self.reset),
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter shared across workers through one atomic Redis script.
+    - Rules are matched on the longest path prefix
+    - If Redis is unreachable the limiter falls back to local buckets,
+      held in a bounded LRU, and retries Redis after fallback_cooldown seconds
+    """
+    def __init__(self, client: Redis, rules: List[RateLimitRule],
+                 local_maxsize: int = 10000, fallback_cooldown: float = 5):
+        self.client = client
+        self.rules = sorted(rules, key=lambda rule: len(rule.prefix), reverse=True)
+        self.local = LRUCache(maxsize=local_maxsize)
+        self.fallback_cooldown = fallback_cooldown
+        self._script = client.register_script(_TOKEN_BUCKET)
+        self._redis_down_until = 0.0
+
+    def match(self, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if path.startswith(rule.prefix):
+                return rule
+        return None
+
+    async def hit(self, rule: RateLimitRule, identity: str) -> RateLimitResult:
+        """Takes one token from identity's bucket for the rule"""
+        key = f'ratelimit:{rule.prefix}:{identity}'
+
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                allowed, tokens = await self._script(keys=[key], args=[rule.limit, rule.rate])
+                return RateLimitResult(bool(allowed), rule.limit, float(tokens), rule.rate)
+            except redis.exceptions.RedisError:
+                self._redis_down_until = time.monotonic() + self.fallback_cooldown
+
+        return self._local_hit(rule, key)
+
+    def _local_hit(self, rule: RateLimitRule, key: str) -> RateLimitResult:
+        now = time.monotonic() * 1000
+        tokens, ts = self.local.get(key) or (rule.limit, now)
+        tokens = min(rule.limit, tokens + (now - ts) * rule.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self.local.set(key, (tokens, now), ttl=rule.period)
+        return RateLimitResult(allowed, rule.limit, tokens, rule.rate)
+
+
+def parse_rules(spec: str) -> List[RateLimitRule]:
+    """
+    Parses rules in the form 'prefix=limit/period,...'
+    e.g. '/portfolio=30/60,/portfolio/trades=10/60'
+    """
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        prefix, _, quota = item.partition('=')
+        limit, _, period = quota.partition('/')
+        rules.append(RateLimitRule(prefix.strip(), int(limit), float(period or 60)))
+    return rules
+
+
+RATE_LIMITER = RateLimiter(REDIS_CLIENT, parse_rules(RATE_LIMIT_RULES), local_maxsize=RATE_LIMIT_LOCAL_MAXSIZE)
@@ -0,0 +1,28 @@
+from typing import Any
+from uuid import UUID
+
+import orjson
+
+# FastAPI
+from fastapi import responses
+
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any) -> str:
+    # asyncpg returns its own UUID subclass, which orjson only serialises through default
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes of content, dataclasses, datetimes, UUIDs and numpy values included"""
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class ORJSONResponse(responses.ORJSONResponse):
+    """FastAPI's ORJSONResponse rendering through dumps"""
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,173 @@
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+# Local
+from config import ROLLUP_ENABLED
+from db_models import DailyPnlRollup, Orders
+from models import TradeRequestBody
+
+# SA
+from sqlalchemy import Date, Select, Subquery, cast, delete, func, insert, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# Filters the rollup can answer, anything else needs the raw orders
+_ROLLUP_FILTERS = {'is_active', 'ticker', 'order_type', 'close_start', 'close_end'}
+
+
+def rollup_eligible(trade_details: Optional[TradeRequestBody]) -> bool:
+    """
+    True when the matching closed trades can be read from daily_pnl_rollup,
+    i.e. only the period, ticker and order type are filtered on and open
+    trades aren't asked for on their own
+    """
+    if not ROLLUP_ENABLED:
+        return False
+    if trade_details is None:
+        return True
+    if trade_details.is_active:
+        return False
+    return all(
+        getattr(trade_details, field) is None
+        for field in TradeRequestBody.model_fields
+        if field not in _ROLLUP_FILTERS
+    )
+
+
+Period = Tuple[Optional[datetime], Optional[datetime]]
+
+
+def _split_period(start: Optional[datetime], end: Optional[datetime]) -> Tuple[Optional[Period], List[Period]]:
+    """
+    Splits [start, end] into the whole UTC days the rollup covers, as [first, last)
+    midnights or None when there are none, and the partial days at either edge
+    which are aggregated from orders
+    """
+    first = None
+    if start is not None:
+        first = datetime.combine(start.date(), time())
+        if start != first:
+            first += timedelta(days=1)
+    last = datetime.combine(end.date(), time()) if end is not None else None
+
+    if first is not None and last is not None and first >= last:
+        return None, [(start, end)]
+
+    edges = []
+    if start is not None and start != first:
+        edges.append((start, first))
+    if end is not None:
+        edges.append((last, end))
+    return (first, last), edges
+
+
+def _raw_daily(user_id: str, trade_details: Optional[TradeRequestBody],
+               start: Optional[datetime], end: Optional[datetime], end_inclusive: bool) -> Select:
+    """Closed orders in [start, end) (or [start, end]) summed like the rollup"""
+    day = cast(Orders.closed_at, Date).label('day')
+    ticker = func.coalesce(Orders.ticker, '').label('ticker')
+    order_type = func.coalesce(Orders.order_type, '').label('order_type')
+    query = (
+        select(
+            day,
+            ticker,
+            order_type,
+            func.coalesce(func.sum(Orders.realised_pnl), 0).label('realised_pnl'),
+            func.count().label('trade_count'),
+            func.count().filter(Orders.realised_pnl > 0).label('win_count'),
+            func.coalesce(func.sum(Orders.dollar_amount), 0).label('volume'),
+        )
+        .where((Orders.user_id == user_id) & (Orders.closed_at != None))
+        .group_by(day, ticker, order_type)
+    )
+    if start is not None:
+        query = query.where(Orders.closed_at >= start)
+    if end is not None:
+        query = query.where(Orders.closed_at <= end if end_inclusive else Orders.closed_at < end)
+    if trade_details is not None and trade_details.ticker is not None:
+        query = query.where(Orders.ticker == trade_details.ticker)
+    if trade_details is not None and trade_details.order_type is not None:
+        query = query.where(Orders.order_type == trade_details.order_type)
+    return query
+
+
+def closed_daily_source(user_id: str, trade_details: Optional[TradeRequestBody]) -> Subquery:
+    """
+    Subquery of (day, ticker, order_type, realised_pnl, trade_count, win_count, volume)
+    over the user's closed trades matching trade_details. Whole days are read from
+    the rollup, partial days at the period's edges from dashboard_orders, so the
+    totals match a scan of the orders exactly
+    """
+    start = trade_details.close_start if trade_details is not None else None
+    end = trade_details.close_end if trade_details is not None else None
+    whole_days, edges = _split_period(start, end)
+
+    parts = []
+    if whole_days is not None:
+        first, last = whole_days
+        rollup = select(
+            DailyPnlRollup.day,
+            DailyPnlRollup.ticker,
+            DailyPnlRollup.order_type,
+            DailyPnlRollup.realised_pnl,
+            DailyPnlRollup.trade_count,
+            DailyPnlRollup.win_count,
+            DailyPnlRollup.volume,
+        ).where(DailyPnlRollup.user_id == user_id)
+        if first is not None:
+            rollup = rollup.where(DailyPnlRollup.day >= first.date())
+        if last is not None:
+            rollup = rollup.where(DailyPnlRollup.day < last.date())
+        if trade_details is not None and trade_details.ticker is not None:
+            rollup = rollup.where(DailyPnlRollup.ticker == trade_details.ticker)
+        if trade_details is not None and trade_details.order_type is not None:
+            rollup = rollup.where(DailyPnlRollup.order_type == trade_details.order_type)
+        parts.append(rollup)
+
+    for edge_start, edge_end in edges:
+        parts.append(_raw_daily(user_id, trade_details, edge_start, edge_end, end_inclusive=edge_end == end))
+
+    return union_all(*parts).subquery('closed_daily') if len(parts) > 1 else parts[0].subquery('closed_daily')
+
+
+async def backfill(session: AsyncSession, user_id: str = None) -> int:
+    """
+    Rebuilds the rollup from dashboard_orders, for one user or everyone.
+    Writes to dashboard_orders are blocked until the transaction commits
+    so the trigger and the rebuild can't double count
+    """
+    await session.execute(text('LOCK TABLE dashboard_orders IN SHARE MODE'))
+
+    clear = delete(DailyPnlRollup)
+    if user_id is not None:
+        clear = clear.where(DailyPnlRollup.user_id == user_id)
+    await session.execute(clear)
+
+    day = cast(Orders.closed_at, Date)
+    ticker = func.coalesce(Orders.ticker, '')
+    order_type = func.coalesce(Orders.order_type, '')
+    rows = (
+        select(
+            Orders.user_id,
+            day,
+            ticker,
+            order_type,
+            func.coalesce(func.sum(Orders.realised_pnl), 0),
+            func.count(),
+            func.count().filter(Orders.realised_pnl > 0),
+            func.coalesce(func.sum(Orders.dollar_amount), 0),
+        )
+        .where(Orders.closed_at != None)
+        .group_by(Orders.user_id, day, ticker, order_type)
+    )
+    if user_id is not None:
+        rows = rows.where(Orders.user_id == user_id)
+
+    result = await session.execute(
+        insert(DailyPnlRollup).from_select(
+            ['user_id', 'day', 'ticker', 'order_type', 'realised_pnl', 'trade_count', 'win_count', 'volume'],
+            rows,
+        )
+    )
+    await session.commit()
+    return result.rowcount
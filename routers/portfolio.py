@@ -1,32 +1,44 @@
-import json
-from datetime import datetime, timedelta
+import asyncio
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import List, Optional
-from dateutil import parser
+from zoneinfo import ZoneInfo
+
+import numpy as np
 
 # SA
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, insert
 import sqlalchemy.exc
 
-from arithemtic import sharpe, sortino, std
-from config import REDIS_CLIENT
+from analytics import ALLOCATION_VALUES, DrawdownEngine, compute_analytics, equity_curve
+from arithemtic import compute_metrics, covariance_correlation, rolling_metrics
+from cache import ANALYTICS_CACHE
+from config import DRAWDOWN_BATCH_SIZE, DASHBOARD_TIMEOUT, DASHBOARD_TRADES
 # Local
-from dependencies import get_session, hash_api_key, get_session_2, get_user
-from enums import Metrics
-from utils import get_trades
+from dependencies import get_session, get_session_2, get_user, task_session
+from enums import Intervals, AllocationMode, ImportFormat, CurveResolution, SortOrder
+from aggregation import Series, aggregate, allocation, bucket_label, day_matrix, to_dict, to_local
+from utils import get_trade_rows, get_trade_columns, get_trade_page, stream_trade_rows, trade_records, \
+    TradeRecord, get_bucketed_pnl, get_trade_totals, get_daily_totals, stream_closed_pnl, \
+    get_ticker_daily_pnl
 from db_models import Users, Watchlist
 
 # FastAPI
-from fastapi import APIRouter, Depends, Request, Header, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import StreamingResponse
 
 from exceptions import DoesNotExist
+from responses import ORJSONResponse, dumps
+from pricing import PRICE_BOOK
+from ingest import import_orders, split_lines
 from models import TradeRequestBody, Trade, PeriodRequestBody, MetricRequestBody, \
-    IsActiveRequestBody, AccountSummary, OrderID, WatchlistItem
+    IsActiveRequestBody, AccountSummary, OrderID, WatchlistItem, ProfitsRequestBody, TradePageRequestBody, \
+    AllocationRequestBody, AnalyticsRequestBody, EquityCurveRequestBody, RollingMetricsRequestBody, \
+    DrawdownRequestBody, CorrelationRequestBody, DashboardRequestBody
 
 
 # Initialise
-portfolio = APIRouter(prefix='/portfolio', tags=['portfolio'])
+portfolio = APIRouter(prefix='/portfolio', tags=['portfolio'], default_response_class=ORJSONResponse)
 
 
 @portfolio.get("/balance")
@@ -35,7 +47,7 @@ async def get_balance(user: Users = Depends(get_user)):
     Returns the balance for the account
     """
     try:
-        return JSONResponse(status_code=200, content={'balance': user.balance})
+        return ORJSONResponse(status_code=200, content={'balance': user.balance})
     except DoesNotExist:
         raise
     except Exception as e:
@@ -43,227 +55,352 @@ async def get_balance(user: Users = Depends(get_user)):
         raise
 
 
-@portfolio.post('/trades', response_model=List[Trade], summary="Returns a list of trades")
-async def return_trades(body: Optional[TradeRequestBody] = None, user: Users = Depends(get_user)):
+@portfolio.post('/trades', response_model=List[Trade], summary="Returns a page of trades")
+async def return_trades(body: Optional[TradePageRequestBody] = None, user: Users = Depends(get_user)):
     """
-    Returns a list of trades for the account
+    Returns a page of trades for the account, sorted on (closed_at, order_id).
+    When more trades match the X-Next-Cursor header holds the cursor of the next page
     """
     try:
-        trades = await get_trades(user, body)
-        return [Trade(**item) for item in trades]
+        rows, next_cursor = await get_trade_page(user, body or TradePageRequestBody())
+        return ORJSONResponse(
+            status_code=200,
+            content=trade_records(rows),
+            headers={'X-Next-Cursor': next_cursor} if next_cursor else None,
+        )
     except Exception as e:
         print(type(e), str(e))
         raise
 
 
-@portfolio.post('/asset-allocation')
-async def return_asset_allocation(body: IsActiveRequestBody, user: Users = Depends(get_user)):
+@portfolio.post('/trades/stream', summary="Streams every matching trade as NDJSON")
+async def stream_trades(body: Optional[TradePageRequestBody] = None, user: Users = Depends(get_user)):
     """
-    Returns the percentage share in number of trades per each currency.
-    Future: Percentage share of dollar_amount, for example if user has 10k in open position
-                dollar amounts. BTC-USDT has 6000 , SOL-USDT has 3000 and ETH-USDT has 1000
-                {
-                    BTC-USDT: 60% and so forth
-                }
+    Streams every matching trade, one JSON object per line, through a
+    server side cursor. limit is ignored, cursor and sort apply
     """
-    try:
-        trades = await get_trades(user, TradeRequestBody(**vars(body)))
+    async def lines():
+        async for row in stream_trade_rows(user, body or TradePageRequestBody()):
+            yield dumps(TradeRecord(*row)) + b'\n'
 
-        # Counting occurrence of ticker
-        ticker_occurrences = [
-            (sum(1 for trade2 in trades if trade2.get('ticker', None) == ticker), ticker)
-            for ticker in set(trade['ticker'] for trade in trades)
-        ]
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
 
-        # Calculating percentage
-        amount_of_trades = len(trades)
-        percentage = {
-            item[1]: (item[0] / amount_of_trades) * 100
-            for item in ticker_occurrences
+
+@portfolio.post('/orders/import', summary="Bulk imports orders from CSV or NDJSON")
+async def import_trades(request: Request, format: Optional[ImportFormat] = None, user: Users = Depends(get_user)):
+    """
+    Streams the body's orders into the account, see models.OrderImport for the fields.
+    The format is taken from the format query parameter, otherwise the Content-Type,
+    text/csv for CSV with a header line and NDJSON for anything else.
+    Orders already stored are skipped, the counts and rows per second are returned.
+    - 413, a line is longer than IMPORT_MAX_LINE bytes, the orders before it are imported
+    """
+    if format is None:
+        csv_body = request.headers.get('content-type', '').startswith('text/csv')
+        format = ImportFormat.CSV if csv_body else ImportFormat.NDJSON
+
+    result = await import_orders(split_lines(request.stream()), format, owner=user.email)
+    return ORJSONResponse(status_code=413 if result.truncated else 200, content=result.to_dict())
+
+
+@portfolio.post('/asset-allocation')
+async def return_asset_allocation(body: AllocationRequestBody, user: Users = Depends(get_user)):
+    """
+    Returns the percentage share per ticker, e.g. with 10k in open positions of which
+    BTC-USDT has 6000, SOL-USDT 3000 and ETH-USDT 1000, exposure mode gives
+        {
+            BTC-USDT: 60, SOL-USDT: 30, ETH-USDT: 10
         }
-        return JSONResponse(status_code=200, content=percentage)
+    - count, share of the number of trades
+    - exposure, share of dollar_amount in open positions
+    - pnl, share of realised pnl, signed and relative to the absolute total
+    With by_order_type each ticker maps to the shares of its order types instead
+    """
+    async def compute():
+        if body.mode == AllocationMode.EXPOSURE:
+            trade_details = TradeRequestBody(is_active=True)
+        else:
+            trade_details = TradeRequestBody(**vars(body))
+        group_by = ['ticker', 'order_type'] if body.by_order_type else ['ticker']
+        totals = await get_trade_totals(user, trade_details, group_by=group_by)
+
+        # Calculating percentage
+        column = ALLOCATION_VALUES[AllocationMode(body.mode)]
+        return allocation(
+            ((row.ticker, getattr(row, 'order_type', None), getattr(row, column)) for row in totals),
+            body.by_order_type,
+        )
+
+    try:
+        percentage = await ANALYTICS_CACHE.get_or_compute(user, 'asset-allocation', body, compute)
+        return ORJSONResponse(status_code=200, content=percentage)
     except Exception:
         raise
 
 
 @portfolio.post("/profits")
-async def return_asset_allocation(body: PeriodRequestBody = None, user: Users = Depends(get_user)):
+async def return_profits(body: PeriodRequestBody = None, user: Users = Depends(get_user)):
     """Returns the total unrealised and realised profit for the period of time"""
+    async def compute():
+        totals, = await get_trade_totals(user, TradeRequestBody(**vars(body)) if body else None)
+        return {'realised_pnl': totals.realised_pnl}
+
     try:
-        trades = await get_trades(user, TradeRequestBody(**vars(body)) if body else None)
-        return JSONResponse(status_code=200, content={
-            'realised_pnl': sum(trade.get('realised_pnl', 0) for trade in trades)
-        })
+        return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'profits', body, compute))
     except Exception:
         raise
 
 
+async def _pnl_series(interval: Intervals, body: Optional[ProfitsRequestBody], user: Users) -> Series:
+    """Realised pnl per interval, summed in SQL and ordered (and gap filled) by aggregation"""
+    body = body or ProfitsRequestBody()
+    buckets = await get_bucketed_pnl(user, interval, body, body.timezone)
+    return aggregate(
+        buckets,
+        interval,
+        fill_gaps=body.fill_gaps,
+        start=to_local(body.close_start, body.timezone) if body.close_start else None,
+        end=to_local(body.close_end, body.timezone) if body.close_end else None,
+    )
+
+
+async def _bucketed_profits(interval: Intervals, body: Optional[ProfitsRequestBody], user: Users) -> ORJSONResponse:
+    """Returns only the buckets of realised pnl per interval"""
+    async def compute():
+        return to_dict(await _pnl_series(interval, body, user), interval)
+
+    content = await ANALYTICS_CACHE.get_or_compute(user, f'profits/{interval.name.lower()}', body, compute)
+    return ORJSONResponse(status_code=200, content=content)
+
+
 @portfolio.post("/profits/daily")
-async def return_daily_profits(api_key: str = Depends(hash_api_key), body: PeriodRequestBody = None, user: Users = Depends(get_user)):
+async def return_daily_profits(body: ProfitsRequestBody = None, user: Users = Depends(get_user)):
     """
     Returns the daily accumulated realised pnl for each day within the desired period
+    :param: ProfitsRequestBody
     """
     try:
-        body = vars(body)
-        trades = await get_trades(user, TradeRequestBody(**body) if body else None)
-
-        unique_dates = set(parser.parse(item['closed_at']).date() for item in trades)
-        daily_profits = {
-            str(date): sum(trade['realised_pnl']
-            for trade in trades
-            if parser.parse(trade['closed_at']).date() == date)
-            for date in unique_dates
-        }
+        return await _bucketed_profits(Intervals.DAILY, body, user)
+    except Exception:
+        raise
+
 
-        return JSONResponse(status_code=200, content=daily_profits)
+@portfolio.post("/profits/weekly")
+async def return_weekly_profits(body: ProfitsRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns the accumulated realised pnl per week in the desired period,
+    keyed by the Monday each week starts on
+    :param: ProfitsRequestBody
+    """
+    try:
+        return await _bucketed_profits(Intervals.WEEKLY, body, user)
     except Exception:
         raise
 
 
 @portfolio.post("/profits/monthly")
-async def return_monthly_profits(body: PeriodRequestBody = None, user: Users = Depends(get_user)):
+async def return_monthly_profits(body: ProfitsRequestBody = None, user: Users = Depends(get_user)):
     """
     Returns the accumulated realised pnl per month in the desired period
-    :param: PeriodRequestBody
+    :param: ProfitsRequestBody
     """
     try:
-        trades = await get_trades(user, TradeRequestBody(**vars(body)) if body else None)
-
-        unique_dates = set(
-            (parser.parse(item['closed_at']).year, parser.parse(item['closed_at']).month) for item in trades
-        )
-        monthly_profits = {
-            str(date): 0
-            for date in unique_dates
-        }
+        return await _bucketed_profits(Intervals.MONTHLY, body, user)
+    except Exception:
+        raise
 
-        for trade in trades:
-            closed_at = parser.parse(trade['closed_at'])
-            date = (closed_at.year, closed_at.month)
-            if date in unique_dates:
-                monthly_profits[str(date)] += trade['realised_pnl']
 
-        monthly_profits = {
-            key.replace("(", "").replace(")", "").replace(", ", "-"): value
-            for key, value in monthly_profits.items()
-        }
-
-        return JSONResponse(status_code=200, content=monthly_profits)
+@portfolio.post("/profits/quarterly")
+async def return_quarterly_profits(body: ProfitsRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns the accumulated realised pnl per quarter in the desired period
+    :param: ProfitsRequestBody
+    """
+    try:
+        return await _bucketed_profits(Intervals.QUARTERLY, body, user)
     except Exception:
         raise
 
+
 @portfolio.post("/profits/yearly")
-async def return_yearly_profits(body: PeriodRequestBody = None, user: Users = Depends(get_user)):
+async def return_yearly_profits(body: ProfitsRequestBody = None, user: Users = Depends(get_user)):
     """
     Returns the accumulated realised pnl per year in the desired period
-    :param: PeriodRequestBody
+    :param: ProfitsRequestBody
     """
     try:
-        trades = await get_trades(user, TradeRequestBody(**vars(body)) if body else None)
-        unique_dates = set(parser.parse(item['closed_at']).year for item in trades)
-        yearly_profits = {
-            str(date): 0
-            for date in unique_dates
-        }
+        return await _bucketed_profits(Intervals.YEARLY, body, user)
+    except Exception:
+        raise
+
+
+async def _balance_at(user: Users, close_end: Optional[datetime]) -> float:
+    """The balance at the end of a period, without the pnl realised after it"""
+    realised_since = 0.0
+    if close_end is not None:
+        totals = await get_trade_totals(user, TradeRequestBody(close_start=close_end))
+        realised_since = totals[0].realised_pnl if totals else 0.0
+    return (user.balance or 0) - realised_since
+
+
+@portfolio.post("/equity-curve")
+async def return_equity_curve(body: EquityCurveRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns the cumulative realised pnl and the balance over time, oldest first, as
+    {time, cumulative_pnl, balance} columns. Balances assume it only moved with realised pnl.
+    Curves longer than body.points are downsampled with LTTB, which keeps peaks and troughs
+    """
+    body = body or EquityCurveRequestBody()
+
+    async def compute():
+        if body.resolution == CurveResolution.DAY:
+            series = await _pnl_series(Intervals.DAILY, body, user)
+            times = np.array([start for start, _ in series], dtype='datetime64[us]')
+            pnl = np.array([value for _, value in series], dtype=np.float64)
+            timezone = None  # Days are already local
+        else:
+            columns = await get_trade_columns(
+                user,
+                TradeRequestBody(is_active=False, close_start=body.close_start, close_end=body.close_end),
+                ['closed_at', 'realised_pnl'],
+            )
+            closed = ~np.isnat(columns['closed_at'])
+            order = np.argsort(columns['closed_at'][closed], kind='stable')
+            times = columns['closed_at'][closed][order]
+            pnl = np.nan_to_num(columns['realised_pnl'][closed][order])
+            timezone = body.timezone
+
+        return equity_curve(times, pnl, await _balance_at(user, body.close_end), body.points, timezone)
 
-        for trade in trades:
-            year = parser.parse(trade['closed_at']).year
-            yearly_profits[str(year)] += trade['realised_pnl']
+    return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'equity_curve', body, compute))
 
-        yearly_profits = {
-            key.replace("(", "").replace(")", "").replace(", ", "-"): value
-            for key, value in yearly_profits.items()
+
+@portfolio.post("/drawdowns")
+async def return_drawdowns(body: DrawdownRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns the drawdowns of the cumulative realised pnl, trade by trade:
+    - Max Drawdown, in pnl and % of the peak balance
+    - Longest drawdown duration, peak to recovery, and longest time to recovery, trough to recovery, in seconds
+    - Drawdown in progress
+    - The body.top deepest episodes, deepest first, unrecovered ones without a recovery_time
+    Closed trades are streamed in close order through analytics.DrawdownEngine
+    """
+    body = body or DrawdownRequestBody()
+
+    async def compute():
+        engine = DrawdownEngine(body.top)
+        async for rows in stream_closed_pnl(user, body, DRAWDOWN_BATCH_SIZE):
+            engine.feed(rows)
+        return engine.result(await _balance_at(user, body.close_end), body.timezone)
+
+    return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'drawdowns', body, compute))
+
+
+@portfolio.post("/correlation")
+async def return_correlation(body: CorrelationRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns the correlation and covariance between the daily realised pnl of each
+    ticker traded in the period, as {ticker: {ticker: value}} matrices. Days a ticker
+    had no closed trade count as 0, correlations of a ticker without variance are null
+    """
+    body = body or CorrelationRequestBody()
+
+    async def compute():
+        rows = await get_ticker_daily_pnl(user, body, body.timezone)
+        days, tickers, matrix = day_matrix(
+            rows,
+            fill_gaps=body.fill_gaps,
+            start=to_local(body.close_start, body.timezone).date() if body.close_start else None,
+            end=to_local(body.close_end, body.timezone).date() if body.close_end else None,
+        )
+        covariance, correlation = covariance_correlation(matrix)
+
+        def to_matrix(values: np.ndarray) -> dict:
+            return {
+                ticker: {other: (None if np.isnan(value) else float(value)) for other, value in zip(tickers, row)}
+                for ticker, row in zip(tickers, values)
+            }
+
+        return {
+            'tickers': tickers,
+            'days': int(days.size),
+            'correlation': to_matrix(correlation),
+            'covariance': to_matrix(covariance),
         }
 
-        return JSONResponse(status_code=200, content=yearly_profits)
-    except Exception:
-        raise
+    return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'correlation', body, compute))
 
 
 @portfolio.post("/metrics")
 async def return_metrics(body: MetricRequestBody, user: Users = Depends(get_user)):
     """
-    Returns common metric for the account:
+    Returns common metrics for the account, computed together over the
+    realised pnl per interval, each interval is one return, not each trade:
     - Sharpe Ratio
-    - Sortino
-    Future:
-        - Standard Deviation
-        - Downward Deviation
-        - Treynor Ratio
+    - Sortino Ratio
+    - Standard Deviation
+    - Downside Deviation
+    - Max Drawdown
+    - Calmar Ratio
+    - Profit Factor, pnl of the winning intervals over that of the losing ones
+    - Expectancy, mean pnl per interval
+    - Treynor Ratio, against the benchmark returns in the body
     """
     try:
-        body = vars(body)
-        trades = await get_trades(user, TradeRequestBody(
-            **{k: v for k, v in body.items() if k in ['close_start', 'close_end']}) if body else None
-                                  )
-
-        interval = body.get("interval", None)
-        if interval == 'd':
-            unique_dates = set(parser.parse(item['closed_at']).date() for item in trades)
-            trades = {
-                str(date): sum(trade['realised_pnl']
-                               for trade in trades
-                               if parser.parse(trade['closed_at']).date() == date)
-                for date in unique_dates
-            }
-        if interval == 'm':
-            unique_dates = set(
-                (parser.parse(item['closed_at']).year, parser.parse(item['closed_at']).month) for item in trades
-            )
-            formatter = {
-                str(date): 0
-                for date in unique_dates
-            }
+        async def compute():
+            return [pnl for _, pnl in await _pnl_series(body.interval, body, user)]
 
-            for trade in trades:
-                closed_at = parser.parse(trade['closed_at'])
-                date = (closed_at.year, closed_at.month)
-                if date in unique_dates:
-                    formatter[str(date)] += trade['realised_pnl']
-            trades = formatter
-        if interval == 'y':
-            unique_dates = set(parser.parse(item['closed_at']).year for item in trades)
-            formatter = {
-                str(date): 0
-                for date in unique_dates
-            }
+        returns = await ANALYTICS_CACHE.get_or_compute(user, 'metrics', body, compute)
+        if body.benchmark is not None and len(body.benchmark) != len(returns):
+            return ORJSONResponse(status_code=400, content={
+                'error': f'benchmark has {len(body.benchmark)} returns, the period has {len(returns)} intervals'
+            })
+
+        requested = body.metrics or [body.metric]
+        values = compute_metrics(returns, requested, body.risk_free, body.benchmark)
 
-            for trade in trades:
-                year = parser.parse(trade['closed_at']).year
-                formatter[str(year)] += trade['realised_pnl']
-            trades = formatter
-
-        metric = body.get('metric', None)
-        if metric == Metrics.SHARPE.value:
-            answer = sharpe([v for _, v in trades.items()])
-        if metric == Metrics.SORTINO.value:
-            answer = sortino([v for _, v in trades.items()])
-        if metric == Metrics.STD.value:
-            answer = std([v for _, v in trades.items()])
-        return JSONResponse(status_code=200, content={'metric': metric, 'value': answer})
-    except UnboundLocalError:
-        raise DoesNotExist('Metric')
+        if body.metrics:
+            return ORJSONResponse(status_code=200, content={'metrics': values})
+        return ORJSONResponse(status_code=200, content={'metric': body.metric, 'value': values[body.metric]})
     except DoesNotExist:
         raise
     except Exception:
         raise
 
 
+@portfolio.post("/metrics/rolling")
+async def return_rolling_metrics(body: RollingMetricsRequestBody, user: Users = Depends(get_user)):
+    """
+    Returns each metric over the trailing body.window intervals at every interval,
+    keyed by bucket label like the profits endpoints, e.g. a 30 day rolling Sharpe
+    ratio and standard deviation. Computed in one pass over the realised pnl per
+    interval, see arithemtic.rolling_metrics
+    """
+    async def compute():
+        series = await _pnl_series(body.interval, body, user)
+        values = rolling_metrics([pnl for _, pnl in series], body.window, body.metrics, body.risk_free, body.min_periods)
+        labels = [bucket_label(body.interval, start) for start, _ in series]
+        return {
+            'window': body.window,
+            'metrics': {metric: dict(zip(labels, column)) for metric, column in values.items()},
+        }
+
+    return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'metrics/rolling', body, compute))
+
+
 @portfolio.post("/winrate")
 async def return_winrate(body: IsActiveRequestBody, user: Users = Depends(get_user)):
     """
     Returns winrate of the account
     """
-    trades = await get_trades(user, TradeRequestBody(**vars(body)) if body else None)
-    try:
-        return JSONResponse(
-            status_code=200,
-            content={'winrate': (sum(1 for trade in trades if trade['realised_pnl'] > 0) / len(trades)) * 100}
-        )
-    except ZeroDivisionError:
-        return JSONResponse(status_code=200, content={'winrate': 0.0})
-    except Exception:
-        raise
+    async def compute():
+        totals, = await get_trade_totals(user, TradeRequestBody(**vars(body)) if body else None)
+        try:
+            return {'winrate': (totals.win_count / totals.trade_count) * 100}
+        except ZeroDivisionError:
+            return {'winrate': 0.0}
+
+    return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'winrate', body, compute))
 
 
 @portfolio.post("/volume")
@@ -271,26 +408,77 @@ async def return_volume(body: PeriodRequestBody, user: Users = Depends(get_user)
     """
     Returns the accumulated dollar_amount spent on trades for the account
     """
+    async def compute():
+        totals, = await get_trade_totals(user, TradeRequestBody(**vars(body)) if body else None)
+        return {'total_volume': totals.volume}
+
+    try:
+        return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'volume', body, compute))
+    except Exception:
+        raise
+
+
+@portfolio.post("/analytics")
+async def return_analytics(body: AnalyticsRequestBody, user: Users = Depends(get_user)):
+    """
+    Returns several analytics at once, keyed by output, each with the content of its
+    own endpoint. The matching trades are fetched once, summed per day, and every
+    output is computed from those rows
+    - 400, benchmark length doesn't match the metrics intervals
+    """
+    async def compute():
+        rows = await get_daily_totals(
+            user,
+            TradeRequestBody(
+                close_start=body.close_start,
+                close_end=body.close_end,
+                ticker=body.ticker,
+                order_type=body.order_type,
+            ),
+            body.timezone,
+        )
+        return compute_analytics(rows, body, user.balance)
+
     try:
-        trades = await get_trades(user, TradeRequestBody(**vars(body)) if body else None)
-        return JSONResponse(status_code=200, content={'total_volume': sum(trade['dollar_amount'] for trade in trades)})
+        return ORJSONResponse(status_code=200, content=await ANALYTICS_CACHE.get_or_compute(user, 'analytics', body, compute))
+    except ValueError as e:
+        return ORJSONResponse(status_code=400, content={'error': str(e)})
     except Exception:
         raise
 
 
+async def _summary_totals(user: Users, close_start: datetime = None) -> dict:
+    """
+    realised_pnl of the trades closed since close_start, by default yesterday's
+    date, and unrealised_pnl of the open positions. unrealised_pnl is marked to the live prices when every ticker
+    with open positions has a fresh one, otherwise it's the stored value of the
+    open orders, read on every call as the stored marks change often
+    """
+    if close_start is None:
+        close_start = datetime.now().date() - timedelta(days=1)
+
+    async def compute():
+        columns = await get_trade_columns(user, TradeRequestBody(**{'close_start': close_start}), ['realised_pnl'])
+        return {'realised_pnl': float(np.nansum(columns['realised_pnl']))}
+
+    # The window moves daily, so it's part of the key
+    totals = await ANALYTICS_CACHE.get_or_compute(user, 'summary', {'close_start': close_start}, compute)
+    unrealised_pnl = await PRICE_BOOK.unrealised_pnl(user)
+    if unrealised_pnl is None:
+        columns = await get_trade_columns(user, TradeRequestBody(is_active=True), ['unrealised_pnl'])
+        unrealised_pnl = float(np.nansum(columns['unrealised_pnl']))
+    return {**totals, 'unrealised_pnl': unrealised_pnl}
+
+
 @portfolio.post("/summary", response_model=AccountSummary)
 async def return_summary(user: Users = Depends(get_user)):
     """
-    Returns summary for account
+    Returns summary for account.
+    unrealised_pnl covers the open positions, marked to the live prices when every
+    ticker held has a fresh one, otherwise it's the stored value of the open orders
     """
     try:
-        trades = await get_trades(user, TradeRequestBody(**{'close_start': datetime.now().date() - timedelta(days=1)}))
-        realised_pnl = sum(trade.get('realised_pnl', 0) for trade in trades)
-        return AccountSummary(
-            balance=user.balance,
-            realised_pnl=realised_pnl,
-            unrealised_pnl=sum(trade['unrealised_pnl'] for trade in trades),
-        )
+        return AccountSummary(balance=user.balance, **await _summary_totals(user))
     except KeyError:
         raise DoesNotExist('Trades')
     except DoesNotExist:
@@ -303,8 +491,10 @@ async def return_summary(user: Users = Depends(get_user)):
 async def return_order(body: OrderID, user: Users = Depends(get_user)):
     """Returns specific trade on account"""
     try:
-        trade = await get_trades(user, None, body.order_id)
-        return Trade(**trade)
+        rows = await get_trade_rows(user, None, order_id=body.order_id)
+        if not rows:
+            raise DoesNotExist('Trade')
+        return ORJSONResponse(status_code=200, content=TradeRecord(*rows[0]))
     except sqlalchemy.exc.DBAPIError:
         raise DoesNotExist('Trade')
     except DoesNotExist:
@@ -313,13 +503,17 @@ async def return_order(body: OrderID, user: Users = Depends(get_user)):
         raise
 
 
+async def _watchlist(user: Users) -> List[WatchlistItem]:
+    async with get_session() as session:
+        result = await session.execute(select(Watchlist).where(Watchlist.user == user))
+        return [WatchlistItem(ticker=vars(item).get('ticker', None)) for item in result.scalars().all()]
+
+
 @portfolio.post("/watchlist", response_model=List[WatchlistItem])
 async def return_watchlist(user: Users = Depends(get_user)):
     """Returns all currencies currently in the watchlist"""
     try:
-        async with get_session() as session:
-            result = await session.execute(select(Watchlist).where(Watchlist.user == user))
-            return [WatchlistItem(ticker=vars(item).get('ticker', None)) for item in result.scalars().all()]
+        return await _watchlist(user)
     except DoesNotExist:
         raise
     except Exception:
@@ -337,8 +531,50 @@ async def add_to_watchlist(body: WatchlistItem, user: Users = Depends(get_user),
         await session.commit()
         return HTTPException(status_code=200)
     except sqlalchemy.exc.IntegrityError:
-        return JSONResponse(status_code=409, content={'error': f'{body.ticker} already in watchlist'})
+        return ORJSONResponse(status_code=409, content={'error': f'{body.ticker} already in watchlist'})
     except DoesNotExist:
         raise
     except Exception:
         raise
+
+
+@portfolio.post("/dashboard")
+async def return_dashboard(body: DashboardRequestBody = None, user: Users = Depends(get_user)):
+    """
+    Returns what the home page shows in one request, authenticated once:
+    - balance
+    - today, the realised pnl of the trades closed since midnight in body.timezone
+      and the unrealised pnl of the open positions, marked as in /summary
+    - trades, the DASHBOARD_TRADES most recent, open ones first
+    - watchlist
+    The sections are loaded concurrently, each on its own pooled connection.
+    A section failing or taking longer than DASHBOARD_TIMEOUT seconds is null,
+    named in errors, and doesn't hold up the others
+    """
+    async def recent_trades():
+        rows, _ = await get_trade_page(user, TradePageRequestBody(limit=DASHBOARD_TRADES, sort=SortOrder.DESC))
+        return trade_records(rows)
+
+    async def watchlist():
+        return [item.model_dump() for item in await _watchlist(user)]
+
+    async def section(load):
+        async with task_session():
+            return await asyncio.wait_for(load(), DASHBOARD_TIMEOUT)
+
+    body = body or DashboardRequestBody()
+    midnight = datetime.now(ZoneInfo(body.timezone)).replace(hour=0, minute=0, second=0, microsecond=0)
+    # Orders store naive UTC
+    today = midnight.astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+    sections = {'today': lambda: _summary_totals(user, today), 'trades': recent_trades, 'watchlist': watchlist}
+    results = await asyncio.gather(*(section(load) for load in sections.values()), return_exceptions=True)
+
+    content, errors = {'balance': user.balance}, {}
+    for name, result in zip(sections, results):
+        if isinstance(result, BaseException):
+            content[name] = None
+            errors[name] = 'Timed out' if isinstance(result, asyncio.TimeoutError) else 'Unavailable'
+        else:
+            content[name] = result
+    return ORJSONResponse(status_code=200, content={**content, 'errors': errors})
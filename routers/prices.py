@@ -0,0 +1,43 @@
+import hmac
+from typing import List, Optional
+
+# Local
+from config import PRICE_FEED_TOKEN
+from models import PriceTick
+from pricing import PRICE_BOOK, PRICE_STORE, publish_ticks
+from responses import ORJSONResponse
+
+# FastAPI
+from fastapi import APIRouter, Header
+
+
+# Initialise
+prices = APIRouter(prefix='/prices', tags=['prices'], default_response_class=ORJSONResponse)
+
+
+def _valid_feed_token(token: Optional[str]) -> bool:
+    """The endpoint is disabled while PRICE_FEED_TOKEN is unset"""
+    return bool(PRICE_FEED_TOKEN) and token is not None and hmac.compare_digest(token, PRICE_FEED_TOKEN)
+
+
+@prices.get('')
+async def return_prices():
+    """Returns the latest price per ticker, stale ones aren't used for unrealised pnl"""
+    return ORJSONResponse(status_code=200, content={
+        ticker: {'price': quote.price, 'ts': quote.ts, 'stale': PRICE_STORE.is_stale(quote)}
+        for ticker, quote in PRICE_STORE.quotes().items()
+    })
+
+
+@prices.post('/ticks')
+async def ingest_ticks(ticks: List[PriceTick], x_feed_token: Optional[str] = Header(None)):
+    """
+    Applies a batch of price ticks in order, authenticated with the X-Feed-Token header,
+    and publishes them to the other workers. Ticks older than the stored price are dropped
+    """
+    if not _valid_feed_token(x_feed_token):
+        return ORJSONResponse(status_code=401, content={'error': 'Invalid feed token'})
+
+    applied = sum(PRICE_BOOK.apply_tick(tick) for tick in ticks)
+    await publish_ticks(ticks)
+    return ORJSONResponse(status_code=200, content={'applied': applied, 'dropped': len(ticks) - applied})
@@ -0,0 +1,24 @@
+"""
+Rebuilds daily_pnl_rollup from dashboard_orders
+
+    python -m scripts.backfill_rollup [--user EMAIL]
+"""
+import argparse
+import asyncio
+
+# Local
+from dependencies import get_session
+from rollup import backfill
+
+
+async def main(user_id: str = None) -> None:
+    async with get_session() as session:
+        rows = await backfill(session, user_id)
+    print(f"Rebuilt {rows} rollup rows for {user_id or 'all users'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user', help='Only rebuild this user\'s rows')
+    args = parser.parse_args()
+    asyncio.run(main(args.user))
@@ -0,0 +1,86 @@
+"""
+Checks the main endpoint queries on dashboard_orders are planned with the
+indexes from migrations/versions/0004_orders_indexes.py
+
+    python -m scripts.explain_indexes [--user EMAIL]
+
+Each query is built by the same code the endpoints use and run through
+EXPLAIN with sequential scans disabled, so the check holds on small tables
+where the planner would otherwise prefer a scan. Exits with 1 when a query
+doesn't use its index
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+# Local
+from db_models import Orders, Users
+from dependencies import get_session
+from models import TradePageRequestBody, TradeRequestBody
+from utils import filter_trades, trade_page_query, _raw_totals
+
+# SA
+from sqlalchemy import Select, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def _explain(query: Select, session: AsyncSession) -> list:
+    """EXPLAIN (FORMAT JSON) of the query, with its parameters rendered inline"""
+    compiled = query.compile(dialect=session.bind.dialect, compile_kwargs={'literal_binds': True})
+    return (await session.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}'))).scalar_one()
+
+
+def _index_names(plan: dict) -> Iterator[str]:
+    if 'Index Name' in plan:
+        yield plan['Index Name']
+    for child in plan.get('Plans', ()):
+        yield from _index_names(child)
+
+
+def _checks(user: Users) -> List[Tuple[str, Select, str]]:
+    """(name, query, index expected in its plan)"""
+    now = datetime.now()
+    period = {'close_start': now - timedelta(days=30), 'close_end': now}
+    return [
+        ('trades page', trade_page_query(user, TradePageRequestBody()).limit(500),
+         'ix_dashboard_orders_user_closed'),
+        ('closed in period', filter_trades(select(Orders.realised_pnl), user, TradeRequestBody(**period)),
+         'ix_dashboard_orders_user_closed'),
+        ('ticker in period', filter_trades(select(Orders.realised_pnl), user, TradeRequestBody(ticker='BTC-USDT', **period)),
+         'ix_dashboard_orders_user_ticker_closed'),
+        ('opened in period', filter_trades(select(Orders.order_id), user, TradeRequestBody(open_start=now - timedelta(days=30))),
+         'ix_dashboard_orders_user_created'),
+        ('open positions', _raw_totals(user, TradeRequestBody(is_active=True), ['ticker', 'order_type']),
+         'ix_dashboard_orders_user_open'),
+    ]
+
+
+async def main(email: str = None) -> int:
+    failures = 0
+    async with get_session() as session:
+        if email is None:
+            email = (await session.execute(select(Users.email).limit(1))).scalar_one_or_none()
+        if email is None:
+            print('No users to explain queries for')
+            return 1
+        user = Users(email=email)
+
+        await session.execute(text('SET LOCAL enable_seqscan = off'))
+        for name, query, expected in _checks(user):
+            plan, = await _explain(query, session)
+            used = set(_index_names(plan['Plan']))
+            ok = expected in used
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}: expected {expected}, used {', '.join(sorted(used)) or 'no index'}")
+        await session.rollback()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user', help='Explain the queries for this user, defaults to any user')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.user)))
@@ -0,0 +1,75 @@
+"""
+Bulk imports orders from a CSV (with a header line) or NDJSON file
+
+    python -m scripts.import_orders FILE [--format csv|ndjson] [--user EMAIL] [--chunk 5000] [--defer-triggers]
+
+Rows are validated against models.OrderImport and copied into
+dashboard_orders a chunk at a time, orders already stored are skipped.
+Rows without a user_id belong to --user. The format defaults to the
+file's extension, NDJSON unless it's .csv
+
+--defer-triggers disables the dashboard_orders triggers during the copy and
+rebuilds daily_pnl_rollup and data_version of the imported users after, for
+large backfills. It takes an exclusive lock on the table while it runs
+"""
+import argparse
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator
+
+# Local
+from config import DB_ENGINE
+from enums import ImportFormat
+from ingest import ImportResult, import_orders, rebuild_derived
+
+# SA
+from sqlalchemy import text
+
+
+async def _read_lines(path: Path) -> AsyncIterator[str]:
+    with path.open(newline='') as file:
+        for line in file:
+            yield line.rstrip('\n')
+
+
+def _progress(result: ImportResult) -> None:
+    print(f"  {result.received} rows, {result.inserted} inserted, {result.rows_per_second:.0f} rows/s", end='\r')
+
+
+async def main(args: argparse.Namespace) -> None:
+    import_format = args.format or (ImportFormat.CSV if args.file.suffix.lower() == '.csv' else ImportFormat.NDJSON)
+
+    if args.defer_triggers:
+        async with DB_ENGINE.begin() as connection:
+            await connection.execute(text('ALTER TABLE dashboard_orders DISABLE TRIGGER USER'))
+    try:
+        result = await import_orders(
+            _read_lines(args.file), import_format, default_user=args.user, chunk_size=args.chunk, progress=_progress,
+        )
+    finally:
+        if args.defer_triggers:
+            async with DB_ENGINE.begin() as connection:
+                await connection.execute(text('ALTER TABLE dashboard_orders ENABLE TRIGGER USER'))
+    print()
+
+    if args.defer_triggers and result.inserted:
+        print(f"Rebuilding the rollup of {len(result.users)} users")
+        await rebuild_derived(result.users)
+
+    print(f"{result.received} rows in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s): "
+          f"{result.inserted} inserted, {result.duplicates} duplicates, {result.rejected} rejected, "
+          f"{result.failed} failed")
+    for error in result.errors:
+        print(f"  line {error['line']}: {error['error']}")
+    await DB_ENGINE.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', type=Path)
+    parser.add_argument('--format', type=ImportFormat, choices=[f.value for f in ImportFormat])
+    parser.add_argument('--user', help='Owner of rows without a user_id')
+    parser.add_argument('--chunk', type=int, default=5000, help='Orders copied per transaction')
+    parser.add_argument('--defer-triggers', action='store_true',
+                        help='Disable the triggers during the copy and rebuild the derived rows after')
+    asyncio.run(main(parser.parse_args()))
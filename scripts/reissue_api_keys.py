@@ -0,0 +1,69 @@
+"""
+Reissues the api keys of users whose key predates the api_key_digest column
+
+    python -m scripts.reissue_api_keys OUTPUT.csv [--user EMAIL] [--dry-run]
+
+Only the argon2 hash of those keys is stored, so their digest can't be backfilled.
+Each is replaced with a new key, stored as its argon2 hash and digest, and the
+new keys are written to OUTPUT.csv as email,api_key lines for delivery to their
+owners. Keys without a digest no longer authenticate, so this is how their
+owners get back in. OUTPUT.csv holds live credentials
+"""
+import argparse
+import asyncio
+import csv
+import os
+import secrets
+from pathlib import Path
+
+# Local
+from config import DB_ENGINE, HASHER
+from db_models import Users
+from dependencies import get_session
+from security import api_key_digest
+
+# SA
+from sqlalchemy import select, update
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with get_session() as session:
+        query = select(Users.email).where((Users.api_key != None) & (Users.api_key_digest == None))
+        if args.user:
+            query = query.where(Users.email == args.user)
+        emails = (await session.execute(query.order_by(Users.email))).scalars().all()
+
+    print(f"{len(emails)} keys without a digest")
+    if args.dry_run or not emails:
+        await DB_ENGINE.dispose()
+        return
+
+    # Created owner only, the file holds the new keys in plain text
+    fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['email', 'api_key'])
+        for email in emails:
+            api_key = secrets.token_urlsafe(32)
+            async with get_session() as session:
+                await session.execute(
+                    update(Users)
+                    .where((Users.email == email) & (Users.api_key_digest == None))
+                    .values(api_key=await HASHER.hash(api_key), api_key_digest=api_key_digest(api_key))
+                )
+                await session.commit()
+            # Written per user, so an interrupted run still records every key it replaced
+            writer.writerow([email, api_key])
+            file.flush()
+
+    print(f"Reissued {len(emails)} keys to {args.output}")
+    HASHER.shutdown()
+    await DB_ENGINE.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', type=Path, help='CSV the new keys are written to, must not exist')
+    parser.add_argument('--user', help='Only reissue this user\'s key')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the keys without a digest')
+    asyncio.run(main(parser.parse_args()))
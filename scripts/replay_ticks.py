@@ -0,0 +1,174 @@
+"""
+Replays recorded price ticks, one PriceTick JSON object per line
+
+    python -m scripts.replay_ticks TICKS.ndjson --socket PATH [--speed 1]
+    python -m scripts.replay_ticks TICKS.ndjson --url http://localhost --token TOKEN [--batch 100]
+    python -m scripts.replay_ticks TICKS.ndjson --user EMAIL
+    python -m scripts.replay_ticks TICKS.ndjson --generate 10000
+
+- --socket writes the lines to a running app's PRICE_FEED_SOCKET
+- --url posts batches to /prices/ticks with the feed token
+- --user replays offline into a PriceBook holding the user's open orders, then
+  checks its unrealised pnl against revaluing every open order at the final prices
+- --generate records synthetic ticks, a random walk per ticker, to the file
+
+--speed 1 keeps the recorded gaps between ticks, 10 replays ten times faster,
+0 (the default) as fast as possible
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, List
+
+# Local
+from db_models import Orders, Users
+from dependencies import get_session
+from enums import OrderType, Ticker
+from models import PriceTick
+from pricing import PriceBook, PriceStore
+
+# SA
+from sqlalchemy import select
+
+
+# Starting prices for --generate
+_START_PRICES = {Ticker.BTC: 60_000.0, Ticker.ETH: 3_000.0, Ticker.SOL: 150.0}
+
+
+def generate(path: Path, count: int, interval: float, volatility: float, seed: int) -> None:
+    rnd = random.Random(seed)
+    prices = {ticker.value: price for ticker, price in _START_PRICES.items()}
+    ts = datetime.now().replace(microsecond=0)
+    with path.open('w') as file:
+        for _ in range(count):
+            ticker = rnd.choice(list(prices))
+            prices[ticker] *= math.exp(rnd.gauss(0, volatility))
+            ts += timedelta(seconds=interval)
+            file.write(json.dumps({'ticker': ticker, 'price': round(prices[ticker], 6), 'ts': ts.isoformat()}) + '\n')
+    print(f"Wrote {count} ticks to {path}")
+
+
+async def read_ticks(path: Path, speed: float) -> AsyncIterator[PriceTick]:
+    """The file's ticks, paced by their ts divided by speed when speed is set"""
+    started, first = time.perf_counter(), None
+    with path.open() as file:
+        for line in file:
+            if not line.strip():
+                continue
+            tick = PriceTick.model_validate_json(line)
+            if speed and tick.ts is not None:
+                first = first or tick.ts
+                delay = (tick.ts - first).total_seconds() / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield tick
+
+
+async def to_socket(path: Path, socket: str, speed: float) -> int:
+    _, writer = await asyncio.open_unix_connection(socket)
+    count = 0
+    try:
+        async for tick in read_ticks(path, speed):
+            writer.write(tick.model_dump_json(exclude_none=True).encode() + b'\n')
+            await writer.drain()
+            count += 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return count
+
+
+async def to_url(path: Path, url: str, token: str, speed: float, batch_size: int) -> int:
+    import httpx
+
+    count = dropped = 0
+    async with httpx.AsyncClient(base_url=url, headers={'X-Feed-Token': token}) as client:
+        async def post(batch: List[PriceTick]) -> None:
+            nonlocal count, dropped
+            response = await client.post('/prices/ticks', content=f"[{','.join(t.model_dump_json() for t in batch)}]",
+                                         headers={'Content-Type': 'application/json'})
+            response.raise_for_status()
+            count += response.json()['applied']
+            dropped += response.json()['dropped']
+
+        batch = []
+        async for tick in read_ticks(path, speed):
+            batch.append(tick)
+            # When paced, each tick is sent as it's due
+            if len(batch) >= batch_size or speed:
+                await post(batch)
+                batch = []
+        if batch:
+            await post(batch)
+
+    if dropped:
+        print(f"{dropped} ticks dropped as out of order")
+    return count
+
+
+async def offline(path: Path, email: str, speed: float) -> int:
+    async with get_session() as session:
+        user = await session.get(Users, email)
+        if user is None:
+            raise SystemExit(f"No user {email}")
+        orders = (await session.execute(
+            select(Orders.ticker, Orders.dollar_amount, Orders.open_price, Orders.order_type)
+            .where(Orders.user_id == email, Orders.is_active == True, Orders.open_price > 0)
+        )).all()
+
+    book = PriceBook(PriceStore())
+    await book.unrealised_pnl(user)
+
+    count = 0
+    started = time.perf_counter()
+    async for tick in read_ticks(path, speed):
+        book.apply_tick(tick)
+        count += 1
+    elapsed = time.perf_counter() - started
+
+    incremental = await book.unrealised_pnl(user)
+    if incremental is None:
+        raise SystemExit(f"{email} holds tickers the ticks never priced")
+
+    revalued = 0.0
+    for order in orders:
+        change = book.prices.price(order.ticker) / order.open_price - 1
+        revalued += order.dollar_amount * (-change if order.order_type == OrderType.SHORT.value else change)
+
+    print(f"{len(orders)} open orders, {count} ticks in {elapsed:.3f}s ({count / elapsed if elapsed else 0:.0f} ticks/s)")
+    print(f"unrealised pnl incremental {incremental:.6f}, revalued {revalued:.6f}")
+    if not math.isclose(incremental, revalued, rel_tol=1e-9, abs_tol=1e-6):
+        sys.exit(1)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('ticks', type=Path)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--socket', help='PRICE_FEED_SOCKET of a running app')
+    target.add_argument('--url', help='Base url of a running app')
+    target.add_argument('--user', help='Replay offline against this user\'s open orders')
+    target.add_argument('--generate', type=int, metavar='N', help='Write N synthetic ticks to the file')
+    parser.add_argument('--token', default='', help='Feed token for --url')
+    parser.add_argument('--speed', type=float, default=0, help='Replay speed, 0 for as fast as possible')
+    parser.add_argument('--batch', type=int, default=100, help='Ticks per request for --url')
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between generated ticks')
+    parser.add_argument('--volatility', type=float, default=0.001, help='Log return deviation per generated tick')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(args.ticks, args.generate, args.interval, args.volatility, args.seed)
+    elif args.socket:
+        print(f"Sent {asyncio.run(to_socket(args.ticks, args.socket, args.speed))} ticks")
+    elif args.url:
+        print(f"Applied {asyncio.run(to_url(args.ticks, args.url, args.token, args.speed, args.batch))} ticks")
+    else:
+        asyncio.run(offline(args.ticks, args.user, args.speed))
@@ -0,0 +1,45 @@
+import hashlib
+import hmac
+from typing import Optional
+
+# Local
+from config import API_KEY_DIGEST_SECRET, HASHER
+from db_models import Users
+
+# SA
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def api_key_digest(api_key: str) -> str:
+    """
+    Returns the keyed SHA-256 digest of the api key.
+    The digest is stored in the indexed api_key_digest column so
+    a key can be resolved to its user with a single row fetch.
+    Whoever issues keys must store this digest alongside the argon2 hash
+    """
+    return hmac.new(API_KEY_DIGEST_SECRET, api_key.encode(), hashlib.sha256).hexdigest()
+
+
+async def verify_api_key(hashed: str, api_key: str) -> bool:
+    """Returns True if the api key matches the stored argon2 hash, runs on the hashing pool"""
+    return await HASHER.verify(hashed, api_key)
+
+
+async def find_user_by_api_key(session: AsyncSession, api_key: Optional[str]) -> Optional[Users]:
+    """
+    Resolves the api key to a user by fetching the single row matching the
+    key's digest and verifying it once. Keys issued before the digest column
+    have no digest and don't resolve, see scripts.reissue_api_keys.
+    Returns None when no user owns the key
+    """
+    if not api_key:
+        return None
+
+    digest = api_key_digest(api_key)
+    result = await session.execute(select(Users).where(Users.api_key_digest == digest))
+    user = result.scalars().first()
+
+    if user is None or not await verify_api_key(user.api_key, api_key):
+        return None
+    return user
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# config requires these at import, the engine it builds doesn't connect until used
+os.environ.setdefault('API_KEY_DIGEST_SECRET', 'test-secret')
+for name, value in (('DB_USER', 'test'), ('DB_HOST', 'localhost'), ('DB_PORT', '5432'), ('DB_NAME', 'test')):
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+# Local
+from aggregation import aggregate, day_matrix
+from config import FILL_GAPS_MAX_BUCKETS
+from enums import Intervals
+from exceptions import PeriodTooLarge
+
+
+@pytest.mark.parametrize('interval, expected', [
+    (Intervals.DAILY, 366),
+    (Intervals.WEEKLY, 53),
+    (Intervals.MONTHLY, 13),
+    (Intervals.QUARTERLY, 5),
+    (Intervals.YEARLY, 2),
+])
+def test_bucket_count_matches_filled_series(interval, expected):
+    start, end = datetime(2024, 1, 3), datetime(2025, 1, 2)
+    series = aggregate([], interval, fill_gaps=True, start=start, end=end)
+    assert len(series) == expected
+
+
+def test_fill_gaps_rejects_unbounded_period():
+    with pytest.raises(PeriodTooLarge):
+        aggregate([(datetime(2024, 1, 1), 1.0)], Intervals.DAILY, fill_gaps=True,
+                  start=datetime(1, 1, 1), end=datetime(9999, 12, 31))
+
+    series = aggregate([], Intervals.YEARLY, fill_gaps=True, start=datetime(1, 1, 1), end=datetime(9999, 12, 31))
+    assert series[-1] == (datetime(9999, 1, 1), 0)
+
+
+def test_fill_gaps_stops_at_last_representable_bucket():
+    series = aggregate([], Intervals.DAILY, fill_gaps=True, start=datetime(9999, 12, 30), end=datetime(9999, 12, 31))
+    assert [start for start, _ in series] == [datetime(9999, 12, 30), datetime(9999, 12, 31)]
+
+
+def test_day_matrix_rejects_unbounded_period():
+    with pytest.raises(PeriodTooLarge):
+        day_matrix([(date(2024, 1, 1), 'BTC-USDT', 1.0)], fill_gaps=True, start=date(1, 1, 1), end=date(9999, 12, 31))
+
+    start = date(2024, 1, 1)
+    days, _, _ = day_matrix([], fill_gaps=True, start=start, end=start + timedelta(days=FILL_GAPS_MAX_BUCKETS - 1))
+    assert days.size == FILL_GAPS_MAX_BUCKETS
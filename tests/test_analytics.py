@@ -0,0 +1,94 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+# Local
+from analytics import DrawdownEngine, compute_analytics
+from models import AnalyticsRequestBody
+
+START = datetime(2024, 1, 1)
+
+
+def points(pnls):
+    return [(START + timedelta(hours=i), pnl) for i, pnl in enumerate(pnls)]
+
+
+def test_drawdown_engine_episodes():
+    # Equity 10, 6, 3, 11, 6, 8, 2: one recovered episode, one still open
+    engine = DrawdownEngine()
+    engine.feed(points([10, -4, -3, 8, -5, 2, -6]))
+    result = engine.result(end_balance=102)
+
+    assert result['trades'] == 7
+    assert result['realised_pnl'] == 2
+    assert result['episodes'] == 2
+    assert result['max_drawdown'] == 9
+    assert result['max_drawdown_pct'] == pytest.approx(9 / 111 * 100)
+    assert result['current_drawdown'] == 9
+    assert result['max_duration'] == 3 * 3600
+    assert result['max_time_to_recovery'] == 3600
+
+    open_, recovered = result['drawdowns']
+    assert open_ == {
+        'peak_time': (START + timedelta(hours=3)).isoformat(),
+        'trough_time': (START + timedelta(hours=6)).isoformat(),
+        'recovery_time': None,
+        'depth': 9,
+        'depth_pct': pytest.approx(9 / 111 * 100),
+        'duration': 3 * 3600,
+        'time_to_recovery': None,
+    }
+    assert recovered['peak_time'] == START.isoformat()
+    assert recovered['trough_time'] == (START + timedelta(hours=2)).isoformat()
+    assert recovered['recovery_time'] == (START + timedelta(hours=3)).isoformat()
+    assert recovered['depth'] == 7
+    assert recovered['time_to_recovery'] == 3600
+
+
+def test_drawdown_engine_batches_match_one_feed():
+    pnls = np.random.default_rng(3).normal(0.0, 10.0, 500).tolist()
+    whole = DrawdownEngine(top=3)
+    whole.feed(points(pnls))
+    batched = DrawdownEngine(top=3)
+    data = points(pnls)
+    for i in range(0, len(data), 37):
+        batched.feed(data[i:i + 37])
+
+    result = whole.result()
+    assert batched.result() == result
+    assert len(result['drawdowns']) == 3
+    depths = [drawdown['depth'] for drawdown in result['drawdowns']]
+    assert depths == sorted(depths, reverse=True)
+
+    equity = np.concatenate(([0.0], np.cumsum(pnls)))
+    assert result['max_drawdown'] == pytest.approx(np.max(np.maximum.accumulate(equity) - equity))
+
+
+DailyTotal = namedtuple('DailyTotal', 'day ticker order_type realised_pnl trade_count win_count volume')
+
+DAILY_TOTALS = [
+    DailyTotal(date(2024, 1, 1), 'BTC-USDT', 'long', 50.0, 2, 1, 1000.0),
+    DailyTotal(date(2024, 1, 2), 'ETH-USDT', 'short', -20.0, 1, 0, 500.0),
+    # Open positions
+    DailyTotal(None, 'BTC-USDT', 'long', 0.0, 1, 0, 300.0),
+]
+
+
+def test_compute_analytics_counts_open_trades_without_a_period():
+    body = AnalyticsRequestBody(outputs=['profits', 'volume', 'winrate', 'profits_daily'])
+    result = compute_analytics(DAILY_TOTALS, body, 0.0)
+    assert result['profits'] == {'realised_pnl': 30.0}
+    assert result['volume'] == {'total_volume': 1800.0}
+    assert result['winrate'] == {'winrate': 25.0}
+    assert result['profits_daily'] == {'2024-01-01': 50.0, '2024-01-02': -20.0}
+
+
+def test_compute_analytics_leaves_open_trades_out_of_a_period():
+    body = AnalyticsRequestBody(outputs=['volume', 'winrate', 'asset_allocation'], allocation_mode='exposure',
+                                close_start=datetime(2024, 1, 1))
+    result = compute_analytics(DAILY_TOTALS, body, 0.0)
+    assert result['volume'] == {'total_volume': 1500.0}
+    assert result['winrate'] == pytest.approx({'winrate': 100 / 3})
+    assert result['asset_allocation'] == {'BTC-USDT': 100.0, 'ETH-USDT': 0.0}
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+# Local
+from arithemtic import ROLLING_METRICS, compute_metrics, rolling_metrics
+
+
+def test_rolling_metrics_match_compute_metrics_per_window():
+    returns = np.random.default_rng(7).normal(1.0, 5.0, 60).tolist()
+    window = 10
+    rolling = rolling_metrics(returns, window, risk_free=0.5)
+
+    for i in range(len(returns)):
+        if i + 1 < window:
+            assert all(rolling[m.value][i] is None for m in ROLLING_METRICS)
+            continue
+        expected = compute_metrics(returns[i + 1 - window:i + 1], ROLLING_METRICS, risk_free=0.5)
+        for metric, value in expected.items():
+            assert rolling[metric][i] == pytest.approx(value, abs=1e-9), (metric, i)
+
+
+def test_rolling_metrics_keep_zero_risk_free():
+    returns = [1.0, -2.0, 3.0, 0.5]
+    rolling = rolling_metrics(returns, 4, risk_free=0)
+    assert rolling['sharpe'][-1] == compute_metrics(returns, ROLLING_METRICS, risk_free=0)['sharpe']
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+# Local
+from exceptions import LineTooLong
+from ingest import split_lines
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _lines(*chunks, max_length=16):
+    async def collect():
+        return [line async for line in split_lines(_chunks(*chunks), max_length)]
+    return asyncio.run(collect())
+
+
+def test_split_lines_joins_lines_across_chunks():
+    assert _lines(b'a,b\nc', b'd\n', b'ef') == ['a,b', 'cd', 'ef']
+
+
+def test_split_lines_rejects_a_line_over_the_limit():
+    # Without a newline the line is caught once it outgrows the limit, not at the end of the body
+    with pytest.raises(LineTooLong):
+        _lines(b'ok\n', b'x' * 10, b'x' * 10, b'x' * 10)
+
+    with pytest.raises(LineTooLong):
+        _lines(b'x' * 17 + b'\nok\n')
+
+    assert _lines(b'x' * 16 + b'\n') == ['x' * 16]
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import random
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+# Local
+import pricing
+from enums import OrderType
+from models import PriceTick
+from pricing import PriceBook, PriceStore
+
+PositionRow = namedtuple('PositionRow', 'ticker units cost')
+
+# (ticker, order_type, dollar_amount, open_price) of the open orders
+ORDERS = [
+    ('BTC-USDT', OrderType.LONG, 1000.0, 50000.0),
+    ('BTC-USDT', OrderType.SHORT, 400.0, 52000.0),
+    ('ETH-USDT', OrderType.LONG, 300.0, 3000.0),
+    ('SOL-USDT', OrderType.SHORT, 250.0, 100.0),
+]
+
+
+def position_rows(orders):
+    """What pricing.positions_query returns for the orders"""
+    totals = {}
+    for ticker, order_type, dollar_amount, open_price in orders:
+        sign = -1.0 if order_type == OrderType.SHORT else 1.0
+        units, cost = totals.get(ticker, (0.0, 0.0))
+        totals[ticker] = (units + sign * dollar_amount / open_price, cost + sign * dollar_amount)
+    return [PositionRow(ticker, units, cost) for ticker, (units, cost) in totals.items()]
+
+
+def revalued(orders, prices):
+    """Unrealised pnl of every order at the prices, as stored on orders"""
+    total = 0.0
+    for ticker, order_type, dollar_amount, open_price in orders:
+        pnl = dollar_amount * (prices[ticker] / open_price - 1)
+        total += -pnl if order_type == OrderType.SHORT else pnl
+    return total
+
+
+@pytest.fixture
+def positions(monkeypatch):
+    """Serves the PriceBook's positions query from ORDERS instead of the database"""
+    rows = position_rows(ORDERS)
+
+    @asynccontextmanager
+    async def get_session():
+        yield SimpleNamespace(execute=lambda query: _result(rows))
+
+    async def _result(rows):
+        return SimpleNamespace(all=lambda: rows)
+
+    monkeypatch.setattr(pricing, 'get_session', get_session)
+
+
+USER = SimpleNamespace(email='trader@example.com', data_version=1)
+
+
+def test_price_book_moves_incrementally_like_a_full_revaluation(positions):
+    book = PriceBook(PriceStore(max_age=0))
+    rnd = random.Random(11)
+    prices = {'BTC-USDT': 51000.0, 'ETH-USDT': 3100.0}
+    for ticker, price in prices.items():
+        book.apply(ticker, price)
+
+    # SOL-USDT has no price yet
+    assert asyncio.run(book.unrealised_pnl(USER)) is None
+    prices['SOL-USDT'] = 95.0
+    book.apply('SOL-USDT', 95.0)
+
+    for _ in range(200):
+        ticker = rnd.choice(list(prices))
+        prices[ticker] *= rnd.uniform(0.97, 1.03)
+        book.apply(ticker, prices[ticker])
+        assert asyncio.run(book.unrealised_pnl(USER)) == pytest.approx(revalued(ORDERS, prices))
+    assert book.loads == 1
+
+
+def test_price_book_drops_out_of_order_ticks(positions):
+    book = PriceBook(PriceStore(max_age=0))
+    now = datetime(2024, 1, 1, 12)
+    for ticker, price in (('BTC-USDT', 51000.0), ('ETH-USDT', 3100.0), ('SOL-USDT', 95.0)):
+        assert book.apply(ticker, price, now)
+    before = asyncio.run(book.unrealised_pnl(USER))
+
+    assert not book.apply('BTC-USDT', 10.0, now - timedelta(seconds=1))
+    assert book.prices.price('BTC-USDT') == 51000.0
+    assert book.prices.dropped == 1
+    assert asyncio.run(book.unrealised_pnl(USER)) == before
+
+    assert book.apply_tick(PriceTick(ticker='BTC-USDT', price=52000.0, ts=now + timedelta(seconds=1)))
+    assert asyncio.run(book.unrealised_pnl(USER)) == pytest.approx(
+        revalued(ORDERS, {'BTC-USDT': 52000.0, 'ETH-USDT': 3100.0, 'SOL-USDT': 95.0})
+    )
+
+
+def test_price_book_is_unpriced_while_a_held_price_is_stale(positions, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(pricing.time, 'time', lambda: clock[0])
+    book = PriceBook(PriceStore(max_age=60))
+    for ticker, price in (('BTC-USDT', 51000.0), ('ETH-USDT', 3100.0), ('SOL-USDT', 95.0)):
+        book.apply(ticker, price)
+    assert asyncio.run(book.unrealised_pnl(USER)) is not None
+
+    clock[0] += 30
+    book.apply('BTC-USDT', 51500.0)
+    book.apply('ETH-USDT', 3050.0)
+    clock[0] += 40
+    # SOL-USDT was last priced 70 seconds ago
+    assert asyncio.run(book.unrealised_pnl(USER)) is None
+    book.apply('SOL-USDT', 96.0)
+    assert asyncio.run(book.unrealised_pnl(USER)) == pytest.approx(
+        revalued(ORDERS, {'BTC-USDT': 51500.0, 'ETH-USDT': 3050.0, 'SOL-USDT': 96.0})
+    )
+
+
+def test_fanout_applies_ticks_published_by_other_workers():
+    fakeredis = pytest.importorskip('fakeredis')
+
+    async def run():
+        client = fakeredis.FakeAsyncRedis()
+        fanout = pricing.start_fanout(client)
+        try:
+            while not (await client.pubsub_numsub(pricing.PRICE_FEED_CHANNEL))[0][1]:
+                await asyncio.sleep(0.01)
+            # This worker's own ticks were applied before publishing and are skipped
+            await pricing.publish_ticks([PriceTick(ticker='ETH-USDT', price=1.0)], client)
+            other = {'origin': 'other-worker', 'ticks': [{'ticker': 'ETH-USDT', 'price': 3210.5, 'ts': None}]}
+            await client.publish(pricing.PRICE_FEED_CHANNEL, json.dumps(other))
+            for _ in range(100):
+                if pricing.PRICE_STORE.price('ETH-USDT') is not None:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            fanout.cancel()
+            await asyncio.gather(fanout, return_exceptions=True)
+            await client.aclose()
+
+    asyncio.run(run())
+    assert pricing.PRICE_STORE.price('ETH-USDT') == 3210.5
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+# Local
+from rollup import _split_period
+
+
+def test_split_period_partial_days_at_both_edges():
+    start, end = datetime(2024, 1, 1, 15), datetime(2024, 1, 5, 9, 30)
+    days, edges = _split_period(start, end)
+    assert days == (datetime(2024, 1, 2), datetime(2024, 1, 5))
+    assert edges == [(start, datetime(2024, 1, 2)), (datetime(2024, 1, 5), end)]
+
+
+def test_split_period_midnight_start_has_no_leading_edge():
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 3, 12)
+    days, edges = _split_period(start, end)
+    assert days == (start, datetime(2024, 1, 3))
+    assert edges == [(datetime(2024, 1, 3), end)]
+
+
+def test_split_period_within_one_day_is_all_edge():
+    start, end = datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 17)
+    assert _split_period(start, end) == (None, [(start, end)])
+
+
+def test_split_period_open_ended():
+    start = datetime(2024, 1, 1, 9)
+    assert _split_period(start, None) == ((datetime(2024, 1, 2), None), [(start, datetime(2024, 1, 2))])
+
+    end = datetime(2024, 1, 3, 6)
+    assert _split_period(None, end) == ((None, datetime(2024, 1, 3)), [(datetime(2024, 1, 3), end)])
+    assert _split_period(None, None) == ((None, None), [])
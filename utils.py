@@ -1,105 +1,406 @@
+import base64
+import json
+from dataclasses import dataclass, fields
 from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
 from uuid import UUID
 
+import numpy as np
+
 # Local
 from db_models import Orders, Users
 from dependencies import get_session
-from exceptions import DoesNotExist
-from models import TradeRequestBody
+from enums import Intervals, SortOrder
+from exceptions import InvalidCursor
+from models import TradeRequestBody, PeriodRequestBody, TradePageRequestBody
+from rollup import closed_daily_source, rollup_eligible
 
 # SA
-from sqlalchemy import select
+from sqlalchemy import BigInteger, Date, DateTime, Row, Select, cast, null, select, func, tuple_, union_all
+
+
+@dataclass(slots=True)
+class TradeRecord:
+    """
+    A trade row as the API returns it, built positionally from a TRADE_COLUMNS row.
+    orjson serialises it directly, so responses skip the dict and Trade model
+    """
+    order_id: UUID
+    ticker: str
+    dollar_amount: float
+    realised_pnl: Optional[float]
+    unrealised_pnl: Optional[float]
+    open_price: float
+    close_price: Optional[float]
+    created_at: datetime
+    closed_at: Optional[datetime]
+    is_active: bool
+    order_type: Optional[str]
+
+
+TRADE_COLUMNS = tuple(field.name for field in fields(TradeRecord))
+_FLOAT_COLUMNS = {'dollar_amount', 'realised_pnl', 'unrealised_pnl', 'open_price', 'close_price'}
+_DATETIME_COLUMNS = {'created_at', 'closed_at'}
+
+# TradeRequestBody field -> (column, operator)
+_TRADE_FILTERS = {
+    'is_active': (Orders.is_active, '=='),
+    'ticker': (Orders.ticker, '=='),
+    'order_type': (Orders.order_type, '=='),
+    'min_dollar_amount': (Orders.dollar_amount, '>='),
+    'max_dollar_amount': (Orders.dollar_amount, '<='),
+    'min_unrealised_pnl': (Orders.unrealised_pnl, '>='),
+    'max_unrealised_pnl': (Orders.unrealised_pnl, '<='),
+    'min_realised_pnl': (Orders.realised_pnl, '>='),
+    'max_realised_pnl': (Orders.realised_pnl, '<='),
+    'min_open_price': (Orders.open_price, '>='),
+    'max_open_price': (Orders.open_price, '<='),
+    'min_close_price': (Orders.close_price, '>='),
+    'max_close_price': (Orders.close_price, '<='),
+    'open_start': (Orders.created_at, '>='),
+    'open_end': (Orders.created_at, '<='),
+    'close_start': (Orders.closed_at, '>='),
+    'close_end': (Orders.closed_at, '<='),
+}
+
+
+def filter_trades(query: Select, user: Users, trade_details: TradeRequestBody = None) -> Select:
+    """Applies the user and every filter set on trade_details to the query"""
+    query = query.where(Orders.user_id == user.email)
+    if trade_details is None:
+        return query
+
+    for field, (column, operator) in _TRADE_FILTERS.items():
+        value = getattr(trade_details, field)
+        if value is None:
+            continue
+        if operator == '==':
+            query = query.where(column == value)
+        elif operator == '>=':
+            query = query.where(column >= value)
+        else:
+            query = query.where(column <= value)
+    return query
+
+
+async def get_trade_rows(
+        user: Users,
+        trade_details: TradeRequestBody = None,
+        columns: Sequence[str] = TRADE_COLUMNS,
+        order_id=None,
+) -> List[Row]:
+    """
+    Returns the requested columns of the user's matching orders as
+    compact rows, without hydrating Orders objects
+    """
+    query = filter_trades(select(*(getattr(Orders, column) for column in columns)), user, trade_details)
+    if order_id:
+        query = query.where(Orders.order_id == order_id)
+
+    async with get_session() as session:
+        result = await session.execute(query)
+        return result.all()
+
+
+async def get_trade_columns(
+        user: Users,
+        trade_details: TradeRequestBody = None,
+        columns: Sequence[str] = TRADE_COLUMNS,
+) -> Dict[str, np.ndarray]:
+    """
+    Returns the requested columns of the user's matching orders as arrays,
+    for analytics. Prices and pnl are float64 with nan for NULL,
+    datetimes are datetime64[us] with NaT for NULL
+    """
+    rows = await get_trade_rows(user, trade_details, columns)
+    values = list(zip(*rows)) if rows else [()] * len(columns)
 
+    arrays = {}
+    for column, column_values in zip(columns, values):
+        if column in _FLOAT_COLUMNS:
+            arrays[column] = np.fromiter(
+                (np.nan if value is None else value for value in column_values),
+                dtype=np.float64,
+                count=len(column_values),
+            )
+        elif column in _DATETIME_COLUMNS:
+            arrays[column] = np.array(column_values, dtype='datetime64[us]')
+        else:
+            arrays[column] = np.array(column_values, dtype=object)
+    return arrays
 
-async def get_trades(user: Users, trade_details: TradeRequestBody = None, order_id=None):
+
+def trade_records(rows: Sequence[Row]) -> List[TradeRecord]:
+    """Rows selected with TRADE_COLUMNS as TradeRecords"""
+    return [TradeRecord(*row) for row in rows]
+
+
+def encode_cursor(row: Row) -> str:
+    """Cursor pointing after row, a trade page row's (closed_at, order_id)"""
+    closed_at = row.closed_at.isoformat() if row.closed_at is not None else None
+    return base64.urlsafe_b64encode(json.dumps([closed_at, str(row.order_id)]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], UUID]:
     try:
-        async with get_session() as session:
-            if trade_details is None and not order_id:
-                results = await session.execute(select(Orders).where(Orders.user == user))
-                return [
-                    {
-                        key: (value if not isinstance(value, (datetime, UUID)) else str(value))
-                        for key, value in vars(trade).items()
-                        if value != None and key != '_sa_instance_state' and value != 'null'
-                    }
-                    for trade in results.scalars().all()
-                ]
-
-            if order_id:
-                result = await session.execute(select(Orders).where(
-                    (Orders.order_id == order_id) & (Orders.user == user)
-                ))
-                return {
-                        key: (value if not isinstance(value, (datetime, UUID)) else str(value))
-                        for key, value in vars(result.scalars().first()).items()
-                        if value != None and key != '_sa_instance_state' and value != 'null'
-                    }
-
-            query = select(Orders).where(Orders.user == user)
-
-            if trade_details.is_active:
-                query = query.where(Orders.is_active == trade_details.is_active)
-
-            if trade_details.ticker:
-                query = query.where(Orders.ticker == trade_details.ticker)
-
-            if trade_details.min_dollar_amount:
-                query = query.where(Orders.dollar_amount >= trade_details.min_dollar_amount)
-
-            if trade_details.max_dollar_amount:
-                query = query.where(Orders.dollar_amount <= trade_details.max_dollar_amount)
-
-            if trade_details.min_unrealised_pnl:
-                query = query.where(Orders.unrealised_pnl >= trade_details.min_unrealised_pnl)
-
-            if trade_details.max_unrealised_pnl:
-                query = query.where(Orders.unrealised_pnl <= trade_details.max_unrealised_pnl)
-
-            if trade_details.min_realised_pnl:
-                query = query.where(Orders.realised_pnl >= trade_details.min_realised_pnl)
-
-            if trade_details.max_realised_pnl:
-                query = query.where(Orders.realised_pnl <= trade_details.max_realised_pnl)
-
-            if trade_details.min_open_price:
-                query = query.where(Orders.open_price >= trade_details.min_open_price)
-
-            if trade_details.max_open_price:
-                query = query.where(Orders.open_price <= trade_details.max_open_price)
-
-            if trade_details.min_close_price:
-                query = query.where(Orders.close_price >= trade_details.min_close_price)
-
-            if trade_details.max_close_price:
-                query = query.where(Orders.close_price <= trade_details.max_close_price)
-
-            if trade_details.open_start:
-                query = query.where(Orders.created_at >= trade_details.open_start)
-
-            if trade_details.open_end:
-                query = query.where(Orders.created_at <= trade_details.open_end)
-
-            if trade_details.close_start:
-                query = query.where(Orders.closed_at >= trade_details.close_start)
-
-            if trade_details.close_end:
-                query = query.where(Orders.closed_at <= trade_details.close_end)
-
-            if trade_details.order_type:
-                query = query.where(Orders.order_type == trade_details.order_type)
-
-            result = await session.execute(query)
-            trades = result.scalars().all()
-
-            return [
-                {
-                    key: (value if not isinstance(value, (datetime, UUID)) else str(value))
-                    for key, value in vars(trade).items()
-                    if value != None and key != '_sa_instance_state' and value != 'null'
-                }
-                for trade in trades
-            ]
-    except DoesNotExist:
-        raise
-    except Exception:
-        raise
+        closed_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(closed_at) if closed_at else None), UUID(order_id)
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor()
+
+
+def trade_page_query(user: Users, body: TradePageRequestBody, columns: Sequence[str] = TRADE_COLUMNS) -> Select:
+    """
+    Keyset query over (closed_at, order_id) resuming after body.cursor.
+    Open trades (closed_at NULL) come after closed ones in asc order and before them in desc
+    """
+    query = filter_trades(select(*(getattr(Orders, column) for column in columns)), user, body)
+    ascending = body.sort == SortOrder.ASC
+
+    if body.cursor:
+        closed_at, order_id = decode_cursor(body.cursor)
+        key = tuple_(Orders.closed_at, Orders.order_id)
+        if closed_at is None and ascending:
+            query = query.where((Orders.closed_at == None) & (Orders.order_id > order_id))
+        elif closed_at is None:
+            query = query.where(((Orders.closed_at == None) & (Orders.order_id < order_id)) | (Orders.closed_at != None))
+        elif ascending:
+            query = query.where((key > tuple_(closed_at, order_id)) | (Orders.closed_at == None))
+        else:
+            query = query.where(key < tuple_(closed_at, order_id))
+
+    if ascending:
+        return query.order_by(Orders.closed_at.asc().nulls_last(), Orders.order_id.asc())
+    return query.order_by(Orders.closed_at.desc().nulls_first(), Orders.order_id.desc())
+
+
+async def get_trade_page(user: Users, body: TradePageRequestBody) -> Tuple[List[Row], Optional[str]]:
+    """Returns up to body.limit trades and the cursor of the next page, None on the last page"""
+    async with get_session() as session:
+        result = await session.execute(trade_page_query(user, body).limit(body.limit + 1))
+        rows = result.all()
+
+    if len(rows) > body.limit:
+        rows = rows[:body.limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+async def stream_trade_rows(user: Users, body: TradePageRequestBody, batch_size: int = 1000) -> AsyncIterator[Row]:
+    """
+    Yields every matching trade through a server side cursor, batch_size rows
+    are held at a time however many trades the user has
+    """
+    async with get_session() as session:
+        result = await session.stream(
+            trade_page_query(user, body).execution_options(yield_per=batch_size)
+        )
+        async for row in result:
+            yield row
+
+
+async def stream_closed_pnl(
+        user: Users,
+        period: PeriodRequestBody = None,
+        batch_size: int = 1000,
+) -> AsyncIterator[Sequence[Row]]:
+    """
+    Yields the (closed_at, realised_pnl) rows of the user's closed trades in close order,
+    a batch_size list at a time through a server side cursor. Walks
+    ix_dashboard_orders_user_closed, so nothing is sorted or held whole
+    """
+    trade_details = TradeRequestBody(
+        close_start=period.close_start if period is not None else None,
+        close_end=period.close_end if period is not None else None,
+    )
+    query = filter_trades(
+        select(Orders.closed_at, func.coalesce(Orders.realised_pnl, 0)),
+        user,
+        trade_details,
+    ).where(Orders.closed_at != None).order_by(Orders.closed_at, Orders.order_id)
+
+    async with get_session() as session:
+        result = await session.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+_DATE_TRUNC_FIELDS = {
+    Intervals.DAILY: 'day',
+    Intervals.WEEKLY: 'week',
+    Intervals.MONTHLY: 'month',
+    Intervals.QUARTERLY: 'quarter',
+    Intervals.YEARLY: 'year',
+}
+
+
+async def get_bucketed_pnl(
+        user: Users,
+        interval: Intervals,
+        period: PeriodRequestBody = None,
+        timezone: str = 'UTC'
+) -> List[Tuple[datetime, float]]:
+    """
+    Returns the realised pnl of closed trades summed per interval,
+    as (bucket start, pnl) pairs in chronological order.
+    closed_at is stored as naive UTC and is converted to the timezone before truncating.
+    UTC buckets are read from daily_pnl_rollup
+    """
+    field = _DATE_TRUNC_FIELDS[Intervals(interval)]
+    trade_details = TradeRequestBody(
+        close_start=period.close_start if period is not None else None,
+        close_end=period.close_end if period is not None else None,
+    )
+
+    if timezone == 'UTC' and rollup_eligible(trade_details):
+        source = closed_daily_source(user.email, trade_details)
+        bucket = func.date_trunc(field, cast(source.c.day, DateTime)).label('bucket')
+        query = select(bucket, func.coalesce(func.sum(source.c.realised_pnl), 0))
+    else:
+        local_closed_at = func.timezone(timezone, func.timezone('UTC', Orders.closed_at))
+        bucket = func.date_trunc(field, local_closed_at).label('bucket')
+        query = filter_trades(
+            select(bucket, func.coalesce(func.sum(Orders.realised_pnl), 0)),
+            user,
+            trade_details,
+        ).where(Orders.closed_at != None)
+
+    async with get_session() as session:
+        result = await session.execute(query.group_by(bucket).order_by(bucket))
+        return [(row[0], row[1]) for row in result.all()]
+
+
+def _total_columns() -> list:
+    """realised_pnl, trade_count, win_count and volume aggregated over dashboard_orders, as in the rollup"""
+    return [
+        func.coalesce(func.sum(Orders.realised_pnl), 0).label('realised_pnl'),
+        func.count().label('trade_count'),
+        func.count().filter(Orders.realised_pnl > 0).label('win_count'),
+        func.coalesce(func.sum(Orders.dollar_amount), 0).label('volume'),
+    ]
+
+
+def _raw_totals(user: Users, trade_details: Optional[TradeRequestBody], group_by: Sequence[str]) -> Select:
+    return filter_trades(
+        select(
+            *(func.coalesce(getattr(Orders, column), '').label(column) for column in group_by),
+            *_total_columns(),
+        ),
+        user,
+        trade_details,
+    ).group_by(*(column for column in group_by))
+
+
+async def get_trade_totals(
+        user: Users,
+        trade_details: TradeRequestBody = None,
+        group_by: Sequence[str] = (),
+) -> List[Row]:
+    """
+    Returns realised_pnl, trade_count, win_count and volume summed over the
+    matching trades, one row per combination of the group_by columns
+    (ticker, order_type) or a single row without group_by.
+    Closed trades are read from daily_pnl_rollup when the filters allow,
+    open trades the filters still match are added from dashboard_orders
+    """
+    if not rollup_eligible(trade_details):
+        query = _raw_totals(user, trade_details, group_by)
+    else:
+        source = closed_daily_source(user.email, trade_details)
+        parts = [
+            select(
+                *(source.c[column] for column in group_by),
+                source.c.realised_pnl,
+                source.c.trade_count,
+                source.c.win_count,
+                source.c.volume,
+            )
+        ]
+
+        includes_open = trade_details is None or (
+            trade_details.is_active is None and trade_details.close_start is None and trade_details.close_end is None
+        )
+        if includes_open:
+            parts.append(_raw_totals(user, trade_details, group_by).where(Orders.closed_at == None))
+
+        combined = union_all(*parts).subquery('totals')
+        query = select(
+            *(combined.c[column] for column in group_by),
+            func.coalesce(func.sum(combined.c.realised_pnl), 0).label('realised_pnl'),
+            cast(func.coalesce(func.sum(combined.c.trade_count), 0), BigInteger).label('trade_count'),
+            cast(func.coalesce(func.sum(combined.c.win_count), 0), BigInteger).label('win_count'),
+            func.coalesce(func.sum(combined.c.volume), 0).label('volume'),
+        ).group_by(*(combined.c[column] for column in group_by))
+
+    async with get_session() as session:
+        result = await session.execute(query)
+        return result.all()
+
+
+async def get_daily_totals(user: Users, trade_details: TradeRequestBody = None, timezone: str = 'UTC') -> List[Row]:
+    """
+    Returns (day, ticker, order_type, realised_pnl, trade_count, win_count, volume)
+    rows in one round trip:
+    - closed trades matching trade_details summed per day in timezone, ticker and
+      order type, read from daily_pnl_rollup for UTC days when the filters allow
+    - open positions on the same ticker and order type summed per ticker and
+      order type with day NULL, the period doesn't apply to them
+    """
+    trade_details = (trade_details or TradeRequestBody()).model_copy(update={'is_active': None})
+    ticker = func.coalesce(Orders.ticker, '').label('ticker')
+    order_type = func.coalesce(Orders.order_type, '').label('order_type')
+
+    if timezone == 'UTC' and rollup_eligible(trade_details):
+        source = closed_daily_source(user.email, trade_details)
+        closed = select(
+            source.c.day,
+            source.c.ticker,
+            source.c.order_type,
+            source.c.realised_pnl,
+            source.c.trade_count,
+            source.c.win_count,
+            source.c.volume,
+        )
+    else:
+        day = cast(func.timezone(timezone, func.timezone('UTC', Orders.closed_at)), Date).label('day')
+        closed = filter_trades(select(day, ticker, order_type, *_total_columns()), user, trade_details) \
+            .where(Orders.closed_at != None) \
+            .group_by(day, ticker, order_type)
+
+    open_details = TradeRequestBody(is_active=True, ticker=trade_details.ticker, order_type=trade_details.order_type)
+    open_positions = filter_trades(
+        select(cast(null(), Date).label('day'), ticker, order_type, *_total_columns()),
+        user,
+        open_details,
+    ).group_by(ticker, order_type)
+
+    async with get_session() as session:
+        result = await session.execute(union_all(closed, open_positions))
+        return result.all()
+
+
+async def get_ticker_daily_pnl(user: Users, period: PeriodRequestBody = None, timezone: str = 'UTC') -> List[Row]:
+    """
+    Returns (day, ticker, realised_pnl) rows of the user's closed trades summed
+    per day in timezone and ticker, in one grouped query. UTC days are read from
+    daily_pnl_rollup
+    """
+    trade_details = TradeRequestBody(
+        close_start=period.close_start if period is not None else None,
+        close_end=period.close_end if period is not None else None,
+    )
+
+    if timezone == 'UTC' and rollup_eligible(trade_details):
+        source = closed_daily_source(user.email, trade_details)
+        query = select(source.c.day, source.c.ticker, func.coalesce(func.sum(source.c.realised_pnl), 0)) \
+            .group_by(source.c.day, source.c.ticker)
+    else:
+        day = cast(func.timezone(timezone, func.timezone('UTC', Orders.closed_at)), Date).label('day')
+        ticker = func.coalesce(Orders.ticker, '').label('ticker')
+        query = filter_trades(select(day, ticker, func.coalesce(func.sum(Orders.realised_pnl), 0)), user, trade_details) \
+            .where(Orders.closed_at != None) \
+            .group_by(day, ticker)
+
+    async with get_session() as session:
+        result = await session.execute(query)
+        return result.all()